@@ -1,26 +1,29 @@
-import json
 import os
 import sys
-import asyncio
-from http.server import BaseHTTPRequestHandler
 
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from bot.utils.timing import cold_start
+import json
+import logging
+from http.server import BaseHTTPRequestHandler
+
 from telegram import Update
-from telegram.ext import Application
-from bot.main import setup_handlers, TELEGRAM_TOKEN
+from bot.application import get_ptb_app
+from bot.utils.loop import background_loop
+from bot.utils.log import setup_logging
 
-_app = None
+# The function may be frozen right after responding, so write records synchronously
+setup_logging(use_queue=False)
+logger = logging.getLogger(__name__)
 
-async def get_application():
-    global _app
-    if _app is None:
-        application = Application.builder().token(TELEGRAM_TOKEN).build()
-        setup_handlers(application)
-        await application.initialize()
-        _app = application
-    return _app
+
+async def process(update_data):
+    app = await get_ptb_app()
+    update = Update.de_json(update_data, app.bot)
+    await app.process_update(update)
+    cold_start.log_once()
 
 
 class handler(BaseHTTPRequestHandler):
@@ -28,7 +31,12 @@ class handler(BaseHTTPRequestHandler):
         self.send_response(200)
         self.send_header('Content-Type', 'application/json')
         self.end_headers()
-        response = {'status': 'ok', 'bot': 'BarbosaAgencyProBot', 'version': '2.0.0'}
+        response = {
+            'status': 'ok',
+            'bot': 'BarbosaAgencyProBot',
+            'version': '2.0.0',
+            'cold_start': cold_start.report()
+        }
         self.wfile.write(json.dumps(response).encode())
 
     def do_POST(self):
@@ -37,19 +45,8 @@ class handler(BaseHTTPRequestHandler):
         
         try:
             update_data = json.loads(body)
-            
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            async def process():
-                app = await get_application()
-                update = Update.de_json(update_data, app.bot)
-                await app.process_update(update)
-            
-            try:
-                loop.run_until_complete(process())
-            finally:
-                loop.close()
+            # Warm invocations reuse the loop and the Application bound to it
+            background_loop.run(process(update_data))
             
             self.send_response(200)
             self.send_header('Content-Type', 'application/json')
@@ -57,7 +54,7 @@ class handler(BaseHTTPRequestHandler):
             self.wfile.write(json.dumps({'ok': True}).encode())
             
         except Exception as e:
-            print(f'Error processing update: {e}')
+            logger.error('Error processing update: %s', e)
             self.send_response(500)
             self.send_header('Content-Type', 'application/json')
             self.end_headers()
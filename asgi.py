@@ -0,0 +1,139 @@
+# ASGI entry point - async webhook server with a bounded update queue
+# Run with: uvicorn asgi:app --host 0.0.0.0 --port $PORT
+from bot.utils.timing import cold_start
+import json
+import logging
+import time
+from datetime import datetime
+
+from telegram import Update
+
+from bot.application import get_ptb_app
+from bot.rate_limiter import rate_limiter
+from bot.router import router
+from bot.utils.config import config
+from bot.utils.log import setup_logging
+from bot.utils.metrics import CONTENT_TYPE, metrics
+from bot.utils.update_queue import UpdateQueue, chat_key
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+async def _process(update_data):
+    application = await get_ptb_app()
+    update = Update.de_json(update_data, application.bot)
+    await application.process_update(update)
+    cold_start.log_once()
+
+
+update_queue = UpdateQueue(
+    _process,
+    maxsize=config.UPDATE_QUEUE_SIZE,
+    workers=config.UPDATE_WORKERS,
+    put_timeout=config.UPDATE_ENQUEUE_TIMEOUT,
+    key=chat_key,
+)
+
+
+async def _read_body(receive) -> bytes:
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+    return body
+
+
+async def _send_json(send, status: int, payload, headers=None):
+    body = json.dumps(payload).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json')] + (headers or []),
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _send_text(send, status: int, text: str, content_type: str):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', content_type.encode())],
+    })
+    await send({'type': 'http.response.body', 'body': text.encode()})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await get_ptb_app()
+            await update_queue.start()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await update_queue.stop()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def webhook(receive, send):
+    try:
+        update_data = json.loads(await _read_body(receive))
+    except ValueError:
+        await _send_json(send, 400, {'ok': False, 'error': 'invalid json'})
+        return
+    if not await update_queue.put(update_data):
+        # Telegram redelivers on non-2xx, which is exactly the backpressure we want
+        await _send_json(send, 503, {'ok': False, 'error': 'queue full'}, [(b'retry-after', b'1')])
+        return
+    await _send_json(send, 200, {'ok': True})
+
+
+ROUTES = ('/webhook', '/health', '/metrics', '/')
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    started = time.perf_counter()
+    status = [500]
+
+    async def send_and_record(message):
+        if message['type'] == 'http.response.start':
+            status[0] = message['status']
+        await send(message)
+
+    try:
+        await _route(scope, receive, send_and_record)
+    finally:
+        path = scope['path']
+        metrics.observe(
+            'http_request_seconds', time.perf_counter() - started,
+            route=path if path in ROUTES else 'other', method=scope['method'], status=status[0]
+        )
+
+
+async def _route(scope, receive, send):
+    path, method = scope['path'], scope['method']
+    if path == '/webhook' and method == 'POST':
+        await webhook(receive, send)
+    elif path == '/health' and method == 'GET':
+        await _send_json(send, 200, {
+            'status': 'healthy',
+            'timestamp': datetime.utcnow().isoformat(),
+            'queue': update_queue.stats(),
+            'callbacks': router.snapshot(),
+            'outbound': rate_limiter.stats(),
+        })
+    elif path == '/metrics' and method == 'GET':
+        await _send_text(send, 200, metrics.render(), CONTENT_TYPE)
+    elif path == '/' and method == 'GET':
+        await _send_json(send, 200, {'status': 'ok', 'bot': 'Barbosa Agency Pro Bot'})
+    else:
+        await _send_json(send, 404, {'ok': False, 'error': 'not found'})
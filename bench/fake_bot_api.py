@@ -0,0 +1,106 @@
+"""Minimal stand-in for api.telegram.org used by the webhook benchmarks.
+
+Answers every ``/bot<token>/<method>`` call with a plausible result, can add
+artificial latency, and counts calls per method.
+"""
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class FakeBotAPI:
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency_ms: float = 0.0):
+        self.latency = latency_ms / 1000
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/bot'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def record(self, method: str):
+        with self._lock:
+            self.calls[method] += 1
+
+    def _handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                method = self.path.rsplit('/', 1)[-1]
+                api.record(method)
+                if api.latency:
+                    time.sleep(api.latency)
+                payload = json.dumps({'ok': True, 'result': _result(method, _params(self.headers, body))})
+                data = payload.encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def _params(headers, body: bytes) -> dict:
+    if not body:
+        return {}
+    if 'json' in headers.get('Content-Type', ''):
+        return json.loads(body)
+    return {key: values[0] for key, values in parse_qs(body.decode()).items()}
+
+
+def _result(method: str, params: dict):
+    if method == 'getMe':
+        return {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+    if method in ('sendMessage', 'editMessageText'):
+        try:
+            chat_id = int(params.get('chat_id', 1))
+        except (TypeError, ValueError):
+            chat_id = 1
+        return {
+            'message_id': int(params.get('message_id', 1) or 1),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'text': params.get('text', ''),
+        }
+    return True
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    args = parser.parse_args()
+    api = FakeBotAPI(port=args.port, latency_ms=args.latency_ms).start()
+    print(f'Fake Bot API on {api.base_url}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        api.stop()
@@ -0,0 +1,197 @@
+"""Stand-in for the Stripe and MercadoPago APIs the bot calls over httpx.
+
+Serves ``count`` synthetic subscriptions, charges and payments computed from
+their index, so any size costs no memory:
+
+    GET /v1/subscriptions?limit=&starting_after=      (newest first, like Stripe)
+    GET /v1/charges?limit=&starting_after=
+    GET /v1/payments/search?begin_date=&offset=&limit= (oldest first, like MercadoPago)
+    GET /v1/payments/<id>                              (MercadoPago, 10000000 + index)
+
+and answers the checkout calls (bot.services.gateway_client) with fixed ids:
+
+    POST /v1/customers            POST /v1/checkout/sessions
+    POST /checkout/preferences
+
+Record ``i`` belongs to user ``i % users + 1``; Stripe customers are
+``cus_<user id>``.
+"""
+import json
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+PERIOD = 30 * 24 * 3600
+MP_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.000-00:00'
+SUBSCRIPTION_STATUSES = ('active', 'active', 'active', 'past_due', 'canceled')
+
+
+class FakeGatewayAPI:
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, count: int = 1000, users: int = 100):
+        self.count = count
+        self.users = users
+        # Records are dated from here, one second apart, so they fall in the reconcile lookback
+        self.epoch = datetime.utcnow().replace(microsecond=0) - timedelta(days=30)
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def record(self, path: str):
+        with self._lock:
+            self.calls[path] += 1
+
+    def user_id(self, index: int) -> int:
+        return index % self.users + 1
+
+    def subscription(self, index: int) -> dict:
+        return {
+            'id': f'sub_{index:08d}',
+            'object': 'subscription',
+            'customer': f'cus_{self.user_id(index)}',
+            'status': SUBSCRIPTION_STATUSES[index % len(SUBSCRIPTION_STATUSES)],
+            'current_period_end': int(self.epoch.timestamp()) + PERIOD + index,
+            'cancel_at_period_end': index % 6 == 0,
+            'metadata': {'user_id': str(self.user_id(index)), 'tier': 'pro'},
+        }
+
+    def charge(self, index: int) -> dict:
+        return {
+            'id': f'ch_{index:08d}',
+            'object': 'charge',
+            'payment_intent': f'pi_{index:08d}',
+            'customer': f'cus_{self.user_id(index)}',
+            'amount': 2900,
+            'currency': 'usd',
+            'status': 'failed' if index % 20 == 0 else 'succeeded',
+            'refunded': index % 50 == 1,
+            'invoice': f'in_{index:08d}',
+            'metadata': {},
+        }
+
+    def payment(self, index: int) -> dict:
+        return {
+            'id': 10_000_000 + index,
+            'status': 'pending' if index % 10 == 0 else 'approved',
+            'external_reference': f'{self.user_id(index)}|pro',
+            'date_created': (self.epoch + timedelta(seconds=index)).strftime(MP_DATE_FORMAT),
+            'transaction_details': {'total_paid_amount': 29.0},
+        }
+
+    def stripe_list(self, make, prefix: str, params: dict) -> dict:
+        limit = min(int(params.get('limit', 10)), 100)
+        after = params.get('starting_after')
+        start = int(after[len(prefix):]) - 1 if after else self.count
+        indexes = range(start, max(start - limit, 0), -1)
+        return {
+            'object': 'list',
+            'data': [make(index) for index in indexes],
+            'has_more': start - limit > 0,
+        }
+
+    def mp_search(self, params: dict) -> dict:
+        limit = int(params.get('limit', 30))
+        offset = int(params.get('offset', 0))
+        first = 1
+        if params.get('begin_date'):
+            begin = datetime.strptime(params['begin_date'][:19], '%Y-%m-%dT%H:%M:%S')
+            first = max(1, int((begin - self.epoch).total_seconds()))
+        start = first + offset
+        indexes = range(start, min(start + limit, self.count + 1))
+        return {
+            'paging': {'total': max(self.count + 1 - first, 0), 'limit': limit, 'offset': offset},
+            'results': [self.payment(index) for index in indexes],
+        }
+
+    def _handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {key: values[0] for key, values in parse_qs(url.query).items()}
+                api.record(url.path)
+                if url.path == '/v1/subscriptions':
+                    status, payload = 200, api.stripe_list(api.subscription, 'sub_', params)
+                elif url.path == '/v1/charges':
+                    status, payload = 200, api.stripe_list(api.charge, 'ch_', params)
+                elif url.path == '/v1/payments/search':
+                    status, payload = 200, api.mp_search(params)
+                elif url.path.startswith('/v1/payments/') and url.path.rsplit('/', 1)[1].isdigit():
+                    index = int(url.path.rsplit('/', 1)[1]) - 10_000_000
+                    if 0 < index <= api.count:
+                        status, payload = 200, api.payment(index)
+                    else:
+                        status, payload = 404, {'message': 'not_found'}
+                else:
+                    status, payload = 404, {'error': 'not_found'}
+                self._reply(status, payload)
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                api.record(url.path)
+                calls = api.calls[url.path]
+                if url.path == '/v1/customers':
+                    status, payload = 200, {'id': f'cus_fake{calls}', 'object': 'customer'}
+                elif url.path == '/v1/checkout/sessions':
+                    status, payload = 200, {
+                        'id': f'cs_fake{calls}', 'object': 'checkout.session',
+                        'url': f'{api.base_url}/pay/cs_fake{calls}',
+                    }
+                elif url.path == '/checkout/preferences':
+                    preference = json.loads(body or b'{}')
+                    status, payload = 201, {
+                        'id': f'pref-{calls}', 'init_point': f'{api.base_url}/mp/pref-{calls}',
+                        'external_reference': preference.get('external_reference'),
+                    }
+                else:
+                    status, payload = 404, {'error': 'not_found'}
+                self._reply(status, payload)
+
+            def _reply(self, status: int, payload: dict):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=12111)
+    parser.add_argument('--count', type=int, default=1000)
+    parser.add_argument('--users', type=int, default=100)
+    args = parser.parse_args()
+    api = FakeGatewayAPI(port=args.port, count=args.count, users=args.users).start()
+    print(f'Fake gateway API on {api.base_url} ({args.count} records per list)')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        api.stop()
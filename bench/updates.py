@@ -0,0 +1,67 @@
+"""Synthetic Telegram updates for the benchmark mix."""
+import itertools
+import time
+
+_update_ids = itertools.count(1)
+
+# kind -> weight in the default mix
+DEFAULT_MIX = {
+    'start': 2,
+    'view_plans': 3,
+    'financing_menu': 3,
+    'buy_pro': 1,
+    'dscr_calc': 1,
+}
+
+
+def _user(user_id: int) -> dict:
+    return {'id': user_id, 'is_bot': False, 'first_name': 'Bench', 'language_code': 'es'}
+
+
+def _message(chat_id: int, text: str, from_bot: bool = False) -> dict:
+    message = {
+        'message_id': next(_update_ids),
+        'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': 'private'},
+        'from': {'id': 1, 'is_bot': True, 'first_name': 'Bench'} if from_bot else _user(chat_id),
+        'text': text,
+    }
+    if text.startswith('/'):
+        command = text.split()[0]
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+    return message
+
+
+def command(chat_id: int, text: str) -> dict:
+    return {'update_id': next(_update_ids), 'message': _message(chat_id, text)}
+
+
+def callback(chat_id: int, data: str) -> dict:
+    update_id = next(_update_ids)
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': _user(chat_id),
+            'chat_instance': str(chat_id),
+            'data': data,
+            'message': _message(chat_id, 'menu', from_bot=True),
+        },
+    }
+
+
+def build(kind: str, chat_id: int) -> dict:
+    if kind == 'start':
+        return command(chat_id, '/start')
+    if kind == 'dscr_calc':
+        return command(chat_id, '/dscr_calc 300000 1800 2200')
+    return callback(chat_id, kind)
+
+
+def mix(total: int, weights: dict = None, chats: int = 500):
+    """Deterministic round-robin over ``weights`` spread across ``chats`` chat ids."""
+    weights = weights or DEFAULT_MIX
+    pattern = [kind for kind, weight in weights.items() for _ in range(weight)]
+    for i in range(total):
+        kind = pattern[i % len(pattern)]
+        yield kind, build(kind, 100000 + i % chats)
@@ -0,0 +1,193 @@
+"""Throughput/latency benchmark for the Telegram webhook entry points.
+
+Starts a fake Bot API, boots the chosen entry point against it for each
+worker/thread configuration, replays a synthetic update mix and reports
+throughput plus p50/p95/p99 latency overall and per update kind.
+
+    python -m bench.webhook_bench --target flask --configs 2x4,4x4 --requests 2000
+    python -m bench.webhook_bench --target serverless --concurrency 8
+    python -m bench.webhook_bench --url http://127.0.0.1:8080/webhook
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+from bench import updates
+from bench.fake_bot_api import FakeBotAPI
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _server_command(target: str, port: int, workers: int, threads: int) -> List[str]:
+    if target == 'flask':
+        return ['gunicorn', 'bot.main:app', '--bind', f'127.0.0.1:{port}',
+                '--workers', str(workers), '--threads', str(threads), '--log-level', 'warning']
+    if target == 'asgi':
+        return ['uvicorn', 'asgi:app', '--port', str(port), '--workers', str(workers),
+                '--log-level', 'warning']
+    if target == 'serverless':
+        return [sys.executable, '-c',
+                'from http.server import ThreadingHTTPServer; from api.webhook import handler; '
+                f'ThreadingHTTPServer(("127.0.0.1", {port}), handler).serve_forever()']
+    raise ValueError(f'Unknown target {target}')
+
+
+def _wait_ready(port: int, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'Server on port {port} did not start')
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _summary(latencies: List[float]) -> Dict:
+    values = sorted(latencies)
+    return {
+        'count': len(values),
+        'p50_ms': round(_percentile(values, 50) * 1000, 2),
+        'p95_ms': round(_percentile(values, 95) * 1000, 2),
+        'p99_ms': round(_percentile(values, 99) * 1000, 2),
+        'max_ms': round(values[-1] * 1000, 2) if values else 0.0,
+    }
+
+
+def replay(url: str, total: int, concurrency: int, warmup: int = 20) -> Dict:
+    parsed = urlparse(url)
+    path = parsed.path or '/'
+    local = threading.local()
+
+    def send(body: bytes):
+        conn = getattr(local, 'conn', None)
+        if conn is None:
+            conn = local.conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=60)
+        started = time.perf_counter()
+        conn.request('POST', path, body, {'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        response.read()
+        return time.perf_counter() - started, response.status
+
+    payloads = [(kind, json.dumps(update).encode()) for kind, update in updates.mix(total + warmup)]
+    with ThreadPoolExecutor(concurrency) as pool:
+        # Warm-up pays the Application initialization outside the measurement
+        list(pool.map(lambda item: send(item[1]), payloads[:warmup]))
+
+        per_kind = defaultdict(list)
+        errors = 0
+        started = time.perf_counter()
+        for (kind, _), (latency, status) in zip(
+            payloads[warmup:], pool.map(lambda item: send(item[1]), payloads[warmup:])
+        ):
+            per_kind[kind].append(latency)
+            errors += status >= 400
+        elapsed = time.perf_counter() - started
+
+    all_latencies = [latency for values in per_kind.values() for latency in values]
+    return {
+        'requests': total,
+        'concurrency': concurrency,
+        'errors': errors,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(total / elapsed, 1) if elapsed else 0.0,
+        'latency': _summary(all_latencies),
+        'per_kind': {kind: _summary(values) for kind, values in sorted(per_kind.items())},
+    }
+
+
+def run_config(target: str, workers: int, threads: int, args, api: FakeBotAPI) -> Dict:
+    port = _free_port()
+    env = dict(
+        os.environ,
+        TELEGRAM_TOKEN='123456:BENCH',
+        TELEGRAM_API_BASE=api.base_url,
+        PYTHONPATH=ROOT,
+        # Early ack would time only the enqueue, not the work a dyno has to absorb
+        WEBHOOK_EARLY_ACK='true' if args.early_ack else 'false',
+    )
+    server = subprocess.Popen(_server_command(target, port, workers, threads), cwd=ROOT, env=env)
+    try:
+        _wait_ready(port)
+        api.calls.clear()
+        path = '/' if target == 'serverless' else '/webhook'
+        result = replay(f'http://127.0.0.1:{port}{path}', args.requests, args.concurrency)
+        result['bot_api_calls'] = dict(api.calls)
+        return result
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def _print(label: str, result: Dict):
+    latency = result['latency']
+    print(f'\n== {label}: {result["throughput_rps"]} req/s, {result["errors"]} errors, '
+          f'p50 {latency["p50_ms"]} ms, p95 {latency["p95_ms"]} ms, p99 {latency["p99_ms"]} ms')
+    for kind, stats in result['per_kind'].items():
+        print(f'   {kind:16} n={stats["count"]:<6} p50 {stats["p50_ms"]:>8} ms  '
+              f'p95 {stats["p95_ms"]:>8} ms  p99 {stats["p99_ms"]:>8} ms')
+    if result.get('bot_api_calls'):
+        print(f'   Bot API calls: {result["bot_api_calls"]}')
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', choices=('flask', 'asgi', 'serverless'), default='flask')
+    parser.add_argument('--configs', default='2x4', help='workers x threads, comma separated')
+    parser.add_argument('--url', help='benchmark an already running webhook URL instead')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--api-latency-ms', type=float, default=0.0,
+                        help='artificial Bot API latency, e.g. 30 to mimic api.telegram.org')
+    parser.add_argument('--early-ack', action='store_true',
+                        help='flask: answer before processing (measures enqueue latency only)')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args(argv)
+
+    results = {}
+    if args.url:
+        results[args.url] = replay(args.url, args.requests, args.concurrency)
+        _print(args.url, results[args.url])
+    else:
+        api = FakeBotAPI(latency_ms=args.api_latency_ms).start()
+        try:
+            for config in args.configs.split(','):
+                workers, _, threads = config.partition('x')
+                label = f'{args.target} {config}'
+                results[label] = run_config(args.target, int(workers), int(threads or 1), args, api)
+                _print(label, results[label])
+        finally:
+            api.stop()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+# Analytics: DSCR/loan portfolio math
@@ -0,0 +1,160 @@
+import csv
+import io
+from typing import Dict, Iterable, List, Mapping, Optional
+
+import numpy as np
+
+# DSCR thresholds used by /dscr_calc as well
+EXCELLENT_DSCR = 1.25
+GOOD_DSCR = 1.0
+
+# Accepted column names (CSV headers / JSON keys) -> canonical field
+ALIASES = {
+    'name': 'name', 'nombre': 'name', 'propiedad': 'name', 'address': 'name',
+    'value': 'value', 'valor': 'value', 'price': 'value', 'precio': 'value',
+    'loan_amount': 'loan_amount', 'loan': 'loan_amount', 'prestamo': 'loan_amount',
+    'rate': 'rate', 'tasa': 'rate', 'interest_rate': 'rate',
+    'term_years': 'term_years', 'term': 'term_years', 'plazo': 'term_years',
+    'payment': 'payment', 'pago': 'payment',
+    'rent': 'rent', 'renta': 'rent',
+    'expenses': 'expenses', 'gastos': 'expenses',
+    'closing_costs': 'closing_costs', 'cierre': 'closing_costs',
+}
+NUMERIC_FIELDS = ('value', 'loan_amount', 'rate', 'term_years', 'payment', 'rent', 'expenses', 'closing_costs')
+DEFAULT_TERM_YEARS = 30.0
+
+
+class TooManyRows(ValueError):
+    """Input has more than ``max_rows`` properties; raised before the rest is read."""
+
+    def __init__(self, max_rows: int):
+        super().__init__(f'max {max_rows} properties')
+        self.max_rows = max_rows
+
+
+def monthly_payment(principal: np.ndarray, annual_rate_pct: np.ndarray, term_years: np.ndarray) -> np.ndarray:
+    """Fixed-rate amortizing P&I payment; rates are annual percentages (7.5 = 7.5%)."""
+    principal = np.asarray(principal, dtype=float)
+    r = np.asarray(annual_rate_pct, dtype=float) / 1200.0
+    n = np.asarray(term_years, dtype=float) * 12.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        amortized = principal * r / (1.0 - np.power(1.0 + r, -n))
+        interest_free = principal / n
+    return np.where(r > 0, amortized, interest_free)
+
+
+def _columns(records: Iterable[Mapping], max_rows: Optional[int] = None) -> Dict[str, list]:
+    columns = {field: [] for field in ('name',) + NUMERIC_FIELDS}
+    for index, record in enumerate(records):
+        if max_rows is not None and index >= max_rows:
+            raise TooManyRows(max_rows)
+        row = {}
+        for key, value in record.items():
+            field = ALIASES.get(str(key).strip().lower())
+            if field:
+                row[field] = value
+        columns['name'].append(str(row.get('name') or f'#{index + 1}'))
+        for field in NUMERIC_FIELDS:
+            raw = row.get(field)
+            if isinstance(raw, str):
+                raw = raw.replace('$', '').replace(',', '').replace('%', '').strip()
+            columns[field].append(float(raw) if raw not in (None, '') else np.nan)
+    return columns
+
+
+def parse_csv(text: str, max_rows: Optional[int] = None) -> Dict[str, list]:
+    return _columns(csv.DictReader(io.StringIO(text)), max_rows)
+
+
+def from_records(records: Iterable[Mapping], max_rows: Optional[int] = None) -> Dict[str, list]:
+    return _columns(records, max_rows)
+
+
+class PortfolioAnalysis:
+    """DSCR, P&I, cap rate and cash-on-cash for every property at once.
+
+    Rent, expenses and payment are monthly; NOI-based DSCR equals
+    ``rent / payment`` (the /dscr_calc formula) when no expenses are given.
+    A row with an explicit ``payment`` uses it instead of amortizing the loan.
+    """
+
+    def __init__(self, columns: Dict[str, list]):
+        self.names = np.asarray(columns['name'], dtype=object)
+        value = np.asarray(columns['value'], dtype=float)
+        loan = np.asarray(columns['loan_amount'], dtype=float)
+        rate = np.nan_to_num(np.asarray(columns['rate'], dtype=float))
+        term = np.asarray(columns['term_years'], dtype=float)
+        term = np.where(np.isnan(term) | (term <= 0), DEFAULT_TERM_YEARS, term)
+        payment = np.asarray(columns['payment'], dtype=float)
+        rent = np.nan_to_num(np.asarray(columns['rent'], dtype=float))
+        expenses = np.nan_to_num(np.asarray(columns['expenses'], dtype=float))
+        closing = np.nan_to_num(np.asarray(columns['closing_costs'], dtype=float))
+
+        loan = np.nan_to_num(loan)
+        computed = monthly_payment(loan, rate, term)
+        self.value = value
+        self.loan_amount = loan
+        self.payment = np.where(np.isnan(payment), computed, payment)
+        self.noi = (rent - expenses) * 12.0
+        self.debt_service = self.payment * 12.0
+        self.cash_invested = np.nan_to_num(value) - loan + closing
+
+        # DSCR is undefined without debt service; such rows are not the best in the portfolio
+        self.no_debt = ~(self.debt_service > 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.dscr = np.where(self.no_debt, np.nan, self.noi / self.debt_service)
+            self.cap_rate = np.where(value > 0, self.noi / value, np.nan)
+            self.cash_flow = self.noi - self.debt_service
+            self.cash_on_cash = np.where(self.cash_invested > 0, self.cash_flow / self.cash_invested, np.nan)
+
+        self.status = np.select(
+            [self.no_debt, self.dscr >= EXCELLENT_DSCR, self.dscr >= GOOD_DSCR],
+            ['SIN DEUDA', 'EXCELENTE', 'BUENO'],
+            default='NO CALIFICA'
+        )
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def summary(self) -> Dict:
+        total_debt = float(np.nansum(self.debt_service))
+        total_noi = float(np.nansum(self.noi))
+        statuses, counts = np.unique(self.status, return_counts=True)
+        return {
+            'properties': len(self),
+            'total_value': round(float(np.nansum(self.value)), 2),
+            'total_loan': round(float(np.nansum(self.loan_amount)), 2),
+            'annual_noi': round(total_noi, 2),
+            'annual_debt_service': round(total_debt, 2),
+            'portfolio_dscr': round(total_noi / total_debt, 3) if total_debt else None,
+            'avg_cap_rate': _round(np.nanmean(self.cap_rate)) if len(self) else None,
+            'avg_cash_on_cash': _round(np.nanmean(self.cash_on_cash)) if len(self) else None,
+            'by_status': {str(status): int(count) for status, count in zip(statuses, counts)},
+        }
+
+    def ranked(self, limit: int = None) -> List[Dict]:
+        # Highest DSCR first; rows without debt service (NaN DSCR) go last
+        order = np.lexsort((-np.nan_to_num(self.dscr, nan=-np.inf), self.no_debt))
+        if limit is not None:
+            order = order[:limit]
+        return [
+            {
+                'name': self.names[i],
+                'dscr': _round(self.dscr[i]),
+                'status': str(self.status[i]),
+                'monthly_payment': _round(self.payment[i], 2),
+                'cap_rate': _round(self.cap_rate[i]),
+                'cash_on_cash': _round(self.cash_on_cash[i]),
+                'annual_cash_flow': _round(self.cash_flow[i], 2),
+            }
+            for i in order
+        ]
+
+
+def _round(value, digits: int = 4):
+    value = float(value)
+    return None if np.isnan(value) or np.isinf(value) else round(value, digits)
+
+
+def analyze(columns: Dict[str, list]) -> PortfolioAnalysis:
+    return PortfolioAnalysis(columns)
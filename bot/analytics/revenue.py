@@ -0,0 +1,226 @@
+"""Revenue/subscription rollups: incremental maintenance from webhooks and the admin report.
+
+    python -m bot.analytics.revenue --rebuild   # recompute rollups from payments/subscriptions
+"""
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import func
+
+from bot.models.base import db_session, dialect_insert
+from bot.models.payment import Payment
+from bot.models.rollup import DailyRevenue, DailySubscriptions
+from bot.models.subscription import Subscription
+
+ZERO = Decimal('0')
+
+# DailySubscriptions counters, in order
+SUBSCRIPTION_FIELDS = ('new', 'cancelled', 'past_due', 'mrr_added', 'mrr_lost')
+
+
+def _money(value) -> Decimal:
+    return Decimal(str(value or 0)).quantize(Decimal('0.01'))
+
+
+class RollupDeltas:
+    """Rollup increments staged by one webhook batch.
+
+    Handlers add deltas as they apply events; ``flush()`` writes one upsert
+    per touched rollup row right before the batch commits, in key order so
+    concurrent workers lock rows consistently.
+    """
+
+    def __init__(self):
+        self.revenue: Dict[tuple, Tuple[int, Decimal]] = {}
+        self.subscriptions: Dict[tuple, Tuple] = {}
+
+    def payment(self, payment: Payment, refunded: bool = False):
+        """``refunded`` takes an already counted payment back out."""
+        key = (datetime.utcnow().date(), payment.gateway, payment.product_tier or 'unknown',
+               (payment.currency or 'USD').upper())
+        count, amount = self.revenue.get(key, (0, ZERO))
+        sign = -1 if refunded else 1
+        self.revenue[key] = (count + sign, amount + sign * _money(payment.amount))
+
+    def subscription(self, subscription: Subscription, movement: str):
+        """``movement`` is 'new', 'cancelled' or 'past_due'."""
+        key = (datetime.utcnow().date(), subscription.gateway, subscription.tier,
+               (subscription.currency or 'USD').upper())
+        new, cancelled, past_due, added, lost = self.subscriptions.get(key, (0, 0, 0, ZERO, ZERO))
+        amount = _money(subscription.amount)
+        if movement == 'new':
+            new, added = new + 1, added + amount
+        elif movement == 'cancelled':
+            cancelled, lost = cancelled + 1, lost + amount
+        elif movement == 'past_due':
+            past_due += 1
+        self.subscriptions[key] = (new, cancelled, past_due, added, lost)
+
+    def snapshot(self) -> Tuple[dict, dict]:
+        return dict(self.revenue), dict(self.subscriptions)
+
+    def restore(self, snapshot: Tuple[dict, dict]):
+        self.revenue, self.subscriptions = (dict(part) for part in snapshot)
+
+    def flush(self):
+        if not self.revenue and not self.subscriptions:
+            return
+        insert = dialect_insert()
+        for (day, gateway, tier, currency), (count, amount) in sorted(self.revenue.items()):
+            statement = insert(DailyRevenue).values(
+                day=day, gateway=gateway, tier=tier, currency=currency, payments=count, amount=amount
+            )
+            db_session.execute(statement.on_conflict_do_update(
+                index_elements=['day', 'gateway', 'tier', 'currency'],
+                set_={
+                    'payments': DailyRevenue.payments + statement.excluded.payments,
+                    'amount': DailyRevenue.amount + statement.excluded.amount,
+                }
+            ))
+        for (day, gateway, tier, currency), values in sorted(self.subscriptions.items()):
+            counters = dict(zip(SUBSCRIPTION_FIELDS, values))
+            statement = insert(DailySubscriptions).values(
+                day=day, gateway=gateway, tier=tier, currency=currency, **counters
+            )
+            db_session.execute(statement.on_conflict_do_update(
+                index_elements=['day', 'gateway', 'tier', 'currency'],
+                set_={
+                    field: getattr(DailySubscriptions, field) + getattr(statement.excluded, field)
+                    for field in SUBSCRIPTION_FIELDS
+                }
+            ))
+        self.revenue, self.subscriptions = {}, {}
+
+
+def summary(days: int = 30, today: Optional[date] = None) -> Dict:
+    """MRR, active subscriptions, revenue and churn over the last ``days`` days.
+
+    Only reads the rollup tables, so the cost does not depend on how many
+    payments have ever been recorded.
+    """
+    since = (today or datetime.utcnow().date()) - timedelta(days=days)
+
+    mrr = {}
+    active = 0
+    rows = db_session.query(
+        DailySubscriptions.tier,
+        DailySubscriptions.currency,
+        func.sum(DailySubscriptions.mrr_added - DailySubscriptions.mrr_lost),
+        func.sum(DailySubscriptions.new - DailySubscriptions.cancelled),
+    ).group_by(DailySubscriptions.tier, DailySubscriptions.currency).all()
+    for tier, currency, amount, count in rows:
+        mrr.setdefault(currency, {})[tier] = _money(amount)
+        active += int(count or 0)
+
+    new, cancelled, past_due = db_session.query(
+        func.coalesce(func.sum(DailySubscriptions.new), 0),
+        func.coalesce(func.sum(DailySubscriptions.cancelled), 0),
+        func.coalesce(func.sum(DailySubscriptions.past_due), 0),
+    ).filter(DailySubscriptions.day > since).one()
+
+    revenue = {}
+    rows = db_session.query(
+        DailyRevenue.gateway,
+        DailyRevenue.currency,
+        func.sum(DailyRevenue.payments),
+        func.sum(DailyRevenue.amount),
+    ).filter(DailyRevenue.day > since).group_by(DailyRevenue.gateway, DailyRevenue.currency).all()
+    for gateway, currency, count, amount in rows:
+        revenue.setdefault(currency, {})[gateway] = {'payments': int(count or 0), 'amount': _money(amount)}
+    db_session.commit()
+
+    # Churn against the subscriptions active when the period started
+    starting = active - int(new) + int(cancelled)
+    return {
+        'days': days,
+        'mrr': mrr,
+        'active': active,
+        'new': int(new),
+        'cancelled': int(cancelled),
+        'past_due': int(past_due),
+        'churn_rate': round(int(cancelled) / starting, 4) if starting > 0 else 0.0,
+        'revenue': revenue,
+    }
+
+
+def rebuild():
+    """Recompute both rollups from the source tables (first deploy or after a fix).
+
+    History is approximated from what the rows still hold: a cancellation is
+    dated by the subscription's ``updated_at``, and only current past-due
+    subscriptions are counted.
+    """
+    day = func.date(Payment.created_at)
+    revenue_rows = db_session.query(
+        day, Payment.gateway, Payment.product_tier, Payment.currency,
+        func.count(Payment.id), func.sum(Payment.amount)
+    ).filter(Payment.status == 'completed').group_by(
+        day, Payment.gateway, Payment.product_tier, Payment.currency
+    ).all()
+
+    revenue: Dict[tuple, list] = {}
+    for row_day, gateway, tier, currency, count, amount in revenue_rows:
+        key = (_as_date(row_day), gateway, tier or 'unknown', (currency or 'USD').upper())
+        totals = revenue.setdefault(key, [0, ZERO])
+        totals[0] += int(count)
+        totals[1] += _money(amount)
+
+    movements: Dict[tuple, list] = {}
+
+    def add(row_day, gateway, tier, currency, field, count, amount=None):
+        key = (_as_date(row_day), gateway, tier, (currency or 'USD').upper())
+        counters = movements.setdefault(key, [0, 0, 0, ZERO, ZERO])
+        counters[SUBSCRIPTION_FIELDS.index(field)] += int(count)
+        if amount is not None:
+            money_field = 'mrr_added' if field == 'new' else 'mrr_lost'
+            counters[SUBSCRIPTION_FIELDS.index(money_field)] += _money(amount)
+
+    created = func.date(Subscription.created_at)
+    for row in db_session.query(
+        created, Subscription.gateway, Subscription.tier, Subscription.currency,
+        func.count(Subscription.id), func.sum(Subscription.amount)
+    ).group_by(created, Subscription.gateway, Subscription.tier, Subscription.currency):
+        add(*row[:4], 'new', row[4], row[5])
+
+    updated = func.date(Subscription.updated_at)
+    # Subscriptions the expiry sweeper closed count as cancellations
+    for statuses, field in ((('canceled', 'expired'), 'cancelled'), (('past_due',), 'past_due')):
+        for row in db_session.query(
+            updated, Subscription.gateway, Subscription.tier, Subscription.currency,
+            func.count(Subscription.id), func.sum(Subscription.amount)
+        ).filter(Subscription.status.in_(statuses)).group_by(
+            updated, Subscription.gateway, Subscription.tier, Subscription.currency
+        ):
+            add(*row[:4], field, row[4], row[5] if field == 'cancelled' else None)
+
+    db_session.query(DailyRevenue).delete()
+    db_session.query(DailySubscriptions).delete()
+    for (row_day, gateway, tier, currency), (count, amount) in revenue.items():
+        db_session.add(DailyRevenue(
+            day=row_day, gateway=gateway, tier=tier, currency=currency, payments=count, amount=amount
+        ))
+    for (row_day, gateway, tier, currency), counters in movements.items():
+        db_session.add(DailySubscriptions(
+            day=row_day, gateway=gateway, tier=tier, currency=currency,
+            **dict(zip(SUBSCRIPTION_FIELDS, counters))
+        ))
+    db_session.commit()
+    return len(revenue), len(movements)
+
+
+def _as_date(value) -> date:
+    # func.date() comes back as a string on SQLite
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rebuild', action='store_true')
+    parser.add_argument('--days', type=int, default=30)
+    args = parser.parse_args()
+    if args.rebuild:
+        print('Rollup rows rebuilt: revenue=%d subscriptions=%d' % rebuild())
+    print(json.dumps(summary(args.days), indent=2, default=str))
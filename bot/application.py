@@ -0,0 +1,40 @@
+import asyncio
+
+from bot.utils.timing import cold_start
+from telegram.ext import Application
+from bot.handlers import setup_handlers
+from bot.rate_limiter import rate_limiter
+from bot.utils.config import config
+
+cold_start.mark('imports')
+
+# Telegram app global, shared by the Flask, ASGI and serverless entry points
+ptb_app = None
+_ptb_lock = None
+
+
+def build_application() -> Application:
+    application = (
+        Application.builder()
+        .token(config.TELEGRAM_TOKEN)
+        .base_url(config.TELEGRAM_API_BASE)
+        .rate_limiter(rate_limiter)
+        .build()
+    )
+    setup_handlers(application)
+    return application
+
+
+async def get_ptb_app() -> Application:
+    global ptb_app, _ptb_lock
+    if ptb_app is None:
+        # Only ever awaited from one event loop per process, so the lock binds there
+        if _ptb_lock is None:
+            _ptb_lock = asyncio.Lock()
+        async with _ptb_lock:
+            if ptb_app is None:
+                application = build_application()
+                await application.initialize()
+                cold_start.mark('application_initialized')
+                ptb_app = application
+    return ptb_app
@@ -0,0 +1,337 @@
+import asyncio
+import functools
+import logging
+import time
+from typing import NamedTuple
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.helpers import escape_markdown
+from telegram.ext import (
+    CommandHandler,
+    CallbackQueryHandler,
+    MessageHandler,
+    filters,
+    ContextTypes
+)
+from bot.menus import menus, TIERS
+from bot.router import router
+from bot.utils.config import config
+from bot.utils.log import log_update
+from bot.utils.metrics import metrics
+from bot.utils.sessions import SessionStore
+
+logger = logging.getLogger(__name__)
+
+# Handlers import payment services, SDKs and models inside the function that
+# needs them, so answering menus never pays for stripe/mercadopago/SQLAlchemy.
+
+
+class DSCRSession(NamedTuple):
+    step: int
+    value: float = None
+    payment: float = None
+
+
+# Half-finished /dscr calculations, one small tuple per user
+dscr_sessions = SessionStore('dscr', DSCRSession, config.SESSION_TTL, config.SESSION_MAX)
+
+
+def is_admin(user_id: int) -> bool:
+    return user_id in config.ADMIN_USER_IDS
+
+def _locale(query) -> str:
+    return query.from_user.language_code
+
+@router.route('back_main')
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    screen = menus.get('start', user.language_code, admin=is_admin(user.id))
+    payload = screen.format(name=user.first_name)
+    if update.message:
+        await update.message.reply_text(**payload)
+    else:
+        await update.callback_query.edit_message_text(**payload)
+
+async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    await router.dispatch(update, context)
+
+@router.route('view_plans')
+async def show_plans(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.edit_message_text(**menus.get('view_plans', _locale(query)).kwargs)
+
+@router.route('financing_menu')
+async def show_financing_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.edit_message_text(**menus.get('financing_menu', _locale(query)).kwargs)
+
+@router.route('financing_agent')
+async def show_agent_loan(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.edit_message_text(**menus.get('financing_agent', _locale(query)).kwargs)
+
+@router.route('financing_dscr')
+async def show_dscr_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await dscr_sessions.aset(query.from_user.id, DSCRSession(step=1))
+    await query.edit_message_text(**menus.get('financing_dscr', _locale(query)).kwargs)
+
+@router.route('financing_seller')
+async def show_seller_financing(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.edit_message_text(**menus.get('financing_seller', _locale(query)).kwargs)
+
+@router.route('my_account')
+async def show_account(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    from bot.services.entitlements import entitlements
+    query = update.callback_query
+    entitlement = await asyncio.to_thread(entitlements.get, query.from_user.id)
+    text = (
+        f'*Mi Cuenta*\n*Plan:* {escape_markdown(entitlement.tier.upper())}'
+        f'\n*Estado:* {escape_markdown(entitlement.status)}'
+    )
+    if entitlement.expires_at:
+        text += f"\n*Vence:* {entitlement.expires_at.strftime('%Y-%m-%d')}"
+    await query.edit_message_text(**menus.get('my_account', _locale(query)).with_text(text))
+
+@router.route('admin')
+async def show_admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    if not is_admin(query.from_user.id):
+        await unknown_callback(update, context)
+        return
+    await query.edit_message_text(**menus.get('admin', _locale(query)).kwargs)
+
+def _money_by_currency(values) -> str:
+    return ', '.join(f'{amount:,.2f} {currency}' for currency, amount in sorted(values.items())) or '0'
+
+@router.route('admin_revenue')
+async def show_revenue(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    from bot.analytics import revenue
+    query = update.callback_query
+    if not is_admin(query.from_user.id):
+        await unknown_callback(update, context)
+        return
+    data = await asyncio.to_thread(revenue.summary)
+    screen = menus.get('admin_revenue', _locale(query))
+    await query.edit_message_text(**screen.format(
+        days=data['days'],
+        mrr=_money_by_currency({c: sum(tiers.values()) for c, tiers in data['mrr'].items()}),
+        active=data['active'],
+        new=data['new'],
+        cancelled=data['cancelled'],
+        past_due=data['past_due'],
+        churn=f"{data['churn_rate'] * 100:.1f}%",
+        revenue=_money_by_currency({
+            c: sum(g['amount'] for g in gateways.values()) for c, gateways in data['revenue'].items()
+        }),
+    ))
+
+@router.prefix('buy_')
+async def process_payment(update: Update, context: ContextTypes.DEFAULT_TYPE, tier: str):
+    query = update.callback_query
+    if tier in TIERS:
+        await query.edit_message_text(**menus.get(f'buy_{tier}', _locale(query)).kwargs)
+    else:
+        await unknown_callback(update, context)
+
+@router.prefix('pay_')
+async def send_checkout_link(update: Update, context: ContextTypes.DEFAULT_TYPE, rest: str):
+    from bot.services.checkout import GATEWAYS, checkout_links
+    query = update.callback_query
+    locale = _locale(query)
+    gateway, _, tier = rest.partition('_')
+    if gateway not in GATEWAYS or tier not in TIERS:
+        await unknown_callback(update, context)
+        return
+    try:
+        url = await checkout_links.get(query.from_user, tier, gateway)
+    except Exception:
+        logger.exception('Checkout link for %s/%s failed', gateway, tier)
+        await query.edit_message_text(**menus.get('checkout_error', locale).kwargs)
+        return
+    screen = menus.get('checkout', locale)
+    keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton(menus.text('btn_checkout', locale), url=url)],
+        [InlineKeyboardButton(menus.text('btn_back', locale), callback_data=f'buy_{tier}')],
+    ])
+    await query.edit_message_text(**dict(
+        screen.format(tier=tier.upper(), minutes=checkout_links.ttl // 60),
+        reply_markup=keyboard
+    ))
+
+@router.fallback
+async def unknown_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.edit_message_text(**menus.get('unknown', _locale(query)).kwargs)
+
+def _dscr_result(pay: float, rent: float) -> str:
+    dscr = rent / pay
+    status = "EXCELENTE" if dscr >= 1.25 else "BUENO" if dscr >= 1.0 else "NO CALIFICA"
+    return f"*RESULTADO DSCR*\n*DSCR:* {dscr:.2f}\n*Elegibilidad:* {status}"
+
+def _parse_number(text: str) -> float:
+    number = float((text or '').replace('$', '').replace(',', '').strip())
+    if number <= 0:
+        raise ValueError(text)
+    return number
+
+async def dscr_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    await dscr_sessions.aset(user.id, DSCRSession(step=1))
+    text = (
+        menus.get('dscr_value', user.language_code).text + "\n\n"
+        "Atajo: `/dscr_calc [valor] [pago] [renta]`\n"
+        "Para un portafolio envia un CSV con columnas: nombre, valor, prestamo, tasa, plazo, renta, gastos."
+    )
+    await update.message.reply_markdown(text)
+
+async def dscr_conversation(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    session = await dscr_sessions.aget(user.id)
+    if session is None:
+        return
+    try:
+        number = _parse_number(update.message.text)
+    except ValueError:
+        await update.message.reply_text(**menus.get('dscr_invalid', user.language_code).kwargs)
+        return
+    if session.step == 1:
+        await dscr_sessions.aset(user.id, DSCRSession(2, number))
+        await update.message.reply_text(**menus.get('dscr_payment', user.language_code).kwargs)
+    elif session.step == 2:
+        await dscr_sessions.aset(user.id, DSCRSession(3, session.value, number))
+        await update.message.reply_text(**menus.get('dscr_rent', user.language_code).kwargs)
+    else:
+        await dscr_sessions.adelete(user.id)
+        await update.message.reply_markdown(_dscr_result(session.payment, number))
+
+async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    await dscr_sessions.adelete(user.id)
+    await update.message.reply_text(**menus.get('dscr_cancelled', user.language_code).kwargs)
+
+async def dscr_calc_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if len(context.args) != 3:
+        await update.message.reply_text("Usa: /dscr_calc [valor] [pago] [renta]")
+        return
+    try:
+        val, pay, rent = map(float, context.args)
+        await update.message.reply_markdown(_dscr_result(pay, rent))
+    except:
+        await update.message.reply_text("Error en los numeros ingresados.")
+
+def _portfolio_report(data: bytes) -> str:
+    from bot.analytics import dscr
+    try:
+        columns = dscr.parse_csv(data.decode('utf-8-sig'), config.DSCR_MAX_ROWS)
+    except dscr.TooManyRows:
+        return f"Maximo {config.DSCR_MAX_ROWS} propiedades por archivo."
+    if not columns['name']:
+        return "El archivo no contiene propiedades."
+    analysis = dscr.analyze(columns)
+    summary = analysis.summary()
+    lines = [
+        "*PORTAFOLIO DSCR*",
+        f"*Propiedades:* {summary['properties']}",
+        f"*DSCR del portafolio:* {summary['portfolio_dscr']}",
+        f"*Cap rate promedio:* {_pct(summary['avg_cap_rate'])}",
+        f"*Cash-on-cash promedio:* {_pct(summary['avg_cash_on_cash'])}",
+        "",
+        "*Top propiedades:*",
+    ]
+    for row in analysis.ranked(10):
+        ratio = row['dscr'] if row['dscr'] is not None else '-'
+        lines.append(f"{escape_markdown(row['name'])}: DSCR {ratio} ({row['status']}), cap {_pct(row['cap_rate'])}")
+    return "\n".join(lines)
+
+def _pct(value) -> str:
+    return f"{value * 100:.2f}%" if value is not None else "-"
+
+async def dscr_portfolio_upload(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    document = update.message.document
+    if document.file_size and document.file_size > config.DSCR_MAX_UPLOAD_BYTES:
+        await update.message.reply_text("Archivo demasiado grande.")
+        return
+    telegram_file = await document.get_file()
+    data = bytes(await telegram_file.download_as_bytearray())
+    try:
+        # NumPy work runs off the event loop
+        report = await asyncio.to_thread(_portfolio_report, data)
+    except (ValueError, KeyError, UnicodeDecodeError):
+        await update.message.reply_text(
+            "No pude leer el CSV. Columnas: nombre, valor, prestamo, tasa, plazo, renta, gastos."
+        )
+        return
+    await update.message.reply_markdown(report)
+
+async def _reply_progress(update: Update, data):
+    locale = update.effective_user.language_code
+    if data is None:
+        await update.message.reply_text(**menus.get('broadcast_none', locale).kwargs)
+    else:
+        await update.message.reply_text(**menus.get('broadcast_progress', locale).format(**data))
+
+async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    from bot.services import broadcast as broadcasts
+    user = update.effective_user
+    if not is_admin(user.id):
+        return
+    parts = update.message.text.split(None, 1)
+    segment, text = broadcasts.parse_command(parts[1] if len(parts) > 1 else '')
+    if not text:
+        await update.message.reply_text(**menus.get('broadcast_usage', user.language_code).kwargs)
+        return
+    # The worker process picks it up; see bot/services/broadcast.py
+    data = await asyncio.to_thread(lambda: broadcasts.progress(broadcasts.create(text, user.id, segment)))
+    await _reply_progress(update, data)
+
+async def broadcast_status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    from bot.services import broadcast as broadcasts
+    if not is_admin(update.effective_user.id):
+        return
+    broadcast_id = int(context.args[0]) if context.args and context.args[0].isdigit() else None
+    data = await asyncio.to_thread(lambda: broadcasts.progress(broadcasts.get(broadcast_id)))
+    await _reply_progress(update, data)
+
+async def broadcast_cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    from bot.services import broadcast as broadcasts
+    user = update.effective_user
+    if not is_admin(user.id):
+        return
+    if not context.args or not context.args[0].isdigit():
+        await update.message.reply_text(**menus.get('broadcast_usage', user.language_code).kwargs)
+        return
+    data = await asyncio.to_thread(lambda: broadcasts.progress(broadcasts.cancel(int(context.args[0]))))
+    await _reply_progress(update, data)
+
+def setup_handlers(application):
+    application.add_handler(CommandHandler('start', start))
+    application.add_handler(CommandHandler('dscr', dscr_command))
+    application.add_handler(CommandHandler('dscr_calc', dscr_calc_command))
+    application.add_handler(CommandHandler('cancel', cancel_command))
+    application.add_handler(CommandHandler('broadcast', broadcast_command))
+    application.add_handler(CommandHandler('broadcast_status', broadcast_status_command))
+    application.add_handler(CommandHandler('broadcast_cancel', broadcast_cancel_command))
+    application.add_handler(CallbackQueryHandler(handle_callback))
+    application.add_handler(MessageHandler(filters.Document.FileExtension('csv'), dscr_portfolio_upload))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, dscr_conversation))
+    # Time every handler for /metrics and the sampled update log
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            handler.callback = _instrument(handler.callback)
+
+
+def _instrument(callback):
+    name = callback.__name__
+    timed = metrics.timed('bot_handler_seconds', handler=name)(callback)
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await timed(update, context)
+        finally:
+            log_update(update, name, time.perf_counter() - started)
+    return wrapper
@@ -1,24 +1,24 @@
+import atexit
+import hmac
+import json
 import os
 import logging
-import asyncio
+import time
 import urllib.request
-from flask import Flask, request, jsonify
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import (
-    Application,
-    CommandHandler,
-    CallbackQueryHandler,
-    MessageHandler,
-    filters,
-    ContextTypes
-)
+from bot.utils.timing import cold_start
+from flask import Flask, Response, g, request, jsonify
+from telegram import Update
 from datetime import datetime
-
-# Logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+from bot.application import get_ptb_app
+from bot.rate_limiter import rate_limiter
+from bot.router import router
+from bot.utils.config import config
+from bot.utils.loop import background_loop
+from bot.utils.log import setup_logging
+from bot.utils.metrics import CONTENT_TYPE, metrics
+from bot.utils.update_queue import UpdateQueue, chat_key
+
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Flask app
@@ -26,166 +26,129 @@ app = Flask(__name__)
 
 # Config
 TELEGRAM_TOKEN = os.environ.get('TELEGRAM_TOKEN', '')
-ADMIN_USER_IDS = [int(x) for x in os.environ.get('ADMIN_USER_IDS', '').split(',') if x]
 STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY', '')
 BASE_URL = os.environ.get('BASE_URL', os.environ.get('VERCEL_URL', ''))
 if BASE_URL and not BASE_URL.startswith('http'):
     BASE_URL = f'https://{BASE_URL}'
 
-def is_admin(user_id: int) -> bool:
-    return user_id in ADMIN_USER_IDS
-
-# Financial Disclaimer
-FINANCIAL_DISCLAIMER = """
-Barbosa Agency Pro Bot es una plataforma tecnologica.
-NO somos una institucion financiera, banco, ni prestamista directo.
-Todas las ofertas estan sujetas a aprobacion de credito.
-Consulta con un asesor financiero antes de decidir.
-"""
-
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user = update.effective_user
-    admin_suffix = ' [ADMIN]' if is_admin(user.id) else ''
-    keyboard = [
-        [InlineKeyboardButton('Ver Planes', callback_data='view_plans')],
-        [InlineKeyboardButton('Financiamiento', callback_data='financing_menu')],
-        [InlineKeyboardButton('Mi Cuenta', callback_data='my_account'), InlineKeyboardButton('Soporte', url='https://t.me/BarbosaAgencyProBot')]
-    ]
-    if is_admin(user.id):
-        keyboard.append([InlineKeyboardButton('Panel Admin', callback_data='admin')])
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    text = (
-        f"Hola {user.first_name}{admin_suffix}! "
-        "*BARBOSA AGENCY PRO* "
-        "Su plataforma de automatizacion y servicios inmobiliarios. "
-        "Que desea hacer?"
-    )
-    if update.message:
-        await update.message.reply_text(text, reply_markup=reply_markup, parse_mode='Markdown')
-    else:
-        await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
-
-async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    await query.answer()
-    data = query.data
-    if data == 'view_plans':
-        await show_plans(query)
-    elif data == 'financing_menu':
-        await show_financing_menu(query)
-    elif data == 'financing_agent':
-        await show_agent_loan(query)
-    elif data == 'financing_dscr':
-        await query.edit_message_text("Usa el comando /dscr para iniciar la calculadora interactiva.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton('Volver', callback_data='financing_menu')]]))
-    elif data == 'financing_seller':
-        await show_seller_financing(query)
-    elif data == 'back_main':
-        await start(update, context)
-    elif data == 'my_account':
-        await show_account(query)
-    elif data == 'admin':
-        await show_admin(query)
-    elif data.startswith('buy_'):
-        tier = data.replace('buy_', '')
-        await process_payment(query, tier)
-    else:
-        await query.edit_message_text('Opcion no disponible aun.')
-
-async def show_financing_menu(query):
-    keyboard = [
-        [InlineKeyboardButton("Prestamo para Agente", callback_data='financing_agent')],
-        [InlineKeyboardButton("Calculadora DSCR", callback_data='financing_dscr')],
-        [InlineKeyboardButton("Financiamiento del Vendedor", callback_data='financing_seller')],
-        [InlineKeyboardButton("Volver", callback_data='back_main')]
-    ]
-    text = "*OPCIONES DE FINANCIAMIENTO*\nSelecciona el servicio que necesitas."
-    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
-
-async def show_agent_loan(query):
-    text = "*PRESTAMO PARA AGENTES*\nAcceso a capital basado en comisiones." + FINANCIAL_DISCLAIMER
-    keyboard = [
-        [InlineKeyboardButton("Verificar Elegibilidad", url="https://t.me/barbosa_finance")],
-        [InlineKeyboardButton("Volver", callback_data='financing_menu')]
-    ]
-    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
-
-async def show_seller_financing(query):
-    text = "*MORE SELLER FINANCING*\nConvierte hipotecas bajas en ventas rapidas."
-    keyboard = [[InlineKeyboardButton("Volver", callback_data='financing_menu')]]
-    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
-
-async def dscr_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    text = "*CALCULADORA DSCR*\nUsa: `/dscr_calc [valor] [pago] [renta]`\nEjemplo: `/dscr_calc 300000 1800 2200`"
-    await update.message.reply_markdown(text)
-
-async def dscr_calc_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if len(context.args) != 3:
-        await update.message.reply_text("Usa: /dscr_calc [valor] [pago] [renta]")
-        return
-    try:
-        val, pay, rent = map(float, context.args)
-        dscr = rent / pay
-        status = "EXCELENTE" if dscr >= 1.25 else "BUENO" if dscr >= 1.0 else "NO CALIFICA"
-        response = f"*RESULTADO DSCR*\n*DSCR:* {dscr:.2f}\n*Elegibilidad:* {status}"
-        await update.message.reply_markdown(response)
-    except:
-        await update.message.reply_text("Error en los numeros ingresados.")
-
-async def show_plans(query):
-    keyboard = [
-        [InlineKeyboardButton('BASIC $9/mes', callback_data='buy_basic')],
-        [InlineKeyboardButton('PRO $29/mes', callback_data='buy_pro')],
-        [InlineKeyboardButton('ENTERPRISE $99/mes', callback_data='buy_enterprise')],
-        [InlineKeyboardButton('Volver', callback_data='back_main')]
-    ]
-    await query.edit_message_text('*Planes Disponibles*', reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
-
-async def show_account(query):
-    text = '*Mi Cuenta*\nGestion de cuenta en desarrollo.'
-    keyboard = [[InlineKeyboardButton('Volver', callback_data='back_main')]]
-    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
-
-async def show_admin(query):
-    text = '*Panel Admin*\nBienvenido al panel de administracion.'
-    keyboard = [[InlineKeyboardButton('Volver', callback_data='back_main')]]
-    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
-
-async def process_payment(query, tier):
-    text = f'*Plan {tier.upper()}*\nContacta a @BarbosaAgencyProBot para el pago.'
-    keyboard = [[InlineKeyboardButton('Volver', callback_data='view_plans')]]
-    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
-
-# Telegram app global
-ptb_app = None
-
-async def get_ptb_app():
-    global ptb_app
-    if ptb_app is None:
-        ptb_app = Application.builder().token(TELEGRAM_TOKEN).build()
-        ptb_app.add_handler(CommandHandler('start', start))
-        ptb_app.add_handler(CommandHandler('dscr', dscr_command))
-        ptb_app.add_handler(CommandHandler('dscr_calc', dscr_calc_command))
-        ptb_app.add_handler(CallbackQueryHandler(handle_callback))
-        await ptb_app.initialize()
-    return ptb_app
+WEBHOOK_TIMEOUT = float(os.environ.get('WEBHOOK_TIMEOUT', 60))
+
+@app.before_request
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def _record_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        metrics.observe(
+            'http_request_seconds', time.perf_counter() - started,
+            route=request.url_rule.rule if request.url_rule else 'other',
+            method=request.method, status=response.status_code
+        )
+    return response
 
 @app.route('/webhook', methods=['POST'])
 def webhook():
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(_process_update())
-        loop.close()
+        data = request.get_json(force=True)
+        if not config.WEBHOOK_EARLY_ACK:
+            # Serverless: the instance may be frozen once we answer, so finish first
+            background_loop.run(_process_update(data), timeout=WEBHOOK_TIMEOUT)
+            return jsonify({'ok': True})
+        if not background_loop.run(_enqueue_update(data), timeout=WEBHOOK_TIMEOUT):
+            # Telegram redelivers on non-2xx
+            return jsonify({'ok': False, 'error': 'queue full'}), 503, {'Retry-After': '1'}
         return jsonify({'ok': True})
     except Exception as e:
-        logger.error(f'Webhook error: {e}')
+        logger.error('Webhook error: %s', e)
         return jsonify({'ok': False, 'error': str(e)}), 500
 
-async def _process_update():
-    data = request.get_json(force=True)
+async def _process_update(data):
     application = await get_ptb_app()
     update = Update.de_json(data, application.bot)
     await application.process_update(update)
+    cold_start.log_once()
+
+# With WEBHOOK_EARLY_ACK request threads only enqueue; the loop runs one update
+# per chat at a time, chats in parallel
+update_queue = UpdateQueue(
+    _process_update,
+    maxsize=config.UPDATE_QUEUE_SIZE,
+    workers=config.UPDATE_WORKERS,
+    put_timeout=config.UPDATE_ENQUEUE_TIMEOUT,
+    key=chat_key,
+)
+
+async def _enqueue_update(data) -> bool:
+    await update_queue.start()
+    return await update_queue.put(data)
+
+@atexit.register
+def _drain_updates():
+    if update_queue.enqueued:
+        try:
+            background_loop.run(update_queue.stop(), timeout=WEBHOOK_TIMEOUT)
+        except Exception:
+            logger.exception('Update queue did not drain')
+
+@app.route('/webhook/stripe', methods=['POST'])
+def stripe_webhook():
+    # Verify and enqueue only; bot.worker applies the event
+    from bot.services.stripe_service import StripeService
+    from bot.services import outbox
+    status, event = StripeService.verify_event(
+        request.get_data(), request.headers.get('Stripe-Signature', '')
+    )
+    if event is None:
+        return jsonify({'ok': False, 'error': status}), 400
+    payload = request.get_json(force=True)
+    outbox.enqueue('stripe', payload, payload.get('id'), payload.get('type'))
+    return jsonify({'ok': True})
+
+@app.route('/webhook/mercadopago', methods=['POST'])
+def mercadopago_webhook():
+    from bot.services.mp_service import MercadoPagoService
+    from bot.services import outbox
+    payload = request.get_json(force=True, silent=True) or {}
+    data_id = request.args.get('data.id') or str(payload.get('data', {}).get('id', ''))
+    if not MercadoPagoService.verify_signature(
+        data_id, request.headers.get('x-request-id', ''), request.headers.get('x-signature', '')
+    ):
+        return jsonify({'ok': False, 'error': 'invalid_signature'}), 400
+    outbox.enqueue('mercadopago', payload, payload.get('id'), payload.get('action') or payload.get('type'))
+    return jsonify({'ok': True})
+
+@app.route('/api/dscr', methods=['POST'])
+def dscr_portfolio():
+    # Accepts {"properties": [...]} JSON or a raw CSV body
+    from bot.analytics import dscr
+    if not config.DSCR_API_TOKEN:
+        return jsonify({'ok': False, 'error': 'disabled'}), 403
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {config.DSCR_API_TOKEN}'):
+        return jsonify({'ok': False, 'error': 'unauthorized'}), 401
+    max_bytes = config.DSCR_MAX_UPLOAD_BYTES
+    body = b''
+    if (request.content_length or 0) <= max_bytes:
+        # Chunked bodies have no Content-Length; never read past the limit
+        body = request.stream.read(max_bytes + 1)
+    if (request.content_length or 0) > max_bytes or len(body) > max_bytes:
+        return jsonify({'ok': False, 'error': f'max {max_bytes} bytes'}), 413
+    try:
+        if request.is_json:
+            properties = (json.loads(body) or {}).get('properties') or []
+            columns = dscr.from_records(properties, config.DSCR_MAX_ROWS)
+        else:
+            columns = dscr.parse_csv(body.decode('utf-8-sig'), config.DSCR_MAX_ROWS)
+    except dscr.TooManyRows as e:
+        return jsonify({'ok': False, 'error': str(e)}), 413
+    except (ValueError, TypeError, AttributeError) as e:
+        return jsonify({'ok': False, 'error': f'invalid input: {e}'}), 400
+    if not columns['name']:
+        return jsonify({'ok': False, 'error': 'no properties'}), 400
+    analysis = dscr.analyze(columns)
+    limit = request.args.get('limit', type=int)
+    return jsonify({'ok': True, 'summary': analysis.summary(), 'ranked': analysis.ranked(limit)})
 
 @app.route('/setup_webhook', methods=['GET'])
 def setup_webhook():
@@ -197,7 +160,18 @@ def setup_webhook():
 
 @app.route('/health', methods=['GET'])
 def health():
-    return jsonify({'status': 'healthy', 'timestamp': datetime.utcnow().isoformat()})
+    return jsonify({
+        'status': 'healthy',
+        'timestamp': datetime.utcnow().isoformat(),
+        'cold_start': cold_start.report(),
+        'queue': update_queue.stats(),
+        'callbacks': router.snapshot(),
+        'outbound': rate_limiter.stats()
+    })
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
 
 @app.route('/')
 def index():
@@ -0,0 +1,196 @@
+from typing import Dict, List, Optional, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from bot.utils.config import config
+
+DEFAULT_LOCALE = 'es'
+
+# Financial Disclaimer
+FINANCIAL_DISCLAIMER = """
+Barbosa Agency Pro Bot es una plataforma tecnologica.
+NO somos una institucion financiera, banco, ni prestamista directo.
+Todas las ofertas estan sujetas a aprobacion de credito.
+Consulta con un asesor financiero antes de decidir.
+"""
+
+TIERS = ('basic', 'pro', 'enterprise')
+
+TEXTS = {
+    'es': {
+        'start': (
+            "Hola {name}{admin_suffix}! "
+            "*BARBOSA AGENCY PRO* "
+            "Su plataforma de automatizacion y servicios inmobiliarios. "
+            "Que desea hacer?"
+        ),
+        'admin_suffix': ' [ADMIN]',
+        'btn_plans': 'Ver Planes',
+        'btn_financing': 'Financiamiento',
+        'btn_account': 'Mi Cuenta',
+        'btn_support': 'Soporte',
+        'btn_admin': 'Panel Admin',
+        'btn_back': 'Volver',
+        'view_plans': '*Planes Disponibles*',
+        'btn_basic': 'BASIC $9/mes',
+        'btn_pro': 'PRO $29/mes',
+        'btn_enterprise': 'ENTERPRISE $99/mes',
+        'financing_menu': "*OPCIONES DE FINANCIAMIENTO*\nSelecciona el servicio que necesitas.",
+        'btn_agent': 'Prestamo para Agente',
+        'btn_dscr': 'Calculadora DSCR',
+        'btn_seller': 'Financiamiento del Vendedor',
+        'financing_agent': "*PRESTAMO PARA AGENTES*\nAcceso a capital basado en comisiones." + FINANCIAL_DISCLAIMER,
+        'btn_eligibility': 'Verificar Elegibilidad',
+        'financing_dscr': "*CALCULADORA DSCR*\nPaso 1/3: Cual es el valor de la propiedad (USD)?\n/cancel para salir.",
+        'dscr_payment': "Paso 2/3: Cual es el pago mensual del prestamo (P&I)?",
+        'dscr_rent': "Paso 3/3: Cual es la renta mensual esperada?",
+        'dscr_invalid': "Ingresa un numero valido, por ejemplo 2200.",
+        'dscr_cancelled': "Calculadora cancelada.",
+        'financing_seller': "*MORE SELLER FINANCING*\nConvierte hipotecas bajas en ventas rapidas.",
+        'admin': (
+            "*Panel Admin*\nBienvenido al panel de administracion.\n\n"
+            "*Difusiones*\n"
+            "`/broadcast [tier=pro,enterprise] [status=active] [lang=es] [tz=America/Puerto_Rico] mensaje`\n"
+            "`/broadcast_status [id]`\n"
+            "`/broadcast_cancel id`"
+        ),
+        'btn_revenue': 'Ingresos y Churn',
+        'revenue': (
+            "*Ingresos (ultimos {days} dias)*\n"
+            "*MRR:* {mrr}\n"
+            "*Suscripciones activas:* {active}\n"
+            "*Nuevas:* {new}  *Canceladas:* {cancelled}  *Morosas:* {past_due}\n"
+            "*Churn:* {churn}\n"
+            "*Cobrado:* {revenue}"
+        ),
+        'broadcast_usage': "Usa: /broadcast [tier=..] [status=..] [lang=..] [tz=..] mensaje",
+        'broadcast_progress': (
+            "Difusion #{id}: {status}\n"
+            "Enviados: {sent}/{total}\nBloqueados: {blocked}\nFallidos: {failed}"
+        ),
+        'broadcast_none': "No hay difusiones.",
+        'buy': '*Plan {tier}*\nElige tu metodo de pago.',
+        'btn_pay_stripe': 'Tarjeta (Stripe)',
+        'btn_pay_mercadopago': 'MercadoPago',
+        'checkout': '*Plan {tier}*\nTu enlace de pago esta listo, valido por {minutes} minutos.',
+        'btn_checkout': 'Pagar ahora',
+        'checkout_error': 'No pudimos generar el enlace de pago. Intenta de nuevo en unos minutos.',
+        'unknown': 'Opcion no disponible aun.',
+    },
+}
+
+
+class Screen:
+    """Text plus a keyboard built once; ``kwargs`` is passed straight to send/edit calls.
+
+    InlineKeyboardMarkup is immutable in PTB 20, so one instance is safely
+    shared by every update that renders the screen.
+    """
+
+    __slots__ = ('text', 'reply_markup', 'parse_mode', 'kwargs')
+
+    def __init__(self, text: str, keyboard: Optional[List[List[InlineKeyboardButton]]],
+                 parse_mode: Optional[str] = 'Markdown'):
+        self.text = text
+        self.reply_markup = InlineKeyboardMarkup(keyboard) if keyboard else None
+        self.parse_mode = parse_mode
+        self.kwargs = {'text': text}
+        if self.reply_markup:
+            self.kwargs['reply_markup'] = self.reply_markup
+        if parse_mode:
+            self.kwargs['parse_mode'] = parse_mode
+
+    def with_text(self, text: str) -> Dict:
+        return dict(self.kwargs, text=text)
+
+    def format(self, **values) -> Dict:
+        return self.with_text(self.text.format(**values))
+
+
+def _build_locale(t: Dict[str, str]) -> Dict[Tuple[str, bool], Screen]:
+    def back(target: str) -> List[InlineKeyboardButton]:
+        return [InlineKeyboardButton(t['btn_back'], callback_data=target)]
+
+    main_rows = [
+        [InlineKeyboardButton(t['btn_plans'], callback_data='view_plans')],
+        [InlineKeyboardButton(t['btn_financing'], callback_data='financing_menu')],
+        [InlineKeyboardButton(t['btn_account'], callback_data='my_account'),
+         InlineKeyboardButton(t['btn_support'], url='https://t.me/BarbosaAgencyProBot')]
+    ]
+    screens = {
+        ('start', False): Screen(t['start'].replace('{admin_suffix}', ''), main_rows),
+        ('start', True): Screen(
+            t['start'].replace('{admin_suffix}', t['admin_suffix']),
+            main_rows + [[InlineKeyboardButton(t['btn_admin'], callback_data='admin')]]
+        ),
+        ('view_plans', False): Screen(t['view_plans'], [
+            [InlineKeyboardButton(t[f'btn_{tier}'], callback_data=f'buy_{tier}')] for tier in TIERS
+        ] + [back('back_main')]),
+        ('financing_menu', False): Screen(t['financing_menu'], [
+            [InlineKeyboardButton(t['btn_agent'], callback_data='financing_agent')],
+            [InlineKeyboardButton(t['btn_dscr'], callback_data='financing_dscr')],
+            [InlineKeyboardButton(t['btn_seller'], callback_data='financing_seller')],
+            back('back_main')
+        ]),
+        ('financing_agent', False): Screen(t['financing_agent'], [
+            [InlineKeyboardButton(t['btn_eligibility'], url='https://t.me/barbosa_finance')],
+            back('financing_menu')
+        ]),
+        ('financing_dscr', False): Screen(t['financing_dscr'], [back('financing_menu')]),
+        ('dscr_value', False): Screen(t['financing_dscr'], None),
+        ('dscr_payment', False): Screen(t['dscr_payment'], None, parse_mode=None),
+        ('dscr_rent', False): Screen(t['dscr_rent'], None, parse_mode=None),
+        ('dscr_invalid', False): Screen(t['dscr_invalid'], None, parse_mode=None),
+        ('dscr_cancelled', False): Screen(t['dscr_cancelled'], None, parse_mode=None),
+        ('financing_seller', False): Screen(t['financing_seller'], [back('financing_menu')]),
+        ('my_account', False): Screen('', [back('back_main')]),
+        ('admin', False): Screen(t['admin'], [
+            [InlineKeyboardButton(t['btn_revenue'], callback_data='admin_revenue')],
+            back('back_main')
+        ]),
+        ('admin_revenue', False): Screen(t['revenue'], [back('admin')]),
+        ('broadcast_usage', False): Screen(t['broadcast_usage'], None, parse_mode=None),
+        ('broadcast_progress', False): Screen(t['broadcast_progress'], None, parse_mode=None),
+        ('broadcast_none', False): Screen(t['broadcast_none'], None, parse_mode=None),
+        ('checkout', False): Screen(t['checkout'], None),
+        ('checkout_error', False): Screen(t['checkout_error'], [back('view_plans')], parse_mode=None),
+        ('unknown', False): Screen(t['unknown'], None, parse_mode=None),
+    }
+    gateways = [
+        gateway for gateway, enabled in (('stripe', config.ENABLE_STRIPE), ('mercadopago', config.ENABLE_MP))
+        if enabled
+    ]
+    for tier in TIERS:
+        screens[(f'buy_{tier}', False)] = Screen(t['buy'].format(tier=tier.upper()), [
+            [InlineKeyboardButton(t[f'btn_pay_{gateway}'], callback_data=f'pay_{gateway}_{tier}')]
+            for gateway in gateways
+        ] + [back('view_plans')])
+    return screens
+
+
+class MenuRegistry:
+    """Every screen for every locale and admin variant, built once at import."""
+
+    def __init__(self, texts: Dict[str, Dict[str, str]]):
+        self._texts = texts
+        self._screens: Dict[Tuple[str, str, bool], Screen] = {}
+        for locale, locale_texts in texts.items():
+            for (name, admin), screen in _build_locale(locale_texts).items():
+                self._screens[(name, locale, admin)] = screen
+
+    def get(self, name: str, locale: Optional[str] = None, admin: bool = False) -> Screen:
+        locale = (locale or DEFAULT_LOCALE)[:2]
+        screens = self._screens
+        return (
+            screens.get((name, locale, admin)) or
+            screens.get((name, DEFAULT_LOCALE, admin)) or
+            screens[(name, DEFAULT_LOCALE, False)]
+        )
+
+    def text(self, key: str, locale: Optional[str] = None) -> str:
+        """A single string (button labels for keyboards built per request)."""
+        locale = (locale or DEFAULT_LOCALE)[:2]
+        return self._texts.get(locale, {}).get(key) or self._texts[DEFAULT_LOCALE][key]
+
+
+menus = MenuRegistry(TEXTS)
@@ -1,5 +1,15 @@
 from bot.models.user import User
 from bot.models.payment import Payment
 from bot.models.subscription import Subscription
+from bot.models.processed_event import ProcessedEvent
+from bot.models.webhook_event import WebhookEvent
+from bot.models.broadcast import Broadcast
+from bot.models.webhook_payload import WebhookPayload
+from bot.models.gateway_customer import GatewayCustomer
+from bot.models.notification import Notification
+from bot.models.reconcile_cursor import ReconcileCursor
+from bot.models.rollup import DailyRevenue, DailySubscriptions
 
-__all__ = ['User', 'Payment', 'Subscription']
+__all__ = ['User', 'Payment', 'Subscription', 'ProcessedEvent', 'WebhookEvent', 'Broadcast',
+           'WebhookPayload', 'GatewayCustomer', 'Notification', 'ReconcileCursor',
+           'DailyRevenue', 'DailySubscriptions']
@@ -1,26 +1,148 @@
-from sqlalchemy import create_engine, Column, Integer, DateTime, Boolean
+import time
+import zlib
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event, inspect, text, Column, Integer, DateTime, Boolean
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, scoped_session
 from bot.utils.config import config
+from bot.utils.registry import registry
+from bot.utils.metrics import metrics
 from datetime import datetime
 
-engine = create_engine(
-    config.DATABASE_URL,
-    pool_pre_ping=True,
-    pool_recycle=300
-)
-db_session = scoped_session(sessionmaker(bind=engine))
+
+def _create_engine():
+    # Loads the DB driver (psycopg2) and builds the pool on first use only
+    engine = create_engine(
+        config.DATABASE_URL,
+        pool_pre_ping=True,
+        pool_recycle=300
+    )
+    event.listen(engine, 'before_cursor_execute', _query_started)
+    event.listen(engine, 'after_cursor_execute', _query_finished)
+    return engine
+
+
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the statement's own context, so a failed statement leaves nothing behind
+    context._query_started = time.perf_counter()
+
+
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_query_started', None)
+    if started is None:
+        return
+    # Label by statement kind only (SELECT, INSERT, ...) to keep cardinality bounded
+    kind = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+    metrics.observe('db_query_seconds', time.perf_counter() - started, statement=kind)
+
+
+registry.register('db_engine', _create_engine)
+
+
+def get_engine():
+    return registry.get('db_engine')
+
+
+Session = sessionmaker()
+
+
+@event.listens_for(Session, 'before_commit')
+def _commit_started(session):
+    session.info['commit_started'] = time.perf_counter()
+
+
+@event.listens_for(Session, 'after_commit')
+def _commit_finished(session):
+    started = session.info.pop('commit_started', None)
+    if started is not None:
+        metrics.observe('db_commit_seconds', time.perf_counter() - started)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _commit_failed(session):
+    if session.info.pop('commit_started', None) is not None:
+        metrics.inc('db_commit_errors_total')
+
+
+db_session = scoped_session(lambda: Session(bind=get_engine()))
 Base = declarative_base()
 Base.query = db_session.query_property()
 
 
+def __getattr__(name):
+    # Backwards compatible ``from bot.models.base import engine``
+    if name == 'engine':
+        return get_engine()
+    raise AttributeError(name)
+
+
+def dialect_insert(session=None):
+    """``insert`` with ON CONFLICT support for the session's database (PostgreSQL or SQLite)."""
+    dialect = (session or db_session).get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f'ON CONFLICT upserts not supported on {dialect}')
+    return insert
+
+
+@contextmanager
+def advisory_lock(name: str):
+    """Try a PostgreSQL session-level advisory lock; yields whether this process holds it.
+
+    The lock lives on its own connection, so it is released when the block
+    exits or, if the process dies, when the connection drops. Other databases
+    have no cross-process lock and always yield True.
+    """
+    engine = get_engine()
+    if engine.dialect.name != 'postgresql':
+        yield True
+        return
+    key = zlib.crc32(name.encode())
+    with engine.connect() as conn:
+        acquired = conn.execute(text('SELECT pg_try_advisory_lock(:key)'), {'key': key}).scalar()
+        conn.commit()
+        try:
+            yield bool(acquired)
+        finally:
+            if acquired:
+                conn.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': key})
+                conn.commit()
+
+
 class TimestampMixin:
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_active = Column(Boolean, default=True)
 
 
+# Columns added to tables that already existed; create_all leaves those tables alone
+ADDED_COLUMNS = (
+    ('payments', 'raw_payload_id', 'INTEGER REFERENCES webhook_payloads (id)'),
+)
+
+
 def init_db():
-    from bot.models import user, payment, subscription  # noqa
+    """Create missing tables, columns and indexes; safe to run on every deploy.
+
+        python -c 'from bot.models.base import init_db; init_db()'
+    """
+    from bot.models import (  # noqa
+        user, payment, subscription, processed_event, webhook_event, broadcast, rollup,
+        webhook_payload, gateway_customer, notification, reconcile_cursor
+    )
+    engine = get_engine()
     Base.metadata.create_all(bind=engine)
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table, column, ddl in ADDED_COLUMNS:
+            if column not in {existing['name'] for existing in inspector.get_columns(table)}:
+                conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+    # create_all skips tables that already exist; add indexes declared since then
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
     print('Database initialized successfully.')
+
@@ -0,0 +1,32 @@
+from sqlalchemy import Column, Integer, String, BigInteger, DateTime, Text, JSON, Index
+from bot.models.base import Base
+from datetime import datetime
+
+
+class Broadcast(Base):
+    """Admin message to a user segment; ``last_user_id`` is the resume checkpoint."""
+    __tablename__ = 'broadcasts'
+    __table_args__ = (
+        Index('ix_broadcasts_status_heartbeat', 'status', 'heartbeat_at'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    created_by = Column(BigInteger)  # admin telegram_id
+    text = Column(Text, nullable=False)
+    filters = Column(JSON, default=dict)  # tier, status, lang, tz -> list of values
+
+    status = Column(String(20), default='pending')  # pending, running, done, cancelled
+    total = Column(Integer, default=0)
+    last_user_id = Column(Integer, default=0)
+    sent = Column(Integer, default=0)
+    blocked = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+
+    # Refreshed at every checkpoint; a stale heartbeat means the runner died
+    heartbeat_at = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+    def __repr__(self):
+        return f'<Broadcast {self.id} {self.status} {self.sent}/{self.total}>'
@@ -0,0 +1,21 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, UniqueConstraint, Index
+from bot.models.base import Base
+from datetime import datetime
+
+
+class GatewayCustomer(Base):
+    """A user's customer id at a payment gateway; one per (user, gateway)."""
+    __tablename__ = 'gateway_customers'
+    __table_args__ = (
+        UniqueConstraint('user_id', 'gateway', name='uq_gateway_customers_user_gateway'),
+        Index('ix_gateway_customers_gateway_customer', 'gateway', 'customer_id'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    gateway = Column(String(20), nullable=False)
+    customer_id = Column(String(255), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<GatewayCustomer {self.user_id} {self.gateway} {self.customer_id}>'
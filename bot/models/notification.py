@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Integer, String, BigInteger, DateTime, Text, ForeignKey, Index
+from bot.models.base import Base
+from datetime import datetime
+
+
+class Notification(Base):
+    """Queued message to one user; ``key`` keeps repeated sweeps from queueing it twice."""
+    __tablename__ = 'notifications'
+    __table_args__ = (
+        Index('ix_notifications_status_id', 'status', 'id'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    key = Column(String(120), unique=True, nullable=False)  # e.g. renewal:<subscription_id>:<period_end>
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    telegram_id = Column(BigInteger, nullable=False)
+    kind = Column(String(30), nullable=False)
+    text = Column(Text, nullable=False)
+
+    status = Column(String(20), default='pending')  # pending, sent, blocked, failed
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime)
+
+    def __repr__(self):
+        return f'<Notification {self.id} {self.kind} {self.status}>'
@@ -1,10 +1,15 @@
-from sqlalchemy import Column, Integer, String, Numeric, DateTime, ForeignKey, Text, JSON
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Numeric, DateTime, ForeignKey, Text, JSON, Index
+from sqlalchemy.orm import relationship, deferred
 from bot.models.base import Base, TimestampMixin
 
 
 class Payment(Base, TimestampMixin):
     __tablename__ = 'payments'
+    __table_args__ = (
+        Index('ix_payments_status_created', 'status', 'created_at'),
+        Index('ix_payments_user_created', 'user_id', 'created_at'),
+        Index('ix_payments_gateway_status', 'gateway', 'status'),
+    )
 
     id = Column(Integer, primary_key=True)
 
@@ -35,9 +40,24 @@ class Payment(Base, TimestampMixin):
     billing_period = Column(String(20))  # one_time, monthly, yearly
 
     # Metadata
-    raw_webhook_data = Column(JSON)
+    # Raw gateway JSON lives in webhook_payloads; only loaded when accessed
+    raw_payload_id = Column(Integer, ForeignKey('webhook_payloads.id'))
+    raw_payload = relationship('WebhookPayload', lazy='select')
+    # Inline payloads written before the archive existed (see bot/services/archive.py)
+    legacy_raw_webhook_data = deferred(Column('raw_webhook_data', JSON))
     receipt_url = Column(String(500))
     invoice_pdf = Column(String(500))
 
+    @property
+    def raw_webhook_data(self):
+        if self.raw_payload is not None:
+            return self.raw_payload.unpack()
+        return self.legacy_raw_webhook_data
+
+    @raw_webhook_data.setter
+    def raw_webhook_data(self, payload):
+        from bot.models.webhook_payload import WebhookPayload
+        self.raw_payload = WebhookPayload.pack(self.gateway, payload) if payload is not None else None
+
     def __repr__(self):
         return f'<Payment {self.id} {self.amount} {self.currency} {self.status}>'
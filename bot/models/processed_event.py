@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, String, DateTime, UniqueConstraint
+from bot.models.base import Base
+from datetime import datetime
+
+
+class ProcessedEvent(Base):
+    __tablename__ = 'processed_events'
+    __table_args__ = (
+        UniqueConstraint('gateway', 'event_id', name='uq_processed_events_gateway_event'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    gateway = Column(String(20), nullable=False)
+    event_id = Column(String(255), nullable=False)
+    event_type = Column(String(100))
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ProcessedEvent {self.gateway} {self.event_id}>'
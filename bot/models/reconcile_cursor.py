@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from bot.models.base import Base
+from datetime import datetime
+
+
+class ReconcileCursor(Base):
+    """Where a reconciliation stream stopped; ``position`` is None once a pass completes."""
+    __tablename__ = 'reconcile_cursors'
+
+    id = Column(Integer, primary_key=True)
+    stream = Column(String(50), unique=True, nullable=False)  # stripe_subscriptions, stripe_charges, mp_payments
+    position = Column(String(255))
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ReconcileCursor {self.stream} {self.position}>'
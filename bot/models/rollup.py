@@ -0,0 +1,43 @@
+from sqlalchemy import Column, Integer, String, Date, Numeric, UniqueConstraint
+from bot.models.base import Base
+
+
+class DailyRevenue(Base):
+    """Completed payments per day, kept current as webhooks land."""
+    __tablename__ = 'daily_revenue'
+    __table_args__ = (
+        UniqueConstraint('day', 'gateway', 'tier', 'currency', name='uq_daily_revenue_key'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    day = Column(Date, nullable=False)
+    gateway = Column(String(20), nullable=False)
+    tier = Column(String(20), nullable=False)
+    currency = Column(String(3), nullable=False)
+    payments = Column(Integer, default=0, nullable=False)
+    amount = Column(Numeric(12, 2), default=0, nullable=False)
+
+    def __repr__(self):
+        return f'<DailyRevenue {self.day} {self.gateway} {self.tier} {self.amount} {self.currency}>'
+
+
+class DailySubscriptions(Base):
+    """Subscription movements per day; summing ``mrr_added - mrr_lost`` gives MRR."""
+    __tablename__ = 'daily_subscriptions'
+    __table_args__ = (
+        UniqueConstraint('day', 'gateway', 'tier', 'currency', name='uq_daily_subscriptions_key'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    day = Column(Date, nullable=False)
+    gateway = Column(String(20), nullable=False)
+    tier = Column(String(20), nullable=False)
+    currency = Column(String(3), nullable=False)
+    new = Column(Integer, default=0, nullable=False)
+    cancelled = Column(Integer, default=0, nullable=False)
+    past_due = Column(Integer, default=0, nullable=False)
+    mrr_added = Column(Numeric(12, 2), default=0, nullable=False)
+    mrr_lost = Column(Numeric(12, 2), default=0, nullable=False)
+
+    def __repr__(self):
+        return f'<DailySubscriptions {self.day} {self.gateway} {self.tier} +{self.new} -{self.cancelled}>'
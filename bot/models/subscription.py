@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Numeric, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Numeric, Boolean, Index
 from sqlalchemy.orm import relationship
 from bot.models.base import Base, TimestampMixin
 from datetime import datetime
@@ -6,6 +6,13 @@ from datetime import datetime
 
 class Subscription(Base, TimestampMixin):
     __tablename__ = 'subscriptions'
+    __table_args__ = (
+        Index('ix_subscriptions_status_tier', 'status', 'tier'),
+        Index('ix_subscriptions_user_status', 'user_id', 'status'),
+        Index('ix_subscriptions_gateway_status', 'gateway', 'status'),
+        # Expiry sweeps and renewal reminders are range scans on period end per status
+        Index('ix_subscriptions_status_period_end', 'status', 'current_period_end'),
+    )
 
     id = Column(Integer, primary_key=True)
 
@@ -19,7 +26,7 @@ class Subscription(Base, TimestampMixin):
 
     # Plan
     tier = Column(String(20), nullable=False)  # basic, pro, enterprise
-    status = Column(String(20), default='active')  # active, canceled, past_due, unpaid
+    status = Column(String(20), default='active')  # active, canceled, past_due, unpaid, expired
 
     # Billing
     current_period_start = Column(DateTime)
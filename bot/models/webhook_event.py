@@ -0,0 +1,28 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, JSON, Index
+from bot.models.base import Base
+from datetime import datetime
+
+
+class WebhookEvent(Base):
+    """Outbox row for a verified gateway webhook waiting to be processed."""
+    __tablename__ = 'webhook_events'
+    __table_args__ = (
+        Index('ix_webhook_events_status_available', 'status', 'available_at'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    gateway = Column(String(20), nullable=False)  # stripe, mercadopago
+    event_id = Column(String(255))
+    event_type = Column(String(100))
+    payload = Column(JSON, nullable=False)
+
+    status = Column(String(20), default='pending')  # pending, processing, done, failed
+    attempts = Column(Integer, default=0)
+    last_error = Column(Text)
+    # Next time the row may be claimed; doubles as the lease of a claimed row
+    available_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    processed_at = Column(DateTime)
+
+    def __repr__(self):
+        return f'<WebhookEvent {self.id} {self.gateway} {self.event_type} {self.status}>'
@@ -0,0 +1,31 @@
+import json
+import zlib
+from sqlalchemy import Column, Integer, String, DateTime, LargeBinary
+from bot.models.base import Base
+from datetime import datetime
+
+
+class WebhookPayload(Base):
+    """Append-only archive of raw gateway JSON, zlib-compressed.
+
+    Payments point here instead of carrying the payload inline, so the hot
+    ``payments`` rows stay small.
+    """
+    __tablename__ = 'webhook_payloads'
+
+    id = Column(Integer, primary_key=True)
+    gateway = Column(String(20))
+    size = Column(Integer)  # uncompressed bytes
+    data = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    @classmethod
+    def pack(cls, gateway: str, payload) -> 'WebhookPayload':
+        raw = json.dumps(payload, separators=(',', ':'), default=str).encode()
+        return cls(gateway=gateway, size=len(raw), data=zlib.compress(raw, 6))
+
+    def unpack(self):
+        return json.loads(zlib.decompress(self.data))
+
+    def __repr__(self):
+        return f'<WebhookPayload {self.id} {self.gateway} {self.size}B>'
@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Callable, Coroutine, Dict, Optional, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from bot.utils.cache import TTLCache
+from bot.utils.config import config
+from bot.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Telegram's bot-wide message limit, shared by every process using the token
+TELEGRAM_GLOBAL_RATE = 30.0
+
+# Edits to the same message collapse into the newest one while they wait
+COALESCED_ENDPOINTS = frozenset({'editMessageText', 'editMessageReplyMarkup', 'editMessageCaption'})
+
+
+class TokenBucket:
+    """Reservation-style bucket: tokens may go negative, the deficit is the wait.
+
+    Thread-safe, so one limiter can pace bots running on several event loops.
+    """
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', '_lock')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class _PendingEdit:
+    __slots__ = ('callback', 'args', 'kwargs', 'future')
+
+    def __init__(self, callback, args, kwargs):
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class OutboundRateLimiter(BaseRateLimiter[int]):
+    """Schedules every Bot API call made through the Application's bot.
+
+    Calls that target a chat reserve a slot in that chat's bucket (1/s for
+    private chats, 20/min for groups and channels) and then in the global
+    bucket (``global_rate``). A RetryAfter pauses everything for
+    ``retry_after`` seconds and the call is retried up to ``max_retries``
+    times; ``rate_limit_args`` on a single call overrides that number. Edits
+    to a message that is still waiting replace the queued edit, and all
+    callers get the newest result.
+    """
+
+    def __init__(self, global_rate: float = 30.0, chat_rate: float = 1.0, chat_burst: float = 3.0,
+                 group_per_minute: float = 20.0, max_retries: int = 3):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_per_minute / 60
+        self.max_retries = max_retries
+        # An idle bucket refills completely, so expiring it loses nothing
+        self._chats = TTLCache(maxsize=100000, ttl=max(60.0, chat_burst / chat_rate))
+        self._edits: Dict[tuple, _PendingEdit] = {}
+        self._paused_until = 0.0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.wait_seconds = 0.0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # Groups, supergroups and channels have negative ids or @usernames
+            if isinstance(chat_id, str) or int(chat_id) < 0:
+                bucket = TokenBucket(self.group_rate, 1)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+        self._chats.set(chat_id, bucket)
+        return bucket
+
+    async def _sleep(self, delay: float):
+        if delay > 0:
+            self.wait_seconds += delay
+            await asyncio.sleep(delay)
+
+    async def _acquire(self, chat_id):
+        if chat_id is not None:
+            await self._sleep(self._chat_bucket(chat_id).reserve())
+        await self._sleep(self._paused_until - time.monotonic())
+        await self._sleep(self.global_bucket.reserve())
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict, list]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int],
+    ):
+        chat_id = data.get('chat_id')
+        edit_key = None
+        if endpoint in COALESCED_ENDPOINTS:
+            edit_key = (endpoint, chat_id, data.get('message_id'), data.get('inline_message_id'))
+            pending = self._edits.get(edit_key)
+            if pending is not None:
+                pending.callback, pending.args, pending.kwargs = callback, args, kwargs
+                self.coalesced += 1
+                return await asyncio.shield(pending.future)
+
+        self.waiting += 1
+        if self.waiting > self.max_waiting:
+            self.max_waiting = self.waiting
+        pending = None
+        if edit_key is not None:
+            pending = self._edits[edit_key] = _PendingEdit(callback, args, kwargs)
+        try:
+            queued = time.perf_counter()
+            try:
+                await self._acquire(chat_id)
+            finally:
+                metrics.observe('telegram_ratelimit_wait_seconds', time.perf_counter() - queued)
+                self.waiting -= 1
+                if pending is not None:
+                    self._edits.pop(edit_key, None)
+                    callback, args, kwargs = pending.callback, pending.args, pending.kwargs
+            max_retries = self.max_retries if rate_limit_args is None else rate_limit_args
+            result = await self._call(callback, args, kwargs, endpoint, chat_id, max_retries)
+        except BaseException as exc:
+            if pending is not None:
+                if isinstance(exc, asyncio.CancelledError):
+                    pending.future.cancel()
+                else:
+                    pending.future.set_exception(exc)
+                    # Nobody may have coalesced into this edit; mark the error as seen
+                    pending.future.exception()
+            raise
+        if pending is not None:
+            pending.future.set_result(result)
+        return result
+
+    async def _call(self, callback, args, kwargs, endpoint: str, chat_id, max_retries: int):
+        attempt = 0
+        while True:
+            try:
+                with metrics.timer('telegram_api_seconds', method=endpoint):
+                    result = await callback(*args, **kwargs)
+                self.sent += 1
+                return result
+            except RetryAfter as exc:
+                if attempt >= max_retries:
+                    raise
+                attempt += 1
+                self.retries += 1
+                delay = float(getattr(exc.retry_after, 'total_seconds', lambda: exc.retry_after)()) + 0.1
+                logger.warning('Flood control on chat %s, pausing outbound calls %.1fs', chat_id, delay)
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                await self._sleep(self._paused_until - time.monotonic())
+
+    def stats(self) -> Dict:
+        return {
+            'waiting': self.waiting,
+            'max_waiting': self.max_waiting,
+            'sent': self.sent,
+            'coalesced': self.coalesced,
+            'retries': self.retries,
+            'wait_seconds': round(self.wait_seconds, 3),
+            'chats_tracked': len(self._chats),
+            'paused_for': round(max(0.0, self._paused_until - time.monotonic()), 3),
+        }
+
+
+rate_limiter = OutboundRateLimiter(
+    global_rate=config.OUTBOUND_GLOBAL_RATE,
+    chat_rate=config.OUTBOUND_CHAT_RATE,
+    chat_burst=config.OUTBOUND_CHAT_BURST,
+    group_per_minute=config.OUTBOUND_GROUP_PER_MINUTE,
+    max_retries=config.OUTBOUND_MAX_RETRIES,
+)
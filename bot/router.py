@@ -0,0 +1,111 @@
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from bot.utils.metrics import metrics
+
+Handler = Callable[..., Awaitable[None]]
+
+_HANDLER = object()
+
+
+class RouteStats:
+    __slots__ = ('count', 'errors', 'total_seconds', 'max_seconds')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def as_dict(self) -> Dict:
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'avg_ms': round(self.total_seconds / self.count * 1000, 3) if self.count else 0.0,
+            'max_ms': round(self.max_seconds * 1000, 3),
+        }
+
+
+class CallbackRouter:
+    """Maps ``callback_data`` to screen coroutines.
+
+    Exact routes are a dict lookup; prefix routes (``buy_<tier>``) live in a
+    character trie whose depth is bounded by Telegram's 64-byte callback data,
+    so dispatch cost does not grow with the number of routes. Handlers are
+    called as ``handler(update, context)`` or, for prefix routes,
+    ``handler(update, context, rest_of_data)``.
+    """
+
+    def __init__(self):
+        self._exact: Dict[str, Tuple[str, Handler]] = {}
+        self._trie: Dict = {}
+        self._fallback: Optional[Tuple[str, Handler]] = None
+        self.stats: Dict[str, RouteStats] = {}
+
+    def route(self, *names: str):
+        def decorator(handler: Handler) -> Handler:
+            for name in names:
+                self._exact[name] = (name, handler)
+                self.stats.setdefault(name, RouteStats())
+            return handler
+        return decorator
+
+    def prefix(self, prefix: str):
+        def decorator(handler: Handler) -> Handler:
+            node = self._trie
+            for char in prefix:
+                node = node.setdefault(char, {})
+            route_name = f'{prefix}*'
+            node[_HANDLER] = (route_name, handler)
+            self.stats.setdefault(route_name, RouteStats())
+            return handler
+        return decorator
+
+    def fallback(self, handler: Handler) -> Handler:
+        self._fallback = ('<fallback>', handler)
+        self.stats.setdefault('<fallback>', RouteStats())
+        return handler
+
+    def resolve(self, data: str) -> Tuple[Optional[str], Optional[Handler], tuple]:
+        exact = self._exact.get(data)
+        if exact is not None:
+            return exact[0], exact[1], ()
+        # Longest registered prefix wins
+        node, match, depth = self._trie, None, 0
+        for index, char in enumerate(data):
+            node = node.get(char)
+            if node is None:
+                break
+            if _HANDLER in node:
+                match, depth = node[_HANDLER], index + 1
+        if match is not None:
+            return match[0], match[1], (data[depth:],)
+        if self._fallback is not None:
+            return self._fallback[0], self._fallback[1], ()
+        return None, None, ()
+
+    async def dispatch(self, update, context) -> bool:
+        route_name, handler, args = self.resolve(update.callback_query.data or '')
+        if handler is None:
+            return False
+        stats = self.stats[route_name]
+        started = time.perf_counter()
+        try:
+            await handler(update, context, *args)
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.observe('bot_callback_seconds', elapsed, route=route_name)
+            stats.count += 1
+            stats.total_seconds += elapsed
+            if elapsed > stats.max_seconds:
+                stats.max_seconds = elapsed
+        return True
+
+    def snapshot(self) -> Dict[str, Dict]:
+        return {name: stats.as_dict() for name, stats in self.stats.items() if stats.count}
+
+
+router = CallbackRouter()
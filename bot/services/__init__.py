@@ -1,4 +1,6 @@
+from bot.services.gateway_client import GatewayClient, GatewayError
+from bot.services.entitlements import Entitlement, entitlements
 from bot.services.stripe_service import StripeService
 from bot.services.mp_service import MercadoPagoService
 
-__all__ = ['StripeService', 'MercadoPagoService']
+__all__ = ['GatewayClient', 'GatewayError', 'Entitlement', 'entitlements', 'StripeService', 'MercadoPagoService']
@@ -0,0 +1,51 @@
+"""Move inline ``payments.raw_webhook_data`` into the compressed webhook_payloads archive.
+
+    python -c 'from bot.models.base import init_db; init_db()'   # adds payments.raw_payload_id first
+    python -m bot.services.archive [--batch-size N]
+
+Safe to re-run; afterwards reclaim the space with VACUUM FULL (or pg_repack) on payments.
+"""
+import logging
+
+from sqlalchemy import null
+from sqlalchemy.orm import undefer
+
+from bot.models.base import db_session
+from bot.models.payment import Payment
+from bot.models.webhook_payload import WebhookPayload
+
+logger = logging.getLogger(__name__)
+
+
+def archive_inline_payloads(batch_size: int = 500) -> int:
+    moved = 0
+    last_id = 0
+    while True:
+        payments = (
+            Payment.query
+            .options(undefer(Payment.legacy_raw_webhook_data))
+            .filter(Payment.id > last_id, Payment.raw_payload_id.is_(None))
+            .order_by(Payment.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not payments:
+            return moved
+        for payment in payments:
+            if payment.legacy_raw_webhook_data is not None:
+                payment.raw_payload = WebhookPayload.pack(payment.gateway, payment.legacy_raw_webhook_data)
+                payment.legacy_raw_webhook_data = null()
+                moved += 1
+        last_id = payments[-1].id
+        db_session.commit()
+        db_session.expunge_all()
+        logger.info('Archived payloads up to payment %s (%s moved)', last_id, moved)
+
+
+if __name__ == '__main__':
+    import argparse
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+    print(f'Payloads archived: {archive_inline_payloads(args.batch_size)}')
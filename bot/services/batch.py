@@ -0,0 +1,84 @@
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from sqlalchemy.orm import joinedload
+
+from bot.analytics.revenue import RollupDeltas
+from bot.models.user import User
+from bot.models.payment import Payment
+from bot.models.subscription import Subscription
+
+
+class BatchLookups:
+    """Rows referenced by a batch of webhook events, loaded with one ``IN`` each.
+
+    Handlers fall back to a single-row query for anything not preloaded, so
+    passing an empty ``BatchLookups()`` behaves like the unbatched path.
+    """
+
+    def __init__(self):
+        self.users: Dict[int, User] = {}
+        self.subscriptions: Dict[str, Subscription] = {}
+        self.payments: Dict[Tuple[str, str], Payment] = {}
+        # telegram_ids whose plan/status changed, for entitlement invalidation
+        self.touched: Set[int] = set()
+        # Revenue/subscription rollup increments, flushed before the batch commits
+        self.rollups = RollupDeltas()
+
+    def preload_users(self, user_ids: Iterable[int]):
+        user_ids = {user_id for user_id in user_ids if user_id} - set(self.users)
+        if user_ids:
+            for user in User.query.filter(User.id.in_(user_ids)).all():
+                self.users[user.id] = user
+
+    def preload_subscriptions(self, gateway_subscription_ids: Iterable[str]):
+        ids = {sub_id for sub_id in gateway_subscription_ids if sub_id} - set(self.subscriptions)
+        if ids:
+            subscriptions = Subscription.query.options(joinedload(Subscription.user)).filter(
+                Subscription.gateway_subscription_id.in_(ids)
+            ).all()
+            for subscription in subscriptions:
+                self.subscriptions[subscription.gateway_subscription_id] = subscription
+
+    def preload_payments(self, gateway: str, gateway_payment_ids: Iterable[str]):
+        ids = {str(payment_id) for payment_id in gateway_payment_ids if payment_id}
+        ids -= {payment_id for (_, payment_id) in self.payments}
+        if ids:
+            payments = Payment.query.filter(
+                Payment.gateway == gateway, Payment.gateway_payment_id.in_(ids)
+            ).all()
+            for payment in payments:
+                self.payments[(gateway, payment.gateway_payment_id)] = payment
+            for payment_id in ids:
+                self.payments.setdefault((gateway, payment_id), None)
+
+    def user(self, user_id: int) -> Optional[User]:
+        if user_id not in self.users:
+            self.users[user_id] = User.query.get(user_id)
+        return self.users[user_id]
+
+    def subscription(self, gateway_subscription_id: str) -> Optional[Subscription]:
+        if gateway_subscription_id not in self.subscriptions:
+            self.subscriptions[gateway_subscription_id] = Subscription.query.filter_by(
+                gateway_subscription_id=gateway_subscription_id
+            ).first()
+        return self.subscriptions[gateway_subscription_id]
+
+    def payment(self, gateway: str, gateway_payment_id: str) -> Optional[Payment]:
+        key = (gateway, str(gateway_payment_id))
+        if key not in self.payments:
+            self.payments[key] = Payment.query.filter_by(
+                gateway=gateway, gateway_payment_id=str(gateway_payment_id)
+            ).first()
+        return self.payments[key]
+
+    def touch(self, user: User):
+        self.touched.add(user.telegram_id)
+
+    def snapshot(self) -> Tuple:
+        return dict(self.users), dict(self.subscriptions), dict(self.payments), self.rollups.snapshot()
+
+    def restore(self, snapshot: Tuple):
+        # Forget rows added or swapped in (and rollup deltas staged) by a rolled back savepoint
+        users, subscriptions, payments, rollups = snapshot
+        self.users, self.subscriptions, self.payments = dict(users), dict(subscriptions), dict(payments)
+        self.rollups.restore(rollups)
@@ -0,0 +1,267 @@
+import asyncio
+import logging
+import re
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import or_
+
+from bot.utils.config import config
+from bot.models.base import db_session
+from bot.models.broadcast import Broadcast
+from bot.models.user import User
+
+logger = logging.getLogger(__name__)
+
+# /broadcast filter keys -> User columns
+SEGMENT_COLUMNS = {
+    'tier': User.subscription_tier,
+    'status': User.subscription_status,
+    'lang': User.language_code,
+    'tz': User.timezone,
+}
+
+_FILTER_TOKEN = re.compile(r'(tier|status|lang|tz)=(\S+)\s*')
+
+
+def parse_command(text: str) -> Tuple[Dict[str, List[str]], str]:
+    """``tier=pro,enterprise lang=es Hola...`` -> ({'tier': [...], 'lang': [...]}, 'Hola...')."""
+    filters: Dict[str, List[str]] = {}
+    text = (text or '').lstrip()
+    match = _FILTER_TOKEN.match(text)
+    while match:
+        filters[match.group(1)] = [value for value in match.group(2).split(',') if value]
+        text = text[match.end():]
+        match = _FILTER_TOKEN.match(text)
+    return filters, text.strip()
+
+
+def segment_query(filters: Dict[str, List[str]]):
+    query = User.query.filter(User.is_active.isnot(False))
+    for key, values in (filters or {}).items():
+        column = SEGMENT_COLUMNS.get(key)
+        if column is None or not values:
+            continue
+        # Rows created before the column defaults existed count as the default
+        default = column.default.arg if column.default is not None else None
+        condition = column.in_(values)
+        if default in values:
+            condition = or_(condition, column.is_(None))
+        query = query.filter(condition)
+    return query
+
+
+def create(text: str, created_by: int, filters: Dict[str, List[str]]) -> Broadcast:
+    broadcast = Broadcast(
+        text=text,
+        created_by=created_by,
+        filters=filters,
+        total=segment_query(filters).count()
+    )
+    db_session.add(broadcast)
+    try:
+        db_session.commit()
+    except Exception:
+        db_session.rollback()
+        raise
+    return broadcast
+
+
+def progress(broadcast: Optional[Broadcast]) -> Optional[Dict]:
+    if broadcast is None:
+        return None
+    return {
+        'id': broadcast.id,
+        'status': broadcast.status,
+        'total': broadcast.total or 0,
+        'sent': broadcast.sent or 0,
+        'blocked': broadcast.blocked or 0,
+        'failed': broadcast.failed or 0,
+    }
+
+
+def get(broadcast_id: Optional[int] = None) -> Optional[Broadcast]:
+    """A broadcast by id, or the most recent one."""
+    if broadcast_id is not None:
+        return Broadcast.query.get(broadcast_id)
+    return Broadcast.query.order_by(Broadcast.id.desc()).first()
+
+
+def cancel(broadcast_id: int) -> Optional[Broadcast]:
+    broadcast = Broadcast.query.get(broadcast_id)
+    if broadcast is not None and broadcast.status in ('pending', 'running'):
+        # The runner notices at its next checkpoint
+        broadcast.status = 'cancelled'
+        broadcast.finished_at = datetime.utcnow()
+        db_session.commit()
+    return broadcast
+
+
+def claim() -> Optional[Broadcast]:
+    """Lease a pending broadcast, or a running one whose runner stopped heartbeating."""
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=config.BROADCAST_LEASE_SECONDS)
+    broadcast = (
+        Broadcast.query
+        .filter(or_(
+            Broadcast.status == 'pending',
+            (Broadcast.status == 'running') & (Broadcast.heartbeat_at < stale)
+        ))
+        .order_by(Broadcast.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+    if broadcast is not None:
+        broadcast.status = 'running'
+        broadcast.heartbeat_at = now
+        broadcast.started_at = broadcast.started_at or now
+    db_session.commit()
+    return broadcast
+
+
+def next_chunk(filters: Dict[str, List[str]], after_user_id: int, size: int) -> List[Tuple[int, int]]:
+    """(id, telegram_id) of the next ``size`` recipients after the checkpoint.
+
+    Keyset pagination on the primary key: each chunk is a short indexed query,
+    so memory stays at one chunk and no transaction spans the whole broadcast.
+    """
+    rows = (
+        segment_query(filters)
+        .filter(User.id > after_user_id)
+        .order_by(User.id)
+        .with_entities(User.id, User.telegram_id)
+        .limit(size)
+        .all()
+    )
+    db_session.commit()
+    return rows
+
+
+def checkpoint(broadcast_id: int, last_user_id: int, sent: int, blocked: int, failed: int,
+               done: bool = False) -> str:
+    """Persist progress; returns the status, which an admin may have set to cancelled."""
+    broadcast = Broadcast.query.filter(Broadcast.id == broadcast_id).with_for_update().one()
+    if broadcast.status == 'running':
+        broadcast.last_user_id = last_user_id
+        broadcast.sent = sent
+        broadcast.blocked = blocked
+        broadcast.failed = failed
+        broadcast.heartbeat_at = datetime.utcnow()
+        if done:
+            broadcast.status = 'done'
+            broadcast.finished_at = broadcast.heartbeat_at
+    status = broadcast.status
+    db_session.commit()
+    return status
+
+
+def release(broadcast_id: int):
+    """Hand a running broadcast back on shutdown so the next runner resumes it at once."""
+    broadcast = Broadcast.query.get(broadcast_id)
+    if broadcast is not None and broadcast.status == 'running':
+        broadcast.status = 'pending'
+        db_session.commit()
+
+
+async def send(bot, telegram_id: int, text: str, semaphore: asyncio.Semaphore) -> str:
+    from telegram.error import BadRequest, Forbidden
+    async with semaphore:
+        try:
+            await bot.send_message(chat_id=telegram_id, text=text)
+            return 'sent'
+        except Forbidden:
+            return 'blocked'
+        except BadRequest as e:
+            logger.warning('Broadcast to %s failed: %s', telegram_id, e)
+            return 'failed'
+        except Exception:
+            logger.exception('Broadcast to %s failed', telegram_id)
+            return 'failed'
+
+
+async def run(broadcast: Broadcast, bot, stop: Optional[threading.Event] = None) -> str:
+    """Send a claimed broadcast chunk by chunk, checkpointing after each one.
+
+    A crash re-sends at most the chunk in flight; everything before
+    ``last_user_id`` is never touched again.
+    """
+    broadcast_id, text, filters = broadcast.id, broadcast.text, broadcast.filters or {}
+    last_user_id = broadcast.last_user_id or 0
+    counts = {
+        'sent': broadcast.sent or 0,
+        'blocked': broadcast.blocked or 0,
+        'failed': broadcast.failed or 0,
+    }
+    semaphore = asyncio.Semaphore(config.BROADCAST_CONCURRENCY)
+    logger.info('Broadcast %s starting after user %s', broadcast_id, last_user_id)
+
+    while True:
+        if stop is not None and stop.is_set():
+            release(broadcast_id)
+            return 'pending'
+        chunk = next_chunk(filters, last_user_id, config.BROADCAST_CHUNK_SIZE)
+        if chunk:
+            results = await asyncio.gather(*[
+                send(bot, telegram_id, text, semaphore) for _, telegram_id in chunk
+            ])
+            for result in results:
+                counts[result] += 1
+            last_user_id = chunk[-1][0]
+        status = checkpoint(broadcast_id, last_user_id, done=not chunk, **counts)
+        if status != 'running':
+            logger.info('Broadcast %s %s: %s', broadcast_id, status, counts)
+            return status
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def broadcast_rate() -> float:
+    """BROADCAST_RATE, capped so it plus the web dynos' rate fits Telegram's global limit."""
+    from bot.rate_limiter import TELEGRAM_GLOBAL_RATE
+    headroom = TELEGRAM_GLOBAL_RATE - config.OUTBOUND_GLOBAL_RATE
+    if headroom <= 0:
+        raise ValueError(
+            f'OUTBOUND_GLOBAL_RATE={config.OUTBOUND_GLOBAL_RATE:g} no deja cupo para difusiones '
+            f'(limite de Telegram {TELEGRAM_GLOBAL_RATE:g}/s)'
+        )
+    if config.BROADCAST_RATE > headroom:
+        logger.warning('BROADCAST_RATE=%g capped to %g/s to stay within Telegram limits',
+                       config.BROADCAST_RATE, headroom)
+    return min(config.BROADCAST_RATE, headroom)
+
+
+def build_bot():
+    """Bot for worker-side sends; every bot in the process shares one limiter."""
+    global _limiter
+    from telegram.ext import ExtBot
+    from bot.rate_limiter import OutboundRateLimiter
+    with _limiter_lock:
+        if _limiter is None:
+            # Broadcasts and expiry reminders run on separate threads of the same worker
+            _limiter = OutboundRateLimiter(global_rate=broadcast_rate(), max_retries=config.OUTBOUND_MAX_RETRIES)
+    return ExtBot(config.TELEGRAM_TOKEN, base_url=config.TELEGRAM_API_BASE, rate_limiter=_limiter)
+
+
+async def _runner(stop: threading.Event, poll_interval: float):
+    bot = build_bot()
+    async with bot:
+        while not stop.is_set():
+            try:
+                broadcast = claim()
+                if broadcast is not None:
+                    await run(broadcast, bot, stop)
+                    continue
+            except Exception:
+                logger.exception('Broadcast runner error')
+                db_session.rollback()
+            await asyncio.sleep(poll_interval)
+    db_session.remove()
+
+
+def run_forever(stop: threading.Event, poll_interval: float = 5.0):
+    """Broadcast loop for the worker process; DB calls stay on this thread's session."""
+    asyncio.run(_runner(stop, poll_interval))
@@ -0,0 +1,146 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional, Tuple
+
+from bot.menus import TIERS
+from bot.utils.cache import TTLCache
+from bot.utils.config import config
+from bot.utils.redis_client import get_redis, local_ttl, use_redis
+from bot.models.base import Session, get_engine
+from bot.models.user import User
+
+GATEWAYS = ('stripe', 'mercadopago')
+
+# Stripe rejects Checkout Sessions that expire in less than 30 minutes
+MIN_STRIPE_EXPIRY = timedelta(minutes=31)
+# A reused link stays valid at least this long after it is handed out
+EXPIRY_MARGIN = timedelta(minutes=10)
+
+
+def get_or_create_user(tg_user) -> User:
+    """Detached ``User`` for a Telegram user, inserted on first purchase attempt."""
+    with Session(bind=get_engine(), expire_on_commit=False) as session:
+        user = session.query(User).filter_by(telegram_id=tg_user.id).first()
+        if user is None:
+            user = User(
+                telegram_id=tg_user.id,
+                username=tg_user.username,
+                first_name=tg_user.first_name,
+                last_name=tg_user.last_name,
+                language_code=tg_user.language_code or 'es'
+            )
+            session.add(user)
+            session.commit()
+        return user
+
+
+class CheckoutLinks:
+    """Checkout URL per (telegram_id, tier, gateway), reused until it nears expiry.
+
+    Links are created to expire ``ttl`` plus a margin after creation and are
+    cached for ``ttl``, so a reused link always has time left. Concurrent taps
+    on the same key in this process await a single in-flight creation. With
+    CACHE_BACKEND=redis the links are shared by every worker; payments are
+    applied by bot.worker, so without Redis a paid user's link is kept in the
+    web dynos for at most LOCAL_CACHE_TTL.
+    """
+
+    KEY = 'checkout:{}:{}:{}'
+
+    def __init__(self, maxsize: int = 20000, ttl: int = 1200):
+        self.ttl = ttl
+        self._local = TTLCache(maxsize, local_ttl(ttl))
+        self._inflight: Dict[Tuple, asyncio.Future] = {}
+        self.created = 0
+        self.reused = 0
+        self.shared = 0
+
+    def cached(self, telegram_id: int, tier: str, gateway: str) -> Optional[str]:
+        if use_redis():
+            url = get_redis().get(self.KEY.format(telegram_id, tier, gateway))
+            return url.decode() if isinstance(url, bytes) else url
+        return self._local.get((telegram_id, tier, gateway))
+
+    def store(self, telegram_id: int, tier: str, gateway: str, url: str):
+        if use_redis():
+            get_redis().setex(self.KEY.format(telegram_id, tier, gateway), self.ttl, url)
+        else:
+            self._local.set((telegram_id, tier, gateway), url)
+
+    def invalidate_many(self, telegram_ids: Iterable[int]):
+        """Drop links of users who just paid, so a completed session is not offered again."""
+        keys = [
+            (telegram_id, tier, gateway)
+            for telegram_id in telegram_ids if telegram_id
+            for tier in TIERS for gateway in GATEWAYS
+        ]
+        if not keys:
+            return
+        if use_redis():
+            get_redis().delete(*(self.KEY.format(*key) for key in keys))
+        else:
+            for key in keys:
+                self._local.pop(key)
+
+    async def get(self, tg_user, tier: str, gateway: str) -> str:
+        key = (tg_user.id, tier, gateway)
+        if use_redis():
+            url = await asyncio.to_thread(self.cached, *key)
+        else:
+            url = self.cached(*key)
+        if url:
+            self.reused += 1
+            return url
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.shared += 1
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            url = await self._create(tg_user, tier, gateway)
+            if use_redis():
+                await asyncio.to_thread(self.store, *key, url)
+            else:
+                self.store(*key, url)
+        except BaseException as exc:
+            if isinstance(exc, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(exc)
+                # Nobody may be waiting on the shared future; mark the error as seen
+                future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        future.set_result(url)
+        self.created += 1
+        return url
+
+    async def _create(self, tg_user, tier: str, gateway: str) -> str:
+        user = await asyncio.to_thread(get_or_create_user, tg_user)
+        lifetime = timedelta(seconds=self.ttl) + EXPIRY_MARGIN
+        if gateway == 'stripe':
+            from bot.services.stripe_service import StripeService
+            expires_at = datetime.now(timezone.utc) + max(lifetime, MIN_STRIPE_EXPIRY)
+            session = await StripeService.create_checkout_session_async(user, tier, expires_at=expires_at)
+            return session['url']
+        if gateway == 'mercadopago':
+            from bot.services.mp_service import MercadoPagoService
+            expires_at = datetime.now(timezone.utc) + lifetime
+            preference = await MercadoPagoService.create_preference_async(user, tier, expires_at=expires_at)
+            return preference['init_point']
+        raise ValueError(f'Gateway {gateway} no valido')
+
+    def stats(self) -> Dict:
+        return {
+            'created': self.created,
+            'reused': self.reused,
+            'shared': self.shared,
+            'inflight': len(self._inflight),
+        }
+
+
+checkout_links = CheckoutLinks(config.CHECKOUT_CACHE_SIZE, config.CHECKOUT_LINK_TTL)
@@ -0,0 +1,76 @@
+from typing import Optional
+
+from bot.utils.cache import TTLCache
+from bot.utils.config import config
+from bot.models.base import Session, db_session, dialect_insert, get_engine
+from bot.models.gateway_customer import GatewayCustomer
+from bot.models.payment import Payment
+
+
+class CustomerDirectory:
+    """Gateway customer id per (user, gateway): a per-process LRU over ``gateway_customers``.
+
+    A mapping never changes once written, so cache entries need no
+    invalidation; the first writer wins through the unique constraint.
+    """
+
+    def __init__(self, maxsize: int = 50000):
+        self._local = TTLCache(maxsize, ttl=24 * 3600)
+
+    def cached(self, user_id: int, gateway: str) -> Optional[str]:
+        return self._local.get((user_id, gateway))
+
+    def get(self, user_id: int, gateway: str) -> Optional[str]:
+        customer_id = self.cached(user_id, gateway)
+        if customer_id:
+            return customer_id
+        # Own short-lived session: callers run this from executor threads
+        with Session(bind=get_engine()) as session:
+            customer_id = session.query(GatewayCustomer.customer_id).filter_by(
+                user_id=user_id, gateway=gateway
+            ).scalar()
+            if customer_id is None:
+                # Users who paid before the mapping existed
+                customer_id = session.query(Payment.gateway_customer_id).filter(
+                    Payment.user_id == user_id,
+                    Payment.gateway == gateway,
+                    Payment.gateway_customer_id.isnot(None)
+                ).order_by(Payment.created_at).limit(1).scalar()
+                if customer_id:
+                    customer_id = self._save(session, user_id, gateway, customer_id)
+        if customer_id:
+            self._local.set((user_id, gateway), customer_id)
+        return customer_id
+
+    def remember(self, user_id: int, gateway: str, customer_id: str) -> str:
+        """Store a freshly created customer; returns whichever id won a concurrent race."""
+        with Session(bind=get_engine()) as session:
+            customer_id = self._save(session, user_id, gateway, customer_id)
+        self._local.set((user_id, gateway), customer_id)
+        return customer_id
+
+    def stage(self, user_id: int, gateway: str, customer_id: str):
+        """Add the mapping inside the caller's ``db_session`` transaction (webhook batches)."""
+        if not customer_id or self.cached(user_id, gateway):
+            return
+        self._insert(db_session, user_id, gateway, customer_id)
+
+    @staticmethod
+    def _insert(session, user_id: int, gateway: str, customer_id: str):
+        insert = dialect_insert(session)
+        session.execute(
+            insert(GatewayCustomer)
+            .values(user_id=user_id, gateway=gateway, customer_id=customer_id)
+            .on_conflict_do_nothing(index_elements=['user_id', 'gateway'])
+        )
+
+    @staticmethod
+    def _save(session, user_id: int, gateway: str, customer_id: str) -> str:
+        CustomerDirectory._insert(session, user_id, gateway, customer_id)
+        session.commit()
+        return session.query(GatewayCustomer.customer_id).filter_by(
+            user_id=user_id, gateway=gateway
+        ).scalar()
+
+
+customers = CustomerDirectory(config.CUSTOMER_CACHE_SIZE)
@@ -0,0 +1,109 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable, Optional
+
+from bot.utils.cache import TTLCache
+from bot.utils.config import config
+from bot.utils.redis_client import get_redis, local_ttl, use_redis
+from bot.models.base import Session, get_engine
+from bot.models.user import User
+
+
+@dataclass(frozen=True)
+class Entitlement:
+    tier: str = 'free'
+    status: str = 'inactive'
+    expires_at: Optional[datetime] = None
+
+    @property
+    def is_paid(self) -> bool:
+        return (
+            self.tier != 'free' and
+            self.status == 'active' and
+            (self.expires_at is None or self.expires_at > datetime.utcnow())
+        )
+
+
+class EntitlementCache:
+    """Plan/status per telegram_id so buttons don't query ``users`` on every tap.
+
+    Per-process TTL+LRU by default; with CACHE_BACKEND=redis the entries live
+    in Redis so an invalidation from one gunicorn worker reaches all of them.
+    Webhooks and expiries are applied by bot.worker, whose invalidations reach
+    the per-process caches only through Redis; without it they expire after
+    LOCAL_CACHE_TTL instead.
+    """
+
+    KEY = 'entitlement:{}'
+
+    def __init__(self, maxsize: int = 50000, ttl: int = 300):
+        self.ttl = ttl
+        self._local = TTLCache(maxsize, local_ttl(ttl))
+
+    def get(self, telegram_id: int) -> Entitlement:
+        if use_redis():
+            cached = get_redis().hgetall(self.KEY.format(telegram_id))
+            if cached:
+                return self._decode(cached)
+        else:
+            cached = self._local.get(telegram_id)
+            if cached is not None:
+                return cached
+
+        entitlement = self._load(telegram_id)
+        self.set(telegram_id, entitlement)
+        return entitlement
+
+    def set(self, telegram_id: int, entitlement: Entitlement):
+        if use_redis():
+            key = self.KEY.format(telegram_id)
+            pipe = get_redis().pipeline()
+            pipe.hset(key, mapping=self._encode(entitlement))
+            pipe.expire(key, self.ttl)
+            pipe.execute()
+        else:
+            self._local.set(telegram_id, entitlement)
+
+    def invalidate(self, telegram_id: int):
+        self.invalidate_many([telegram_id])
+
+    def invalidate_many(self, telegram_ids: Iterable[int]):
+        telegram_ids = [telegram_id for telegram_id in telegram_ids if telegram_id]
+        if not telegram_ids:
+            return
+        if use_redis():
+            get_redis().delete(*(self.KEY.format(telegram_id) for telegram_id in telegram_ids))
+        else:
+            for telegram_id in telegram_ids:
+                self._local.pop(telegram_id)
+
+    @staticmethod
+    def _load(telegram_id: int) -> Entitlement:
+        # Own short-lived session: callers run this from executor threads
+        with Session(bind=get_engine()) as session:
+            row = session.query(
+                User.subscription_tier, User.subscription_status, User.subscription_expires_at
+            ).filter_by(telegram_id=telegram_id).first()
+        if row is None:
+            return Entitlement()
+        return Entitlement(row[0] or 'free', row[1] or 'inactive', row[2])
+
+    @staticmethod
+    def _encode(entitlement: Entitlement) -> dict:
+        return {
+            'tier': entitlement.tier,
+            'status': entitlement.status,
+            'expires_at': entitlement.expires_at.isoformat() if entitlement.expires_at else '',
+        }
+
+    @staticmethod
+    def _decode(data: dict) -> Entitlement:
+        expires_at = data.get('expires_at')
+        return Entitlement(
+            data.get('tier', 'free'),
+            data.get('status', 'inactive'),
+            datetime.fromisoformat(expires_at) if expires_at else None,
+        )
+
+
+entitlements = EntitlementCache(config.ENTITLEMENT_CACHE_SIZE, config.ENTITLEMENT_TTL)
@@ -0,0 +1,226 @@
+"""Subscription expiry sweeper: downgrades lapsed plans and queues renewal reminders.
+
+    python -m bot.services.expiry   # one sweep now (the worker runs it every EXPIRY_SWEEP_INTERVAL)
+"""
+import asyncio
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, exists, or_
+
+from bot.utils.config import config
+from bot.analytics.revenue import RollupDeltas
+from bot.models.base import advisory_lock, db_session, dialect_insert
+from bot.models.notification import Notification
+from bot.models.subscription import Subscription
+from bot.models.user import User
+from bot.services.entitlements import entitlements
+from bot.utils.redis_client import warn_without_shared_cache
+
+logger = logging.getLogger(__name__)
+
+LOCK_NAME = 'bot.services.expiry'
+
+# Statuses whose access ends with the period unless a renewal webhook moves it
+LAPSING = ('active', 'past_due', 'unpaid')
+
+REMINDER_TEXT = {
+    True: '⏳ Tu plan {tier} vence el {date}. Renuévalo desde /start para no perder el acceso.',
+    False: '🔄 Tu plan {tier} se renueva automáticamente el {date}.',
+}
+
+
+def expire_batch(now: datetime, size: int) -> int:
+    """Expire up to ``size`` subscriptions past their period end plus the grace period.
+
+    Rows leave ``LAPSING`` once updated, so each batch is the head of the
+    ``(status, current_period_end)`` index range and no cursor is needed.
+    """
+    cutoff = now - timedelta(hours=config.EXPIRY_GRACE_HOURS)
+    rows = (
+        db_session.query(
+            Subscription.id, Subscription.user_id, Subscription.gateway,
+            Subscription.tier, Subscription.currency, Subscription.amount
+        )
+        .filter(Subscription.status.in_(LAPSING), Subscription.current_period_end < cutoff)
+        .order_by(Subscription.current_period_end)
+        .limit(size)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    if not rows:
+        db_session.commit()
+        return 0
+
+    db_session.query(Subscription).filter(Subscription.id.in_([row.id for row in rows])).update(
+        {'status': 'expired', 'is_active': False}, synchronize_session=False
+    )
+    # Only users left without another live subscription lose their plan
+    user_ids = {row.user_id for row in rows}
+    live = exists().where(and_(
+        Subscription.user_id == User.id,
+        Subscription.status == 'active',
+        or_(Subscription.current_period_end.is_(None), Subscription.current_period_end >= cutoff)
+    ))
+    db_session.query(User).filter(User.id.in_(user_ids), ~live).update(
+        {'subscription_tier': 'free', 'subscription_status': 'inactive'}, synchronize_session=False
+    )
+    telegram_ids = [telegram_id for telegram_id, in db_session.query(User.telegram_id).filter(User.id.in_(user_ids))]
+
+    rollups = RollupDeltas()
+    for row in rows:
+        rollups.subscription(row, 'cancelled')
+    rollups.flush()
+    db_session.commit()
+    entitlements.invalidate_many(telegram_ids)
+    return len(rows)
+
+
+def queue_reminders(now: datetime, size: int) -> int:
+    """Queue one reminder per subscription whose period ends within RENEWAL_REMINDER_DAYS."""
+    until = now + timedelta(days=config.RENEWAL_REMINDER_DAYS)
+    insert = dialect_insert()
+    queued, after = 0, (now, 0)
+    while True:
+        # Keyset on (period_end, id) so the scan walks the index once
+        rows = (
+            db_session.query(
+                Subscription.id, Subscription.user_id, Subscription.tier,
+                Subscription.current_period_end, Subscription.cancel_at_period_end, User.telegram_id
+            )
+            .join(User, User.id == Subscription.user_id)
+            .filter(
+                Subscription.status == 'active',
+                Subscription.current_period_end <= until,
+                or_(
+                    Subscription.current_period_end > after[0],
+                    and_(Subscription.current_period_end == after[0], Subscription.id > after[1])
+                )
+            )
+            .order_by(Subscription.current_period_end, Subscription.id)
+            .limit(size)
+            .all()
+        )
+        if not rows:
+            break
+        values = [
+            {
+                'key': f'renewal:{row.id}:{row.current_period_end:%Y%m%d}',
+                'user_id': row.user_id,
+                'telegram_id': row.telegram_id,
+                'kind': 'renewal',
+                'text': REMINDER_TEXT[bool(row.cancel_at_period_end)].format(
+                    tier=row.tier.title(), date=row.current_period_end.strftime('%d/%m/%Y')
+                ),
+                'status': 'pending',
+                'created_at': now,
+            }
+            for row in rows
+        ]
+        result = db_session.execute(
+            insert(Notification).values(values).on_conflict_do_nothing(index_elements=['key'])
+        )
+        db_session.commit()
+        queued += max(result.rowcount or 0, 0)
+        after = (rows[-1].current_period_end, rows[-1].id)
+    return queued
+
+
+def pending_notifications(size: int) -> List[Notification]:
+    notifications = (
+        Notification.query
+        .filter(Notification.status == 'pending')
+        .order_by(Notification.id)
+        .limit(size)
+        .all()
+    )
+    db_session.commit()
+    return notifications
+
+
+def mark_notifications(results: Dict[int, str]):
+    now = datetime.utcnow()
+    for status in set(results.values()):
+        ids = [notification_id for notification_id, result in results.items() if result == status]
+        Notification.query.filter(Notification.id.in_(ids)).update(
+            {'status': status, 'sent_at': now}, synchronize_session=False
+        )
+    db_session.commit()
+
+
+async def deliver(bot, size: int) -> int:
+    """Send queued notifications chunk by chunk; a crash re-sends at most one chunk."""
+    from bot.services.broadcast import send
+    semaphore = asyncio.Semaphore(config.BROADCAST_CONCURRENCY)
+    delivered = 0
+    while True:
+        notifications = pending_notifications(size)
+        if not notifications:
+            return delivered
+        results = await asyncio.gather(*[
+            send(bot, notification.telegram_id, notification.text, semaphore)
+            for notification in notifications
+        ])
+        mark_notifications({
+            notification.id: result for notification, result in zip(notifications, results)
+        })
+        delivered += len(notifications)
+
+
+async def sweep(bot=None, now: Optional[datetime] = None) -> Optional[Dict]:
+    """One full pass; returns None when another process holds the sweeper lock."""
+    with advisory_lock(LOCK_NAME) as acquired:
+        if not acquired:
+            return None
+        now = now or datetime.utcnow()
+        size = config.EXPIRY_BATCH_SIZE
+        expired = 0
+        while True:
+            count = expire_batch(now, size)
+            expired += count
+            if count < size:
+                break
+        result = {'expired': expired, 'reminders': queue_reminders(now, size), 'delivered': 0}
+        if bot is not None:
+            result['delivered'] = await deliver(bot, size)
+        logger.info('Expiry sweep: %s', result)
+        return result
+
+
+async def _runner(stop: threading.Event, interval: float):
+    from bot.services.broadcast import build_bot
+    bot = build_bot()
+    async with bot:
+        while not stop.is_set():
+            try:
+                await sweep(bot)
+            except Exception:
+                logger.exception('Expiry sweep failed')
+                db_session.rollback()
+            await asyncio.to_thread(stop.wait, interval)
+    db_session.remove()
+
+
+def run_forever(stop: threading.Event, interval: float = None):
+    """Sweeper loop for the worker process; every dyno runs it, one at a time holds the lock."""
+    asyncio.run(_runner(stop, interval or config.EXPIRY_SWEEP_INTERVAL))
+
+
+if __name__ == '__main__':
+    import argparse
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--no-send', action='store_true', help='solo encolar recordatorios, sin enviarlos')
+    args = parser.parse_args()
+    warn_without_shared_cache('bot.services.expiry')
+
+    async def _once():
+        if args.no_send:
+            return await sweep()
+        from bot.services.broadcast import build_bot
+        async with build_bot() as bot:
+            return await sweep(bot)
+
+    print(f'Expiry sweep: {asyncio.run(_once())}')
@@ -0,0 +1,129 @@
+import asyncio
+import re
+from typing import Dict, Optional
+
+from bot.utils.config import config
+from bot.utils.metrics import metrics
+from bot.utils.registry import registry
+
+
+# Path segments holding ids (digits, or Stripe-style cus_xxx; not /v1) become :id in metric labels
+_ID_SEGMENT = re.compile(r'/(?!v\d+(?:/|$))(?=[^/]*\d)[^/]+')
+
+
+def operation_label(method: str, path: str) -> str:
+    return f"{method} {_ID_SEGMENT.sub('/:id', path.split('?', 1)[0])}"
+
+
+class GatewayError(Exception):
+    def __init__(self, gateway: str, status_code: int, body: str):
+        super().__init__(f'{gateway} API error {status_code}: {body[:200]}')
+        self.gateway = gateway
+        self.status_code = status_code
+        self.body = body
+
+
+class GatewayClient:
+    """Keep-alive httpx pool for one payment gateway with a concurrency cap.
+
+    The underlying ``httpx.AsyncClient`` and semaphore are bound to the event
+    loop that first uses them and are rebuilt if a different loop shows up.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        headers: Dict[str, str],
+        max_connections: int = 20,
+        max_concurrency: int = 10,
+        timeout: float = 10.0,
+    ):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.headers = headers
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._client = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _ensure_client(self):
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            import httpx
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._client
+
+    async def request(self, method: str, path: str, **kwargs) -> Dict:
+        client = self._ensure_client()
+        async with self._semaphore:
+            with metrics.timer('gateway_request_seconds', gateway=self.name,
+                               operation=operation_label(method, path)):
+                response = await client.request(method, path, **kwargs)
+        if response.status_code >= 400:
+            raise GatewayError(self.name, response.status_code, response.text)
+        return response.json()
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def encode_form(data: Dict, prefix: str = '') -> Dict[str, str]:
+    """Flatten nested params into Stripe's ``a[b][0][c]=v`` form encoding.
+
+    List items are indexed, so every key is unique and the result can go to
+    httpx as ``data=`` (it treats anything but a dict as a raw body).
+    """
+    fields = {}
+    items = data.items() if isinstance(data, dict) else enumerate(data)
+    for key, value in items:
+        name = f'{prefix}[{key}]' if prefix else str(key)
+        if value is None:
+            continue
+        if isinstance(value, (dict, list, tuple)):
+            fields.update(encode_form(value, name))
+        elif isinstance(value, bool):
+            fields[name] = 'true' if value else 'false'
+        else:
+            fields[name] = str(value)
+    return fields
+
+
+def _create_stripe_http():
+    return GatewayClient(
+        'stripe',
+        config.STRIPE_API_BASE,
+        {'Authorization': f'Bearer {config.STRIPE_SECRET_KEY}'},
+        max_connections=config.GATEWAY_MAX_CONNECTIONS,
+        max_concurrency=config.STRIPE_MAX_CONCURRENCY,
+        timeout=config.GATEWAY_TIMEOUT,
+    )
+
+
+def _create_mp_http():
+    return GatewayClient(
+        'mercadopago',
+        config.MP_API_BASE,
+        {'Authorization': f'Bearer {config.MP_ACCESS_TOKEN}'},
+        max_connections=config.GATEWAY_MAX_CONNECTIONS,
+        max_concurrency=config.MP_MAX_CONCURRENCY,
+        timeout=config.GATEWAY_TIMEOUT,
+    )
+
+
+registry.register('stripe_http', _create_stripe_http)
+registry.register('mp_http', _create_mp_http)
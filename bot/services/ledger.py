@@ -0,0 +1,81 @@
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional, Set, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+from bot.utils.config import config
+from bot.models.base import db_session
+from bot.models.processed_event import ProcessedEvent
+
+CONSTRAINT = 'uq_processed_events_gateway_event'
+
+
+class EventLedger:
+    """Processed gateway events: an in-memory LRU in front of ``processed_events``.
+
+    ``record()`` only stages the ledger row; it becomes durable with the same
+    commit as the event's side effects, and the unique (gateway, event_id)
+    constraint turns a concurrent duplicate into an IntegrityError.
+    """
+
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        self._recent: 'OrderedDict[Tuple[str, str], None]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def remember(self, gateway: str, event_id: str):
+        key = (gateway, str(event_id))
+        with self._lock:
+            self._recent[key] = None
+            self._recent.move_to_end(key)
+            if len(self._recent) > self.maxsize:
+                self._recent.popitem(last=False)
+
+    def seen(self, gateway: str, event_id: str) -> bool:
+        key = (gateway, str(event_id))
+        with self._lock:
+            if key in self._recent:
+                self._recent.move_to_end(key)
+                return True
+        found = db_session.query(ProcessedEvent.id).filter_by(
+            gateway=gateway, event_id=str(event_id)
+        ).first() is not None
+        if found:
+            self.remember(gateway, event_id)
+        return found
+
+    def seen_many(self, gateway: str, event_ids: Iterable[str]) -> Set[str]:
+        """Subset of ``event_ids`` already processed, with one ``IN`` query for the misses."""
+        event_ids = {str(event_id) for event_id in event_ids}
+        with self._lock:
+            found = {event_id for event_id in event_ids if (gateway, event_id) in self._recent}
+        missing = event_ids - found
+        if missing:
+            rows = db_session.query(ProcessedEvent.event_id).filter(
+                ProcessedEvent.gateway == gateway,
+                ProcessedEvent.event_id.in_(missing)
+            ).all()
+            for (event_id,) in rows:
+                found.add(event_id)
+                self.remember(gateway, event_id)
+        return found
+
+    def record(self, gateway: str, event_id: str, event_type: Optional[str] = None):
+        db_session.add(ProcessedEvent(gateway=gateway, event_id=str(event_id), event_type=event_type))
+
+    @staticmethod
+    def is_duplicate(error: IntegrityError) -> bool:
+        """Whether ``error`` came from the ledger's unique key, i.e. the event was already applied.
+
+        Any other constraint (a payment or subscription unique key, a NOT NULL)
+        is a real failure the caller should retry.
+        """
+        constraint = getattr(getattr(error.orig, 'diag', None), 'constraint_name', None)
+        if constraint is not None:
+            return constraint == CONSTRAINT
+        # SQLite names the columns instead of the constraint
+        return 'processed_events.' in str(error.orig)
+
+
+event_ledger = EventLedger(config.LEDGER_CACHE_SIZE)
@@ -1,11 +1,32 @@
-import mercadopago
-from typing import Dict, Optional
+import asyncio
+import hashlib
+import hmac
+import logging
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.exc import IntegrityError
 from bot.utils.config import config
+from bot.utils.registry import registry
+from bot.utils.metrics import metrics
+from bot.services import gateway_client  # noqa: F401 (registers mp_http)
+from bot.services.ledger import event_ledger
+from bot.services.batch import BatchLookups
+from bot.services.checkout import checkout_links
+from bot.services.entitlements import entitlements
 from bot.models.user import User
 from bot.models.payment import Payment
+from bot.models.webhook_payload import WebhookPayload
 from bot.models.base import db_session
+from datetime import datetime
 
-mp = mercadopago.SDK(config.MP_ACCESS_TOKEN)
+logger = logging.getLogger(__name__)
+
+
+def _create_mp():
+    import mercadopago
+    return mercadopago.SDK(config.MP_ACCESS_TOKEN)
+
+
+registry.register('mercadopago', _create_mp)
 
 
 class MercadoPagoService:
@@ -14,9 +35,20 @@ class MercadoPagoService:
         'pro': 29.00,
         'enterprise': 99.00
     }
+    # Statuses after which further notifications for a payment are ignored;
+    # an approved payment can still be refunded or charged back
+    FINAL_STATUSES = ('rejected', 'cancelled', 'refunded', 'charged_back')
+    # MercadoPago payment status -> local Payment.status
+    PAYMENT_STATUSES = {
+        'approved': 'completed',
+        'refunded': 'refunded',
+        'charged_back': 'refunded',
+        'rejected': 'failed',
+        'cancelled': 'failed',
+    }
 
     @staticmethod
-    def create_preference(user: User, tier: str) -> Dict:
+    def _preference_data(user: User, tier: str, expires_at: Optional[datetime] = None) -> Dict:
         price = MercadoPagoService.TIER_PRICES.get(tier, 9.00)
         preference_data = {
             'items': [{
@@ -44,46 +76,255 @@ class MercadoPagoService:
                 'tier': tier
             }
         }
-        preference_response = mp.preference().create(preference_data)
+        if expires_at:
+            preference_data['expires'] = True
+            preference_data['expiration_date_to'] = expires_at.isoformat(timespec='milliseconds')
+        return preference_data
+
+    @staticmethod
+    def create_preference(user: User, tier: str, expires_at: Optional[datetime] = None) -> Dict:
+        mp = registry.get('mercadopago')
+        with metrics.timer('gateway_request_seconds', gateway='mercadopago', operation='POST /checkout/preferences'):
+            preference_response = mp.preference().create(
+                MercadoPagoService._preference_data(user, tier, expires_at)
+            )
         return preference_response['response']
 
+    @staticmethod
+    async def create_preference_async(user: User, tier: str, expires_at: Optional[datetime] = None) -> Dict:
+        client = registry.get('mp_http')
+        return await client.request(
+            'POST', '/checkout/preferences', json=MercadoPagoService._preference_data(user, tier, expires_at)
+        )
+
+    @staticmethod
+    def verify_signature(data_id: str, request_id: str, signature_header: str) -> bool:
+        if not config.MP_WEBHOOK_SECRET:
+            return True
+        parts = dict(
+            part.strip().split('=', 1) for part in (signature_header or '').split(',') if '=' in part
+        )
+        ts, received = parts.get('ts'), parts.get('v1')
+        if not ts or not received:
+            return False
+        manifest = f'id:{data_id};request-id:{request_id};ts:{ts};'
+        expected = hmac.new(
+            config.MP_WEBHOOK_SECRET.encode(), manifest.encode(), hashlib.sha256
+        ).hexdigest()
+        return hmac.compare_digest(expected, received)
+
     @staticmethod
     def process_webhook(data: Dict) -> Optional[Payment]:
-        payment_id = data.get('data', {}).get('id')
-        if not payment_id:
-            return None
+        return MercadoPagoService.process_batch([data])[0][1]
 
-        payment_info = mp.payment().get(payment_id)
-        payment_data = payment_info['response']
-        status = payment_data.get('status')
-        external_ref = payment_data.get('external_reference', '')
+    @staticmethod
+    async def process_webhook_async(data: Dict) -> Optional[Payment]:
+        # Ledger lookups and the batch commit block, so they run off the event loop
+        pending = await asyncio.to_thread(MercadoPagoService._pending_notifications_released, [data])
+        fetched = {}
+        if pending:
+            client = registry.get('mp_http')
+            for index, payment_id in pending.items():
+                fetched[index] = await client.request('GET', f'/v1/payments/{payment_id}')
+        results = await asyncio.to_thread(MercadoPagoService._record_batch, [data], pending, fetched)
+        return results[0][1]
 
-        if '|' in external_ref:
-            user_id, tier = external_ref.split('|')
-            user_id = int(user_id)
-        else:
+    @staticmethod
+    def process_batch(notifications: List[Dict]) -> List[Tuple[str, Optional[Payment]]]:
+        """Fetch and apply many notifications with one commit, one savepoint each.
+
+        Statuses: 'success', 'ignored' (no payment or unknown user),
+        'duplicate' and 'error'.
+        """
+        pending = MercadoPagoService._pending_notifications(notifications)
+        fetched = {}
+        by_payment = {}
+        if pending:
+            mp = registry.get('mercadopago')
+        for index, payment_id in pending.items():
+            if payment_id not in by_payment:
+                try:
+                    with metrics.timer('gateway_request_seconds', gateway='mercadopago',
+                                       operation='GET /v1/payments/:id'):
+                        by_payment[payment_id] = mp.payment().get(payment_id)['response']
+                except Exception as e:
+                    logger.exception('MercadoPago payment %s fetch failed', payment_id)
+                    by_payment[payment_id] = e
+            fetched[index] = by_payment[payment_id]
+        return MercadoPagoService._record_batch(notifications, pending, fetched)
+
+    @staticmethod
+    def apply_payments(payments: List[Dict]) -> List[Tuple[str, Optional[Payment]]]:
+        """Apply already fetched payment objects (e.g. from the search API) as one batch."""
+        notifications = [{'data': {'id': payment_data['id']}} for payment_data in payments]
+        pending = MercadoPagoService._pending_notifications(notifications)
+        fetched = {index: payments[index] for index in pending}
+        return MercadoPagoService._record_batch(notifications, pending, fetched)
+
+    @staticmethod
+    def payment_status(status: Optional[str]) -> str:
+        return MercadoPagoService.PAYMENT_STATUSES.get(status, 'pending')
+
+    @staticmethod
+    def _ledger_keys(data: Dict, payment_id, payment_status: Optional[str] = None) -> List[Tuple[str, Optional[str]]]:
+        keys = []
+        if data.get('id'):
+            keys.append((str(data['id']), data.get('action')))
+        if payment_status is None or payment_status in MercadoPagoService.FINAL_STATUSES:
+            keys.append((f'payment:{payment_id}', payment_status))
+        if payment_status is not None:
+            # Each status of a payment is applied once, however many notifications report it
+            keys.append((f'payment:{payment_id}:{payment_status}', payment_status))
+        return keys
+
+    @staticmethod
+    def _pending_notifications(notifications: List[Dict]) -> Dict[int, str]:
+        """Index -> payment id of notifications that still need a fetch."""
+        # MercadoPago sends several notifications per payment; once a payment
+        # reached a final status there is nothing left to fetch for it
+        candidates = {}
+        for index, data in enumerate(notifications):
+            payment_id = data.get('data', {}).get('id')
+            if payment_id:
+                candidates[index] = str(payment_id)
+        seen = event_ledger.seen_many('mercadopago', [
+            key for index, payment_id in candidates.items()
+            for key, _ in MercadoPagoService._ledger_keys(notifications[index], payment_id)
+        ])
+        return {
+            index: payment_id for index, payment_id in candidates.items()
+            if not any(key in seen for key, _ in MercadoPagoService._ledger_keys(notifications[index], payment_id))
+        }
+
+    @staticmethod
+    def _pending_notifications_released(notifications: List[Dict]) -> Dict[int, str]:
+        try:
+            return MercadoPagoService._pending_notifications(notifications)
+        finally:
+            # Executor threads keep their scoped session; don't leave it holding a connection
+            db_session.commit()
+
+    @staticmethod
+    def _record_batch(notifications: List[Dict], pending: Dict[int, str],
+                      fetched: Dict[int, object]) -> List[Tuple[str, Optional[Payment]]]:
+        results: List[Tuple[str, Optional[Payment]]] = [
+            ('duplicate' if data.get('data', {}).get('id') else 'ignored', None)
+            for data in notifications
+        ]
+        lookups = BatchLookups()
+        lookups.preload_users(
+            MercadoPagoService._parse_reference(payment_data)[0]
+            for payment_data in fetched.values() if isinstance(payment_data, dict)
+        )
+        lookups.preload_payments('mercadopago', pending.values())
+
+        keys_by_index = {
+            index: MercadoPagoService._ledger_keys(notifications[index], pending[index], payment_data.get('status'))
+            for index, payment_data in fetched.items() if isinstance(payment_data, dict)
+        }
+        applied = event_ledger.seen_many('mercadopago', [
+            keys[-1][0] for keys in keys_by_index.values()
+        ])
+
+        recorded = []
+        for index, payment_data in fetched.items():
+            if not isinstance(payment_data, dict):
+                results[index] = ('error', None)
+                continue
+            payment_id = pending[index]
+            keys = keys_by_index[index]
+            if keys[-1][0] in applied:
+                continue
+            snapshot = lookups.snapshot()
+            try:
+                with db_session.begin_nested():
+                    payment = MercadoPagoService._apply_payment(payment_id, payment_data, lookups)
+                    for event_id, event_type in keys:
+                        event_ledger.record('mercadopago', event_id, event_type)
+            except IntegrityError as e:
+                lookups.restore(snapshot)
+                if not event_ledger.is_duplicate(e):
+                    logger.exception('MercadoPago payment %s failed', payment_id)
+                    results[index] = ('error', None)
+                    continue
+                results[index] = ('duplicate', None)
+                continue
+            except Exception:
+                logger.exception('MercadoPago payment %s failed', payment_id)
+                lookups.restore(snapshot)
+                results[index] = ('error', None)
+                continue
+            recorded.extend(event_id for event_id, _ in keys)
+            applied.add(keys[-1][0])
+            results[index] = ('success' if payment else 'ignored', payment)
+
+        lookups.rollups.flush()
+        db_session.commit()
+        entitlements.invalidate_many(lookups.touched)
+        checkout_links.invalidate_many(lookups.touched)
+        for event_id in recorded:
+            event_ledger.remember('mercadopago', event_id)
+        return results
+
+    @staticmethod
+    def _parse_reference(payment_data: Dict) -> Tuple[Optional[int], Optional[str]]:
+        external_ref = payment_data.get('external_reference') or ''
+        if '|' not in external_ref:
+            return None, None
+        user_id, tier = external_ref.split('|', 1)
+        try:
+            return int(user_id), tier
+        except ValueError:
+            return None, None
+
+    @staticmethod
+    def _apply_payment(payment_id, payment_data: Dict, lookups: BatchLookups) -> Optional[Payment]:
+        status = payment_data.get('status')
+        user_id, tier = MercadoPagoService._parse_reference(payment_data)
+        if user_id is None:
             return None
 
-        user = User.query.get(user_id)
+        user = lookups.user(user_id)
         if not user:
             return None
 
-        payment = Payment(
-            user_id=user.id,
-            gateway='mercadopago',
-            gateway_payment_id=str(payment_id),
-            amount=float(payment_data.get('transaction_details', {}).get('total_paid_amount', 0)),
-            currency='USD',
-            status='completed' if status == 'approved' else 'pending',
-            product_tier=tier,
-            billing_period='one_time',
-            raw_webhook_data=payment_data
-        )
+        amount = float(payment_data.get('transaction_details', {}).get('total_paid_amount', 0))
+        payment_status = MercadoPagoService.payment_status(status)
+        payment = lookups.payment('mercadopago', payment_id)
+        was_completed = payment is not None and payment.status == 'completed'
+        if payment:
+            # Pending -> approved arrives as a new notification for the same payment
+            payment.amount = amount
+            payment.status = payment_status
+            payment.raw_payload = WebhookPayload.pack('mercadopago', payment_data)
+        else:
+            payment = Payment(
+                user_id=user.id,
+                gateway='mercadopago',
+                gateway_payment_id=str(payment_id),
+                amount=amount,
+                currency='USD',
+                status=payment_status,
+                product_tier=tier,
+                billing_period='one_time',
+                raw_payload=WebhookPayload.pack('mercadopago', payment_data)
+            )
+            db_session.add(payment)
+            lookups.payments[('mercadopago', str(payment_id))] = payment
+
+        if payment_status == 'completed' and not was_completed:
+            lookups.rollups.payment(payment)
+        elif payment_status == 'refunded' and was_completed:
+            lookups.rollups.payment(payment, refunded=True)
 
         if status == 'approved':
             user.subscription_tier = tier
             user.subscription_status = 'active'
+            lookups.touch(user)
+        elif payment_status == 'refunded' and user.subscription_tier == tier:
+            # Refunded or charged back: the plan it paid for goes away
+            user.subscription_tier = 'free'
+            user.subscription_status = 'inactive'
+            lookups.touch(user)
 
-        db_session.add(payment)
-        db_session.commit()
         return payment
@@ -0,0 +1,142 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from bot.utils.config import config
+from bot.models.base import db_session
+from bot.models.webhook_event import WebhookEvent
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(gateway: str, payload: Dict, event_id: Optional[str] = None,
+            event_type: Optional[str] = None) -> WebhookEvent:
+    event = WebhookEvent(
+        gateway=gateway,
+        event_id=str(event_id) if event_id is not None else None,
+        event_type=event_type,
+        payload=payload
+    )
+    db_session.add(event)
+    try:
+        db_session.commit()
+    except Exception:
+        db_session.rollback()
+        raise
+    return event
+
+
+def claim_batch(batch_size: int) -> List[WebhookEvent]:
+    """Lease up to ``batch_size`` due events; SKIP LOCKED keeps workers disjoint."""
+    now = datetime.utcnow()
+    events = (
+        WebhookEvent.query
+        .filter(WebhookEvent.status.in_(('pending', 'processing')))
+        .filter(WebhookEvent.available_at <= now)
+        .order_by(WebhookEvent.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    lease_until = now + timedelta(seconds=config.OUTBOX_LEASE_SECONDS)
+    for event in events:
+        event.status = 'processing'
+        event.attempts = (event.attempts or 0) + 1
+        event.available_at = lease_until
+    db_session.commit()
+    return events
+
+
+def dispatch(events: List[WebhookEvent]) -> List[str]:
+    """Apply a batch through the gateways' batch APIs; returns a status per event."""
+    statuses = [None] * len(events)
+    by_gateway: Dict[str, List[int]] = {}
+    for index, event in enumerate(events):
+        by_gateway.setdefault(event.gateway, []).append(index)
+
+    for gateway, indexes in by_gateway.items():
+        payloads = [events[index].payload for index in indexes]
+        if gateway == 'stripe':
+            from bot.services.stripe_service import StripeService
+            results = StripeService.process_batch(payloads)
+        elif gateway == 'mercadopago':
+            from bot.services.mp_service import MercadoPagoService
+            results = MercadoPagoService.process_batch(payloads)
+        else:
+            results = [('error', None)] * len(indexes)
+        for index, (status, _) in zip(indexes, results):
+            statuses[index] = status
+    return statuses
+
+
+def mark_done(event: WebhookEvent):
+    event.status = 'done'
+    event.processed_at = datetime.utcnow()
+    event.last_error = None
+
+
+def mark_failed(event: WebhookEvent, error: Exception):
+    event.last_error = repr(error)
+    if event.attempts >= config.OUTBOX_MAX_ATTEMPTS:
+        event.status = 'failed'
+    else:
+        event.status = 'pending'
+        event.available_at = datetime.utcnow() + timedelta(seconds=2 ** event.attempts)
+
+
+def process_batch(batch_size: int) -> int:
+    events = claim_batch(batch_size)
+    if not events:
+        return 0
+    try:
+        statuses = dispatch(events)
+    except Exception as e:
+        logger.exception('Webhook batch failed')
+        db_session.rollback()
+        statuses = [e] * len(events)
+    for event, status in zip(events, statuses):
+        if status == 'error' or isinstance(status, Exception):
+            mark_failed(event, status if isinstance(status, Exception) else RuntimeError('event failed'))
+        else:
+            mark_done(event)
+    db_session.commit()
+    return len(events)
+
+
+def _worker_loop(stop: threading.Event, batch_size: int, poll_interval: float):
+    while not stop.is_set():
+        try:
+            processed = process_batch(batch_size)
+        except Exception:
+            logger.exception('Outbox worker error')
+            db_session.rollback()
+            processed = 0
+        if not processed:
+            stop.wait(poll_interval)
+    db_session.remove()
+
+
+def run_workers(workers: int = None, batch_size: int = None, poll_interval: float = None,
+                stop: threading.Event = None):
+    stop = stop or threading.Event()
+    threads = [
+        threading.Thread(
+            target=_worker_loop,
+            args=(
+                stop,
+                batch_size or config.OUTBOX_BATCH_SIZE,
+                poll_interval or config.OUTBOX_POLL_INTERVAL,
+            ),
+            name=f'outbox-worker-{i}',
+            daemon=True
+        )
+        for i in range(workers or config.OUTBOX_WORKERS)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        stop.set()
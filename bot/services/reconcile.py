@@ -0,0 +1,369 @@
+"""Gateway reconciliation: pages through Stripe/MercadoPago list APIs and fixes local drift.
+
+    python -m bot.services.reconcile [--stream NAME] [--dry-run] [--restart]
+
+Streams: stripe_subscriptions, stripe_charges, mp_payments (default: all).
+Each page is compared against local rows with one ``IN`` lookup and fixed in
+its own transaction; the cursor is saved after every page, so an interrupted
+run resumes where it stopped. Point STRIPE_API_BASE / MP_API_BASE at
+``python -m bench.fake_gateway_api`` to run it against a local stub.
+"""
+import asyncio
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+from bot.utils.config import config
+from bot.utils.registry import registry
+from bot.utils.redis_client import warn_without_shared_cache
+from bot.services import gateway_client  # noqa: F401 (registers stripe_http/mp_http)
+from bot.services.batch import BatchLookups
+from bot.models.base import advisory_lock, db_session
+from bot.models.gateway_customer import GatewayCustomer
+from bot.models.payment import Payment
+from bot.models.reconcile_cursor import ReconcileCursor
+from bot.models.subscription import Subscription
+from bot.models.webhook_payload import WebhookPayload
+
+logger = logging.getLogger(__name__)
+
+Page = Tuple[List[Dict], Optional[str]]
+
+STRIPE_CHARGE_STATUS = {'succeeded': 'completed', 'failed': 'failed', 'pending': 'pending'}
+
+# MercadoPago caps search offsets; past this the window restarts at the last date seen
+MP_SEARCH_WINDOW = 1000
+MP_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.000-00:00'
+
+
+# ---- Pages -----------------------------------------------------------------
+
+async def stripe_pages(path: str, position: Optional[str], size: int, **params) -> AsyncIterator[Page]:
+    """Stripe list endpoint, newest first; the position is the last id returned."""
+    client = registry.get('stripe_http')
+    while True:
+        query = dict(params, limit=size)
+        if position:
+            query['starting_after'] = position
+        page = await client.request('GET', path, params=query)
+        items = page.get('data') or []
+        if not items:
+            return
+        position = items[-1]['id']
+        yield items, position
+        if not page.get('has_more'):
+            return
+
+
+async def mp_pages(position: Optional[str], size: int) -> AsyncIterator[Page]:
+    """MercadoPago payment search, oldest first; the position is ``begin_date|offset``."""
+    client = registry.get('mp_http')
+    if position:
+        begin, offset = position.rsplit('|', 1)
+        offset = int(offset)
+    else:
+        begin = (datetime.utcnow() - timedelta(days=config.RECONCILE_MP_SINCE_DAYS)).strftime(MP_DATE_FORMAT)
+        offset = 0
+    while True:
+        page = await client.request('GET', '/v1/payments/search', params={
+            'sort': 'date_created', 'criteria': 'asc',
+            'range': 'date_created', 'begin_date': begin, 'end_date': 'NOW',
+            'offset': offset, 'limit': size,
+        })
+        items = page.get('results') or []
+        if not items:
+            return
+        offset += len(items)
+        if offset >= MP_SEARCH_WINDOW:
+            # begin_date is inclusive, so the boundary payment comes back once more
+            begin, offset = items[-1]['date_created'], 0
+        yield items, f'{begin}|{offset}'
+        if len(items) < size:
+            return
+
+
+async def _prefetch(pages: AsyncIterator[Page], depth: int = 1) -> AsyncIterator[Page]:
+    """Fetch the next page while the current one is being applied; at most ``depth`` wait."""
+    queue: asyncio.Queue = asyncio.Queue(depth)
+
+    async def produce():
+        try:
+            async for page in pages:
+                await queue.put(page)
+            await queue.put(None)
+        except Exception as exc:
+            await queue.put(exc)
+
+    task = asyncio.create_task(produce())
+    try:
+        while True:
+            page = await queue.get()
+            if page is None:
+                return
+            if isinstance(page, Exception):
+                raise page
+            yield page
+    finally:
+        task.cancel()
+
+
+# ---- Comparison and fixes (run on the DB thread) ---------------------------
+
+def _timestamp(value) -> Optional[datetime]:
+    # Same conversion as the webhook handlers
+    return datetime.fromtimestamp(value) if value else None
+
+
+def _subscription_drifted(local: Subscription, remote: Dict) -> bool:
+    period_end = _timestamp(remote.get('current_period_end'))
+    if local.status == 'expired' and remote['status'] != 'canceled':
+        # Only a renewal (a later period end) revives what the expiry sweeper closed
+        return period_end is not None and (local.current_period_end is None or period_end > local.current_period_end)
+    if remote['status'] != local.status or (period_end is not None and period_end != local.current_period_end):
+        return True
+    # Only the updated event carries the flag; a canceled subscription no longer needs it
+    return remote['status'] != 'canceled' and \
+        bool(remote.get('cancel_at_period_end')) != bool(local.cancel_at_period_end)
+
+
+def apply_stripe_subscriptions(subscriptions: List[Dict], dry_run: bool = False) -> Counter:
+    """Drifted subscriptions go through the webhook batch path as synthetic events."""
+    from bot.services.stripe_service import StripeService
+    counts = Counter(seen=len(subscriptions))
+    local = {
+        subscription.gateway_subscription_id: subscription
+        for subscription in Subscription.query.filter(
+            Subscription.gateway_subscription_id.in_([remote['id'] for remote in subscriptions])
+        )
+    }
+    events = []
+    for remote in subscriptions:
+        subscription = local.get(remote['id'])
+        if subscription is None:
+            # Created only by checkout webhooks, which carry the user and tier
+            counts['missing'] += 1
+        elif _subscription_drifted(subscription, remote):
+            events.append({
+                'id': f"reconcile:{remote['id']}:{remote['status']}:{remote.get('current_period_end')}:"
+                      f"{bool(remote.get('cancel_at_period_end'))}",
+                'type': 'customer.subscription.deleted' if remote['status'] == 'canceled'
+                else 'customer.subscription.updated',
+                'data': {'object': remote},
+            })
+    db_session.commit()
+    counts['fixed'] += len(events)
+    if events and not dry_run:
+        for status, _ in StripeService.process_batch(events):
+            if status == 'error':
+                counts['errors'] += 1
+    return counts
+
+
+def _charge_status(charge: Dict) -> Optional[str]:
+    if charge.get('refunded'):
+        return 'refunded'
+    return STRIPE_CHARGE_STATUS.get(charge.get('status'))
+
+
+def apply_stripe_charges(charges: List[Dict], dry_run: bool = False) -> Counter:
+    """Fix payment statuses and record succeeded charges that never reached a webhook."""
+    counts = Counter(seen=len(charges))
+    # Checkout and invoice webhooks store the PaymentIntent id
+    by_key = {charge.get('payment_intent') or charge['id']: charge for charge in charges}
+    lookups = BatchLookups()
+    lookups.preload_payments('stripe', by_key)
+
+    customer_ids = {
+        charge['customer'] for key, charge in by_key.items()
+        if charge.get('customer') and lookups.payments.get(('stripe', key)) is None
+    }
+    owners = dict(db_session.query(GatewayCustomer.customer_id, GatewayCustomer.user_id).filter(
+        GatewayCustomer.gateway == 'stripe', GatewayCustomer.customer_id.in_(customer_ids)
+    )) if customer_ids else {}
+
+    for key, charge in by_key.items():
+        status = _charge_status(charge)
+        payment = lookups.payments.get(('stripe', key))
+        if payment is not None:
+            if status and status != payment.status:
+                counts['fixed'] += 1
+                if not dry_run:
+                    if status == 'completed':
+                        lookups.rollups.payment(payment)
+                    elif status == 'refunded' and payment.status == 'completed':
+                        lookups.rollups.payment(payment, refunded=True)
+                    payment.status = status
+            continue
+        if status != 'completed':
+            continue
+        metadata = charge.get('metadata') or {}
+        user_id = owners.get(charge.get('customer')) or int(metadata.get('user_id') or 0)
+        if not user_id:
+            counts['unmatched'] += 1
+            continue
+        counts['created'] += 1
+        if dry_run:
+            continue
+        snapshot = lookups.rollups.snapshot()
+        try:
+            with db_session.begin_nested():
+                payment = Payment(
+                    user_id=user_id,
+                    gateway='stripe',
+                    gateway_payment_id=key,
+                    gateway_customer_id=charge.get('customer'),
+                    amount=float(charge['amount']) / 100,
+                    currency=charge['currency'].upper(),
+                    status=status,
+                    product_tier=metadata.get('tier'),
+                    billing_period='monthly' if charge.get('invoice') else 'one_time',
+                    receipt_url=charge.get('receipt_url'),
+                    raw_payload=WebhookPayload.pack('stripe', charge)
+                )
+                db_session.add(payment)
+                lookups.rollups.payment(payment)
+        except IntegrityError:
+            # A webhook recorded it meanwhile
+            lookups.rollups.restore(snapshot)
+            counts['created'] -= 1
+
+    lookups.rollups.flush()
+    db_session.commit()
+    return counts
+
+
+def apply_mp_payments(payments: List[Dict], dry_run: bool = False) -> Counter:
+    """Drifted payments are applied through the notification batch path."""
+    from bot.services.mp_service import MercadoPagoService
+    counts = Counter(seen=len(payments))
+    local = dict(db_session.query(Payment.gateway_payment_id, Payment.status).filter(
+        Payment.gateway == 'mercadopago',
+        Payment.gateway_payment_id.in_([str(remote['id']) for remote in payments])
+    ))
+    db_session.commit()
+    drifted = []
+    for remote in payments:
+        status = MercadoPagoService.payment_status(remote.get('status'))
+        current = local.get(str(remote['id']))
+        if current is None:
+            if status != 'completed':
+                continue
+            if MercadoPagoService._parse_reference(remote)[0] is None:
+                counts['unmatched'] += 1
+                continue
+            counts['created'] += 1
+        elif current != status:
+            counts['fixed'] += 1
+        else:
+            continue
+        drifted.append(remote)
+    if drifted and not dry_run:
+        for status, _ in MercadoPagoService.apply_payments(drifted):
+            if status == 'error':
+                counts['errors'] += 1
+    return counts
+
+
+# ---- Streams ---------------------------------------------------------------
+
+class Stream(NamedTuple):
+    pages: Callable[[Optional[str], int], AsyncIterator[Page]]
+    apply: Callable[[List[Dict], bool], Counter]
+
+
+STREAMS: Dict[str, Stream] = {
+    'stripe_subscriptions': Stream(
+        lambda position, size: stripe_pages('/v1/subscriptions', position, size, status='all'),
+        apply_stripe_subscriptions,
+    ),
+    'stripe_charges': Stream(
+        lambda position, size: stripe_pages('/v1/charges', position, size),
+        apply_stripe_charges,
+    ),
+    'mp_payments': Stream(mp_pages, apply_mp_payments),
+}
+
+
+def load_position(stream: str) -> Optional[str]:
+    position = db_session.query(ReconcileCursor.position).filter_by(stream=stream).scalar()
+    db_session.commit()
+    return position
+
+
+def save_position(stream: str, position: Optional[str]):
+    cursor = ReconcileCursor.query.filter_by(stream=stream).first()
+    if cursor is None:
+        cursor = ReconcileCursor(stream=stream)
+        db_session.add(cursor)
+    cursor.position = position
+    db_session.commit()
+
+
+async def reconcile(stream: str, dry_run: bool = False, restart: bool = False,
+                    batch_size: Optional[int] = None) -> Optional[Counter]:
+    """Run one stream to the end; returns None when another process is already running it.
+
+    Memory stays at two pages: the one being applied and the one being
+    fetched. DB work runs on one dedicated thread so it keeps a single
+    ``db_session`` and never blocks the HTTP side.
+    """
+    pages, apply = STREAMS[stream]
+    size = batch_size or config.RECONCILE_BATCH_SIZE
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(1, thread_name_prefix='reconcile-db')
+
+    def on_db(func, *args):
+        return loop.run_in_executor(executor, func, *args)
+
+    totals = Counter()
+    try:
+        with advisory_lock(f'reconcile:{stream}') as acquired:
+            if not acquired:
+                logger.info('Reconcile %s already running elsewhere', stream)
+                return None
+            position = None if restart else await on_db(load_position, stream)
+            logger.info('Reconcile %s starting at %s', stream, position or 'the beginning')
+            async for items, position in _prefetch(pages(position, size)):
+                totals.update(await on_db(apply, items, dry_run))
+                if not dry_run:
+                    await on_db(save_position, stream, position)
+            if not dry_run:
+                # Finished: the next run starts a fresh pass
+                await on_db(save_position, stream, None)
+    finally:
+        await on_db(db_session.remove)
+        executor.shutdown()
+    logger.info('Reconcile %s%s: %s', stream, ' (dry run)' if dry_run else '', dict(totals))
+    return totals
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stream', choices=sorted(STREAMS), action='append',
+                        help='repetible; por defecto todos')
+    parser.add_argument('--dry-run', action='store_true', help='solo contar diferencias, sin corregir')
+    parser.add_argument('--restart', action='store_true', help='ignorar el cursor guardado')
+    parser.add_argument('--batch-size', type=int, default=config.RECONCILE_BATCH_SIZE)
+    args = parser.parse_args()
+    if not args.dry_run:
+        warn_without_shared_cache('bot.services.reconcile')
+
+    async def _main():
+        results = {}
+        try:
+            for stream in args.stream or list(STREAMS):
+                totals = await reconcile(stream, args.dry_run, args.restart, args.batch_size)
+                results[stream] = dict(totals) if totals is not None else 'locked'
+        finally:
+            await registry.get('stripe_http').aclose()
+            await registry.get('mp_http').aclose()
+        return results
+
+    print(json.dumps(asyncio.run(_main()), indent=2))
@@ -1,13 +1,33 @@
-import stripe
-from typing import Dict, Optional, Tuple
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.exc import IntegrityError
 from bot.utils.config import config
+from bot.utils.registry import registry
+from bot.utils.metrics import metrics
+from bot.services.gateway_client import encode_form
+from bot.services.ledger import event_ledger
+from bot.services.batch import BatchLookups
+from bot.services.customers import customers
+from bot.services.checkout import checkout_links
+from bot.services.entitlements import entitlements
 from bot.models.user import User
 from bot.models.payment import Payment
+from bot.models.webhook_payload import WebhookPayload
 from bot.models.subscription import Subscription
 from bot.models.base import db_session
 from datetime import datetime
 
-stripe.api_key = config.STRIPE_SECRET_KEY
+logger = logging.getLogger(__name__)
+
+
+def _create_stripe():
+    import stripe
+    stripe.api_key = config.STRIPE_SECRET_KEY
+    return stripe
+
+
+registry.register('stripe', _create_stripe)
 
 
 class StripeService:
@@ -23,35 +43,50 @@ class StripeService:
     }
 
     @staticmethod
-    def create_customer(user: User) -> str:
-        customer = stripe.Customer.create(
-            email=user.email or f'{user.telegram_id}@barbosa.agency',
-            name=f'{user.first_name or ""} {user.last_name or ""}'.strip(),
-            metadata={
+    def _customer_params(user: User) -> Dict:
+        return {
+            'email': user.email or f'{user.telegram_id}@barbosa.agency',
+            'name': f'{user.first_name or ""} {user.last_name or ""}'.strip(),
+            'metadata': {
                 'telegram_id': user.telegram_id,
                 'user_id': user.id,
                 'username': user.username or 'unknown'
             }
-        )
-        return customer.id
+        }
 
     @staticmethod
-    def create_checkout_session(user: User, tier: str, mode: str = 'subscription') -> Dict:
-        price_id = StripeService.TIER_PRICES.get(tier)
-        if not price_id:
-            raise ValueError(f'Tier {tier} no valido')
+    def _customer_idempotency_key(user: User) -> str:
+        # Concurrent first checkouts of one user get the same Stripe customer back
+        return f'customer-user-{user.id}'
 
-        customer_id = None
-        existing_payment = user.payments.first()
-        if existing_payment and existing_payment.gateway_customer_id:
-            customer_id = existing_payment.gateway_customer_id
-        else:
-            customer_id = StripeService.create_customer(user)
+    @staticmethod
+    def create_customer(user: User) -> str:
+        stripe = registry.get('stripe')
+        with metrics.timer('gateway_request_seconds', gateway='stripe', operation='POST /v1/customers'):
+            customer = stripe.Customer.create(
+                idempotency_key=StripeService._customer_idempotency_key(user),
+                **StripeService._customer_params(user)
+            )
+        return customers.remember(user.id, 'stripe', customer.id)
 
+    @staticmethod
+    async def create_customer_async(user: User) -> str:
+        client = registry.get('stripe_http')
+        customer = await client.request(
+            'POST', '/v1/customers',
+            data=encode_form(StripeService._customer_params(user)),
+            headers={'Idempotency-Key': StripeService._customer_idempotency_key(user)}
+        )
+        return await asyncio.to_thread(customers.remember, user.id, 'stripe', customer['id'])
+
+    @staticmethod
+    def _checkout_params(user: User, tier: str, mode: str, customer_id: str,
+                         expires_at: Optional[datetime] = None) -> Dict:
+        price_id = StripeService.TIER_PRICES[tier]
         success_url = f'{config.BASE_URL}/payment/success?session_id={{CHECKOUT_SESSION_ID}}'
         cancel_url = f'{config.BASE_URL}/payment/cancel'
 
-        session = stripe.checkout.Session.create(
+        return dict(
             customer=customer_id,
             payment_method_types=['card'],
             line_items=[{'price': price_id, 'quantity': 1}],
@@ -69,11 +104,49 @@ class StripeService:
             } if mode == 'subscription' else None,
             allow_promotion_codes=True,
             billing_address_collection='auto',
+            expires_at=int(expires_at.timestamp()) if expires_at else None,
         )
+
+    @staticmethod
+    def create_checkout_session(user: User, tier: str, mode: str = 'subscription',
+                                expires_at: Optional[datetime] = None) -> Dict:
+        if not StripeService.TIER_PRICES.get(tier):
+            raise ValueError(f'Tier {tier} no valido')
+
+        customer_id = customers.get(user.id, 'stripe')
+        if not customer_id:
+            customer_id = StripeService.create_customer(user)
+
+        stripe = registry.get('stripe')
+        with metrics.timer('gateway_request_seconds', gateway='stripe', operation='POST /v1/checkout/sessions'):
+            session = stripe.checkout.Session.create(
+                **StripeService._checkout_params(user, tier, mode, customer_id, expires_at)
+            )
         return {'session_id': session.id, 'url': session.url, 'customer_id': customer_id}
 
     @staticmethod
-    def process_webhook(payload: bytes, sig_header: str) -> Tuple[str, Optional[Dict]]:
+    async def create_checkout_session_async(user: User, tier: str, mode: str = 'subscription',
+                                            expires_at: Optional[datetime] = None) -> Dict:
+        if not StripeService.TIER_PRICES.get(tier):
+            raise ValueError(f'Tier {tier} no valido')
+
+        customer_id = (
+            customers.cached(user.id, 'stripe') or
+            await asyncio.to_thread(customers.get, user.id, 'stripe')
+        )
+        if not customer_id:
+            customer_id = await StripeService.create_customer_async(user)
+
+        client = registry.get('stripe_http')
+        session = await client.request(
+            'POST', '/v1/checkout/sessions',
+            data=encode_form(StripeService._checkout_params(user, tier, mode, customer_id, expires_at))
+        )
+        return {'session_id': session['id'], 'url': session['url'], 'customer_id': customer_id}
+
+    @staticmethod
+    def verify_event(payload: bytes, sig_header: str) -> Tuple[str, Optional[Dict]]:
+        stripe = registry.get('stripe')
         try:
             event = stripe.Webhook.construct_event(
                 payload, sig_header, config.STRIPE_WEBHOOK_SECRET
@@ -82,29 +155,123 @@ class StripeService:
             return 'invalid_payload', None
         except stripe.error.SignatureVerificationError:
             return 'invalid_signature', None
+        return 'success', event
 
-        event_type = event['type']
-        data = event['data']['object']
+    @staticmethod
+    def process_webhook(payload: bytes, sig_header: str) -> Tuple[str, Optional[Dict]]:
+        status, event = StripeService.verify_event(payload, sig_header)
+        if event is None:
+            return status, None
+        return StripeService.handle_event(event)
+
+    @staticmethod
+    def handle_event(event: Dict) -> Tuple[str, Optional[Dict]]:
+        return StripeService.process_batch([event])[0]
+
+    @staticmethod
+    def process_batch(events: List[Dict]) -> List[Tuple[str, Optional[Dict]]]:
+        """Apply many events with one commit; each event runs in its own savepoint.
+
+        Statuses: 'success', 'duplicate' (already in the ledger or lost the race
+        to record it) and 'error' (the event's changes were rolled back).
+        """
+        results: List[Tuple[str, Optional[Dict]]] = [None] * len(events)
+        # Redeliveries are answered from the ledger before touching any row
+        seen = event_ledger.seen_many('stripe', [event['id'] for event in events])
+
+        lookups = BatchLookups()
+        lookups.preload_users(
+            int(event['data']['object'].get('metadata', {}).get('user_id', 0))
+            for event in events if event['type'] == 'checkout.session.completed'
+        )
+        lookups.preload_subscriptions(
+            StripeService._subscription_ref(event['type'], event['data']['object'])
+            for event in events
+        )
+
+        applied = []
+        for index, event in enumerate(events):
+            event_type = event['type']
+            data = event['data']['object']
+            result = {'type': event_type, 'id': data.get('id')}
+            if event['id'] in seen:
+                results[index] = ('duplicate', result)
+                continue
+            snapshot = lookups.snapshot()
+            try:
+                with db_session.begin_nested():
+                    StripeService._dispatch(event_type, data, lookups)
+                    event_ledger.record('stripe', event['id'], event_type)
+            except IntegrityError as e:
+                lookups.restore(snapshot)
+                if not event_ledger.is_duplicate(e):
+                    logger.exception('Stripe event %s failed', event['id'])
+                    results[index] = ('error', dict(result, error=str(e)))
+                    continue
+                # A concurrent delivery of the same event committed first
+                results[index] = ('duplicate', result)
+                continue
+            except Exception as e:
+                logger.exception('Stripe event %s failed', event['id'])
+                lookups.restore(snapshot)
+                results[index] = ('error', dict(result, error=str(e)))
+                continue
+            seen.add(event['id'])
+            applied.append(event['id'])
+            results[index] = ('success', result)
+
+        lookups.rollups.flush()
+        db_session.commit()
+        entitlements.invalidate_many(lookups.touched)
+        checkout_links.invalidate_many(lookups.touched)
+        for event_id in applied:
+            event_ledger.remember('stripe', event_id)
+        return results
+
+    @staticmethod
+    def _subscription_ref(event_type: str, data: Dict) -> Optional[str]:
+        if event_type in ('invoice.payment_succeeded', 'invoice.payment_failed'):
+            return data.get('subscription')
+        if event_type in ('customer.subscription.deleted', 'customer.subscription.updated'):
+            return data.get('id')
+        return None
 
+    @staticmethod
+    def _dispatch(event_type: str, data: Dict, lookups: BatchLookups):
         if event_type == 'checkout.session.completed':
-            StripeService._handle_checkout_completed(data)
+            StripeService._handle_checkout_completed(data, lookups)
         elif event_type == 'invoice.payment_succeeded':
-            StripeService._handle_invoice_paid(data)
+            StripeService._handle_invoice_paid(data, lookups)
         elif event_type == 'invoice.payment_failed':
-            StripeService._handle_payment_failed(data)
+            StripeService._handle_payment_failed(data, lookups)
         elif event_type == 'customer.subscription.deleted':
-            StripeService._handle_subscription_cancelled(data)
+            StripeService._handle_subscription_cancelled(data, lookups)
         elif event_type == 'customer.subscription.updated':
-            StripeService._handle_subscription_updated(data)
+            StripeService._handle_subscription_updated(data, lookups)
 
-        return 'success', {'type': event_type, 'id': data.get('id')}
+    @staticmethod
+    def _set_status(subscription: Subscription, status: str, lookups: BatchLookups):
+        # Rollups count transitions, so retried or repeated events don't double count
+        if status != subscription.status:
+            if status == 'canceled' and subscription.status != 'expired':
+                lookups.rollups.subscription(subscription, 'cancelled')
+            elif status == 'past_due':
+                lookups.rollups.subscription(subscription, 'past_due')
+            elif status == 'active' and subscription.status == 'expired':
+                # A renewal that arrived after the expiry sweeper closed it
+                lookups.rollups.subscription(subscription, 'new')
+                subscription.is_active = True
+                subscription.user.subscription_tier = subscription.tier
+                subscription.user.subscription_status = 'active'
+                lookups.touch(subscription.user)
+        subscription.status = status
 
     @staticmethod
-    def _handle_checkout_completed(data: Dict):
+    def _handle_checkout_completed(data: Dict, lookups: BatchLookups):
         metadata = data.get('metadata', {})
         user_id = int(metadata.get('user_id', 0))
         tier = metadata.get('tier', 'basic')
-        user = User.query.get(user_id)
+        user = lookups.user(user_id)
         if not user:
             return
 
@@ -118,7 +285,7 @@ class StripeService:
             status='completed',
             product_tier=tier,
             billing_period='monthly' if data.get('subscription') else 'one_time',
-            raw_webhook_data=data
+            raw_payload=WebhookPayload.pack('stripe', data)
         )
 
         if data.get('subscription'):
@@ -133,66 +300,87 @@ class StripeService:
             )
             db_session.add(subscription)
             payment.subscription = subscription
+            lookups.subscriptions[subscription.gateway_subscription_id] = subscription
+            lookups.rollups.subscription(subscription, 'new')
 
         user.subscription_tier = tier
         user.subscription_status = 'active'
+        lookups.touch(user)
         db_session.add(payment)
-        db_session.commit()
+        lookups.rollups.payment(payment)
+        customers.stage(user.id, 'stripe', data.get('customer'))
+
+    @staticmethod
+    def _invoice_period(data: Dict) -> Tuple[Optional[int], Optional[int]]:
+        """Service period an invoice pays for, as (start, end) timestamps.
+
+        The invoice's own ``period_start``/``period_end`` cover what was billed
+        in arrears, which for a renewal is the month that just ended; the
+        subscription line carries the period being paid for.
+        """
+        for line in (data.get('lines') or {}).get('data') or []:
+            period = line.get('period') or {}
+            if line.get('type', 'subscription') == 'subscription' and period.get('end'):
+                return period.get('start'), period['end']
+        return data.get('period_start'), data.get('period_end')
 
     @staticmethod
-    def _handle_invoice_paid(data: Dict):
-        subscription_id = data.get('subscription')
-        subscription = Subscription.query.filter_by(
-            gateway_subscription_id=subscription_id
-        ).first()
+    def _record_invoice_payment(subscription: Subscription, data: Dict, lookups: BatchLookups):
+        payment = Payment(
+            user_id=subscription.user_id,
+            subscription_id=subscription.id,
+            gateway='stripe',
+            gateway_payment_id=data.get('payment_intent'),
+            amount=float(data['amount_paid']) / 100,
+            currency=data['currency'].upper(),
+            status='completed',
+            product_tier=subscription.tier,
+            billing_period='monthly',
+            raw_payload=WebhookPayload.pack('stripe', data)
+        )
+        db_session.add(payment)
+        lookups.rollups.payment(payment)
+
+    @staticmethod
+    def _handle_invoice_paid(data: Dict, lookups: BatchLookups):
+        subscription = lookups.subscription(data.get('subscription'))
         if subscription:
-            payment = Payment(
-                user_id=subscription.user_id,
-                subscription_id=subscription.id,
-                gateway='stripe',
-                gateway_payment_id=data.get('payment_intent'),
-                amount=float(data['amount_paid']) / 100,
-                currency=data['currency'].upper(),
-                status='completed',
-                product_tier=subscription.tier,
-                billing_period='monthly',
-                raw_webhook_data=data
-            )
-            db_session.add(payment)
-            subscription.current_period_start = datetime.fromtimestamp(data['period_start'])
-            subscription.current_period_end = datetime.fromtimestamp(data['period_end'])
-            db_session.commit()
+            # checkout.session.completed already recorded the first charge
+            if data.get('billing_reason') != 'subscription_create':
+                StripeService._record_invoice_payment(subscription, data, lookups)
+            start, end = StripeService._invoice_period(data)
+            # Out-of-order deliveries of older invoices must not shorten the paid period
+            if end and (subscription.current_period_end is None or
+                        datetime.fromtimestamp(end) > subscription.current_period_end):
+                subscription.current_period_start = datetime.fromtimestamp(start) if start else None
+                subscription.current_period_end = datetime.fromtimestamp(end)
+            if subscription.status == 'expired':
+                StripeService._set_status(subscription, 'active', lookups)
 
     @staticmethod
-    def _handle_payment_failed(data: Dict):
-        subscription_id = data.get('subscription')
-        subscription = Subscription.query.filter_by(
-            gateway_subscription_id=subscription_id
-        ).first()
+    def _handle_payment_failed(data: Dict, lookups: BatchLookups):
+        subscription = lookups.subscription(data.get('subscription'))
         if subscription:
-            subscription.status = 'past_due'
+            StripeService._set_status(subscription, 'past_due', lookups)
             subscription.user.subscription_status = 'past_due'
-            db_session.commit()
+            lookups.touch(subscription.user)
 
     @staticmethod
-    def _handle_subscription_cancelled(data: Dict):
-        subscription = Subscription.query.filter_by(
-            gateway_subscription_id=data['id']
-        ).first()
+    def _handle_subscription_cancelled(data: Dict, lookups: BatchLookups):
+        subscription = lookups.subscription(data['id'])
         if subscription:
-            subscription.status = 'canceled'
+            StripeService._set_status(subscription, 'canceled', lookups)
             subscription.user.subscription_tier = 'free'
             subscription.user.subscription_status = 'inactive'
             subscription.is_active = False
-            db_session.commit()
+            lookups.touch(subscription.user)
 
     @staticmethod
-    def _handle_subscription_updated(data: Dict):
-        subscription = Subscription.query.filter_by(
-            gateway_subscription_id=data['id']
-        ).first()
+    def _handle_subscription_updated(data: Dict, lookups: BatchLookups):
+        subscription = lookups.subscription(data['id'])
         if subscription:
-            subscription.status = data.get('status', subscription.status)
+            StripeService._set_status(subscription, data.get('status', subscription.status), lookups)
             if data.get('current_period_end'):
                 subscription.current_period_end = datetime.fromtimestamp(data['current_period_end'])
-            db_session.commit()
+            if 'cancel_at_period_end' in data:
+                subscription.cancel_at_period_end = bool(data['cancel_at_period_end'])
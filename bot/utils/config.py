@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dataclasses import dataclass, field
 from typing import Optional, List
 
@@ -8,10 +9,27 @@ class Config:
     # Telegram
     TELEGRAM_TOKEN: str = os.getenv('TELEGRAM_TOKEN', '')
     ADMIN_USER_IDS: List[int] = None
+    # Point at a fake Bot API server for benchmarks
+    TELEGRAM_API_BASE: str = os.getenv('TELEGRAM_API_BASE', 'https://api.telegram.org/bot')
+
+    # Outbound Bot API scheduling (Telegram flood limits); OUTBOUND_GLOBAL_RATE is
+    # the web dynos' share and BROADCAST_RATE the worker's, together at most 30/s
+    OUTBOUND_GLOBAL_RATE: float = float(os.getenv('OUTBOUND_GLOBAL_RATE', '20'))
+    OUTBOUND_CHAT_RATE: float = float(os.getenv('OUTBOUND_CHAT_RATE', '1'))
+    OUTBOUND_CHAT_BURST: float = float(os.getenv('OUTBOUND_CHAT_BURST', '3'))
+    OUTBOUND_GROUP_PER_MINUTE: float = float(os.getenv('OUTBOUND_GROUP_PER_MINUTE', '20'))
+    OUTBOUND_MAX_RETRIES: int = int(os.getenv('OUTBOUND_MAX_RETRIES', '3'))
 
     # Database
     DATABASE_URL: str = os.getenv('DATABASE_URL', 'postgresql://localhost/barbosa')
     REDIS_URL: str = os.getenv('REDIS_URL', 'redis://localhost:6379')
+    CACHE_BACKEND: str = os.getenv('CACHE_BACKEND', 'memory')  # memory, redis
+    # Without Redis, caches bot.worker invalidates expire this fast in the web dynos
+    LOCAL_CACHE_TTL: int = int(os.getenv('LOCAL_CACHE_TTL', '30'))
+
+    # Entitlement cache (plan/status per telegram_id)
+    ENTITLEMENT_CACHE_SIZE: int = int(os.getenv('ENTITLEMENT_CACHE_SIZE', '50000'))
+    ENTITLEMENT_TTL: int = int(os.getenv('ENTITLEMENT_TTL', '300'))
 
     # Stripe Global
     STRIPE_SECRET_KEY: str = os.getenv('STRIPE_SECRET_KEY', '')
@@ -28,6 +46,45 @@ class Config:
     MP_PUBLIC_KEY: str = os.getenv('MP_PUBLIC_KEY', '')
     MP_WEBHOOK_SECRET: str = os.getenv('MP_WEBHOOK_SECRET', '')
 
+    # Gateway customer ids cached per process (user, gateway) -> customer
+    CUSTOMER_CACHE_SIZE: int = int(os.getenv('CUSTOMER_CACHE_SIZE', '50000'))
+
+    # Checkout links reused per (user, tier, gateway) before creating a new one
+    CHECKOUT_LINK_TTL: int = int(os.getenv('CHECKOUT_LINK_TTL', '1200'))
+    CHECKOUT_CACHE_SIZE: int = int(os.getenv('CHECKOUT_CACHE_SIZE', '20000'))
+
+    # Gateway HTTP pools (async clients)
+    STRIPE_API_BASE: str = os.getenv('STRIPE_API_BASE', 'https://api.stripe.com')
+    MP_API_BASE: str = os.getenv('MP_API_BASE', 'https://api.mercadopago.com')
+    GATEWAY_TIMEOUT: float = float(os.getenv('GATEWAY_TIMEOUT', '10'))
+    GATEWAY_MAX_CONNECTIONS: int = int(os.getenv('GATEWAY_MAX_CONNECTIONS', '20'))
+    STRIPE_MAX_CONCURRENCY: int = int(os.getenv('STRIPE_MAX_CONCURRENCY', '10'))
+    MP_MAX_CONCURRENCY: int = int(os.getenv('MP_MAX_CONCURRENCY', '10'))
+
+    # Processed webhook events kept in memory before hitting the ledger table
+    LEDGER_CACHE_SIZE: int = int(os.getenv('LEDGER_CACHE_SIZE', '10000'))
+
+    # Webhook outbox workers (python -m bot.worker)
+    OUTBOX_WORKERS: int = int(os.getenv('OUTBOX_WORKERS', '4'))
+    OUTBOX_BATCH_SIZE: int = int(os.getenv('OUTBOX_BATCH_SIZE', '50'))
+    OUTBOX_POLL_INTERVAL: float = float(os.getenv('OUTBOX_POLL_INTERVAL', '1.0'))
+    OUTBOX_MAX_ATTEMPTS: int = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '8'))
+    OUTBOX_LEASE_SECONDS: int = int(os.getenv('OUTBOX_LEASE_SECONDS', '300'))
+
+    # Admin broadcasts (sent by python -m bot.worker)
+    BROADCAST_RATE: float = float(os.getenv('BROADCAST_RATE', '10'))
+    BROADCAST_CHUNK_SIZE: int = int(os.getenv('BROADCAST_CHUNK_SIZE', '200'))
+    BROADCAST_CONCURRENCY: int = int(os.getenv('BROADCAST_CONCURRENCY', '20'))
+    BROADCAST_LEASE_SECONDS: int = int(os.getenv('BROADCAST_LEASE_SECONDS', '120'))
+    # Expiry sweeper (worker): plans past period end + grace are downgraded
+    EXPIRY_SWEEP_INTERVAL: float = float(os.getenv('EXPIRY_SWEEP_INTERVAL', '300'))
+    EXPIRY_GRACE_HOURS: int = int(os.getenv('EXPIRY_GRACE_HOURS', '48'))
+    EXPIRY_BATCH_SIZE: int = int(os.getenv('EXPIRY_BATCH_SIZE', '500'))
+    RENEWAL_REMINDER_DAYS: int = int(os.getenv('RENEWAL_REMINDER_DAYS', '3'))
+    # Reconciliation (python -m bot.services.reconcile): page size, MercadoPago lookback
+    RECONCILE_BATCH_SIZE: int = int(os.getenv('RECONCILE_BATCH_SIZE', '100'))
+    RECONCILE_MP_SINCE_DAYS: int = int(os.getenv('RECONCILE_MP_SINCE_DAYS', '90'))
+
     # Coinbase Commerce Crypto
     COINBASE_API_KEY: str = os.getenv('COINBASE_API_KEY', '')
     COINBASE_WEBHOOK_SECRET: str = os.getenv('COINBASE_WEBHOOK_SECRET', '')
@@ -36,6 +93,34 @@ class Config:
     SECRET_KEY: str = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-prod')
     BASE_URL: str = os.getenv('RAILWAY_PUBLIC_DOMAIN', 'http://localhost:5000')
 
+    # Telegram update queue (asgi.py and bot/main.py): size, chats processed in parallel
+    # Flask answers Telegram before processing only when set; keep it off on Vercel,
+    # which freezes the function once the response is sent
+    WEBHOOK_EARLY_ACK: bool = os.getenv('WEBHOOK_EARLY_ACK', 'false').lower() == 'true'
+    UPDATE_QUEUE_SIZE: int = int(os.getenv('UPDATE_QUEUE_SIZE', '1000'))
+    UPDATE_WORKERS: int = int(os.getenv('UPDATE_WORKERS', '32'))
+    UPDATE_ENQUEUE_TIMEOUT: float = float(os.getenv('UPDATE_ENQUEUE_TIMEOUT', '0.5'))
+
+    # Conversation sessions (interactive /dscr)
+    SESSION_TTL: int = int(os.getenv('SESSION_TTL', '900'))
+    SESSION_MAX: int = int(os.getenv('SESSION_MAX', '100000'))
+
+    # DSCR portfolio analysis (CSV upload / POST /api/dscr)
+    DSCR_MAX_ROWS: int = int(os.getenv('DSCR_MAX_ROWS', '100000'))
+    DSCR_MAX_UPLOAD_BYTES: int = int(os.getenv('DSCR_MAX_UPLOAD_BYTES', str(5 * 1024 * 1024)))
+    # Bearer token for POST /api/dscr; the endpoint is off while unset
+    DSCR_API_TOKEN: str = os.getenv('DSCR_API_TOKEN', '')
+
+    # Logging: records are queued and written by a listener thread
+    LOG_LEVEL: str = os.getenv('LOG_LEVEL', 'INFO').upper()
+    LOG_FORMAT: str = os.getenv('LOG_FORMAT', 'json')  # json | text
+    # Fraction of high-volume INFO records (one per handled update) that are kept
+    LOG_SAMPLE_RATE: float = float(os.getenv('LOG_SAMPLE_RATE', '0.1'))
+
+    # Metrics (/metrics): per-process files merged across gunicorn workers
+    METRICS_DIR: str = os.getenv('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'barbosa-metrics'))
+    METRICS_FLUSH_INTERVAL: float = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+
     # Feature Flags
     ENABLE_STRIPE: bool = os.getenv('ENABLE_STRIPE', 'true').lower() == 'true'
     ENABLE_MP: bool = os.getenv('ENABLE_MP', 'true').lower() == 'true'
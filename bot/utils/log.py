@@ -0,0 +1,122 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from typing import Optional
+
+from bot.utils.config import config
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else came in through ``extra=``
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'sample'}
+
+update_logger = logging.getLogger('bot.updates')
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; ``extra=`` fields (update_id, chat_id, ...) become keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                payload[key] = value
+        if record.exc_info:
+            payload['exc'] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a ``rate`` fraction of INFO-and-below records logged with ``extra={'sample': True}``."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO or not getattr(record, 'sample', False):
+            return True
+        return self.rate >= 1 or random.random() < self.rate
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The stock handler formats here, on the caller's thread; leave it to the listener
+        return record
+
+
+_handler: Optional[_QueueHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _output_handler() -> logging.Handler:
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter() if config.LOG_FORMAT == 'json' else logging.Formatter(TEXT_FORMAT))
+    return handler
+
+
+def _start_listener():
+    global _listener
+    _handler.queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(_handler.queue, _output_handler(), respect_handler_level=True)
+    _listener.start()
+
+
+def _stop_listener():
+    if _listener is not None:
+        # Drains whatever is still queued before the process exits
+        _listener.stop()
+
+
+def setup_logging(use_queue: bool = True):
+    """Configure the root logger once per process.
+
+    With ``use_queue`` callers only append records to an in-memory queue; a
+    listener thread formats and writes them, so a slow stderr never blocks a
+    request thread.
+    """
+    global _handler
+    root = logging.getLogger()
+    if _handler is not None or (not use_queue and root.handlers):
+        return
+    root.setLevel(config.LOG_LEVEL)
+    sampling = SamplingFilter(config.LOG_SAMPLE_RATE)
+    if not use_queue:
+        handler = _output_handler()
+        handler.addFilter(sampling)
+        root.addHandler(handler)
+        return
+    _handler = _QueueHandler(queue.SimpleQueue())
+    # Dropped records never reach the queue
+    _handler.addFilter(sampling)
+    root.addHandler(_handler)
+    _start_listener()
+    atexit.register(_stop_listener)
+    if hasattr(os, 'register_at_fork'):
+        # The listener thread does not survive a fork; give the child its own
+        os.register_at_fork(after_in_child=_start_listener)
+
+
+def log_update(update, handler: str, seconds: float):
+    """Sampled per-update record: which handler served which update and how long it took."""
+    if not update_logger.isEnabledFor(logging.INFO):
+        return
+    chat = getattr(update, 'effective_chat', None)
+    update_logger.info('Update handled', extra={
+        'update_id': getattr(update, 'update_id', None),
+        'chat_id': chat.id if chat is not None else None,
+        'handler': handler,
+        'duration_ms': round(seconds * 1000, 3),
+        'sample': True,
+    })
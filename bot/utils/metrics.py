@@ -0,0 +1,223 @@
+import atexit
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+from bot.utils.config import config
+
+# Seconds; covers a cache hit up to a slow gateway call
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Alive but owned by another user
+        return True
+    return True
+
+
+class Metrics:
+    """Per-process counters and histograms, exported in Prometheus text format.
+
+    Recording is a dict update under a lock. Every ``flush_interval`` seconds
+    the process writes its totals to ``<directory>/<pid>.json``; ``render()``
+    merges every file in the directory, so any gunicorn worker answering
+    ``/metrics`` reports the whole dyno.
+    """
+
+    def __init__(self, directory: str, flush_interval: float = 5.0, buckets=DEFAULT_BUCKETS):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.buckets = tuple(buckets)
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            # A forked worker must not re-export its parent's numbers under its own pid
+            os.register_at_fork(after_in_child=self._reset)
+        atexit.register(self.flush)
+
+    def _reset(self):
+        self._counters: Dict[Tuple[str, LabelKey], float] = {}
+        # [per-bucket counts..., +Inf count], sum
+        self._histograms: Dict[Tuple[str, LabelKey], list] = {}
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        self._maybe_flush()
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, _labels(labels))
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            entry = self._histograms.get(key)
+            if entry is None:
+                entry = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += seconds
+        self._maybe_flush()
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Observe the block's duration; exceptions also count in ``<name>_errors_total``."""
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc(_errors_name(name), **labels)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def timed(self, name: str, **labels):
+        """Decorator form of ``timer`` for plain and async functions."""
+        def decorator(func):
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.timer(name, **labels):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(name, **labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _maybe_flush(self):
+        # One thread writes the file; the others keep recording
+        if time.monotonic() - self._last_flush >= self.flush_interval and self._flush_lock.acquire(False):
+            try:
+                self._write()
+            finally:
+                self._flush_lock.release()
+
+    def _snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                'histograms': [
+                    [name, list(labels), list(counts), total]
+                    for (name, labels), (counts, total) in self._histograms.items()
+                ],
+            }
+
+    def flush(self):
+        with self._flush_lock:
+            self._write()
+
+    def _write(self):
+        self._last_flush = time.monotonic()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f'{os.getpid()}.json')
+            tmp_path = f'{path}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self._snapshot(), f, separators=(',', ':'))
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+    def collect(self) -> Tuple[Dict, Dict]:
+        """Counters and histograms summed over every live process that flushed to the directory.
+
+        Files left by exited processes are deleted rather than merged.
+        """
+        self.flush()
+        counters: Dict[Tuple[str, LabelKey], float] = {}
+        histograms: Dict[Tuple[str, LabelKey], list] = {}
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            names = []
+        for file_name in names:
+            if not file_name.endswith('.json'):
+                continue
+            pid = file_name[:-len('.json')]
+            if pid.isdigit() and not _alive(int(pid)):
+                # A restarted worker's numbers start over under its new pid
+                try:
+                    os.remove(os.path.join(self.directory, file_name))
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(os.path.join(self.directory, file_name)) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, labels, value in snapshot.get('counters', []):
+                key = (name, tuple(tuple(pair) for pair in labels))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, counts, total in snapshot.get('histograms', []):
+                key = (name, tuple(tuple(pair) for pair in labels))
+                entry = histograms.setdefault(key, [[0] * len(counts), 0.0])
+                entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                entry[1] += total
+        return counters, histograms
+
+    def render(self) -> str:
+        counters, histograms = self.collect()
+        lines: List[str] = []
+        typed = set()
+        for (name, labels), value in sorted(counters.items()):
+            if name not in typed:
+                lines.append(f'# TYPE {name} counter')
+                typed.add(name)
+            lines.append(f'{name}{_format_labels(labels)} {_number(value)}')
+        bounds = [_number(bound) for bound in self.buckets] + ['+Inf']
+        for (name, labels), (counts, total) in sorted(histograms.items()):
+            if name not in typed:
+                lines.append(f'# TYPE {name} histogram')
+                typed.add(name)
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", bound),))} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {_number(total)}')
+            lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+def _errors_name(name: str) -> str:
+    return (name[:-len('_seconds')] if name.endswith('_seconds') else name) + '_errors_total'
+
+
+def _number(value: float) -> str:
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _format_labels(labels: LabelKey) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+metrics = Metrics(config.METRICS_DIR, config.METRICS_FLUSH_INTERVAL)
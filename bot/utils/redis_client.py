@@ -0,0 +1,41 @@
+import logging
+
+from bot.utils.config import config
+from bot.utils.registry import registry
+
+
+def _create_redis():
+    import redis
+    return redis.Redis.from_url(config.REDIS_URL, decode_responses=True)
+
+
+logger = logging.getLogger(__name__)
+
+registry.register('redis', _create_redis)
+
+
+def use_redis() -> bool:
+    """Shared state goes to Redis only when CACHE_BACKEND=redis."""
+    return config.CACHE_BACKEND == 'redis'
+
+
+def get_redis():
+    return registry.get('redis')
+
+
+def local_ttl(ttl: float) -> float:
+    """TTL for a per-process cache whose invalidations come from bot.worker.
+
+    Without Redis those invalidations never reach the web dynos, so entries
+    there are only trusted for LOCAL_CACHE_TTL seconds.
+    """
+    return ttl if use_redis() else min(ttl, config.LOCAL_CACHE_TTL)
+
+
+def warn_without_shared_cache(process: str):
+    """Processes that change plans outside the web dynos can only invalidate their caches through Redis."""
+    if not use_redis():
+        logger.warning(
+            '%s running with CACHE_BACKEND=%s: web dynos see plan changes and paid checkout links '
+            'only after LOCAL_CACHE_TTL (%ss)', process, config.CACHE_BACKEND, config.LOCAL_CACHE_TTL
+        )
@@ -0,0 +1,49 @@
+import threading
+import time
+from typing import Any, Callable, Dict
+
+from bot.utils.timing import cold_start
+
+
+class ServiceRegistry:
+    """Process-wide singletons built by their factory on first ``get()``.
+
+    Modules register factories at import time (cheap); the expensive work
+    (SDK imports, engine creation) happens on first use or in ``warm()``.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+        self.init_ms: Dict[str, float] = {}
+
+    def register(self, name: str, factory: Callable[[], Any]):
+        self._factories[name] = factory
+
+    def get(self, name: str) -> Any:
+        try:
+            return self._instances[name]
+        except KeyError:
+            pass
+        with self._lock:
+            if name not in self._instances:
+                started = time.perf_counter()
+                self._instances[name] = self._factories[name]()
+                self.init_ms[name] = round((time.perf_counter() - started) * 1000, 2)
+                cold_start.mark(f'init:{name}')
+            return self._instances[name]
+
+    def warm(self, *names: str):
+        for name in names or list(self._factories):
+            self.get(name)
+
+    def is_ready(self, name: str) -> bool:
+        return name in self._instances
+
+    def reset(self, name: str):
+        with self._lock:
+            self._instances.pop(name, None)
+
+
+registry = ServiceRegistry()
@@ -0,0 +1,74 @@
+import asyncio
+from typing import Generic, Optional, Type, TypeVar
+
+from bot.utils.cache import TTLCache
+from bot.utils.redis_client import get_redis, use_redis
+
+T = TypeVar('T')
+
+
+class SessionStore(Generic[T]):
+    """Per-user conversation state stored as one small NamedTuple per user.
+
+    In memory each session is a single tuple in a TTL+LRU cache; with
+    CACHE_BACKEND=redis it is a ``|``-joined string under a SETEX key, so a
+    conversation continues whichever gunicorn worker gets the next message.
+    """
+
+    def __init__(self, namespace: str, record_type: Type[T], ttl: int = 900, maxsize: int = 100000):
+        self.namespace = namespace
+        self.record_type = record_type
+        self.ttl = ttl
+        self._local = TTLCache(maxsize, ttl)
+        self._types = [record_type.__annotations__[field] for field in record_type._fields]
+
+    def _key(self, user_id: int) -> str:
+        return f'session:{self.namespace}:{user_id}'
+
+    def _encode(self, record: T) -> str:
+        return '|'.join('' if value is None else str(value) for value in record)
+
+    def _decode(self, raw: str) -> T:
+        values = []
+        for kind, part in zip(self._types, raw.split('|')):
+            if part == '':
+                values.append(None)
+            else:
+                values.append((int if kind is int else float if kind is float else str)(part))
+        return self.record_type(*values)
+
+    def get(self, user_id: int) -> Optional[T]:
+        if use_redis():
+            raw = get_redis().get(self._key(user_id))
+            return self._decode(raw) if raw else None
+        return self._local.get(user_id)
+
+    def set(self, user_id: int, record: T):
+        if use_redis():
+            get_redis().setex(self._key(user_id), self.ttl, self._encode(record))
+        else:
+            self._local.set(user_id, record)
+
+    def delete(self, user_id: int):
+        if use_redis():
+            get_redis().delete(self._key(user_id))
+        else:
+            self._local.pop(user_id)
+
+    # Async wrappers: Redis round trips leave the event loop, memory hits don't
+    async def aget(self, user_id: int) -> Optional[T]:
+        if use_redis():
+            return await asyncio.to_thread(self.get, user_id)
+        return self.get(user_id)
+
+    async def aset(self, user_id: int, record: T):
+        if use_redis():
+            await asyncio.to_thread(self.set, user_id, record)
+        else:
+            self.set(user_id, record)
+
+    async def adelete(self, user_id: int):
+        if use_redis():
+            await asyncio.to_thread(self.delete, user_id)
+        else:
+            self.delete(user_id)
@@ -0,0 +1,53 @@
+import logging
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Entry points import this module first, so this approximates process start
+PROCESS_START = time.perf_counter()
+
+
+class ColdStart:
+    """Milestones since process start, logged once the first update is served."""
+
+    def __init__(self):
+        self.marks: List[Tuple[str, float]] = []
+        self.reported = False
+
+    def mark(self, name: str):
+        self.marks.append((name, (time.perf_counter() - PROCESS_START) * 1000))
+
+    def report(self) -> Dict:
+        return {
+            'marks': {name: round(ms, 2) for name, ms in self.marks},
+            'total_ms': round(self.marks[-1][1], 2) if self.marks else 0.0,
+        }
+
+    def log_once(self):
+        if self.reported:
+            return
+        self.reported = True
+        logger.info('Cold start: %s', self.report())
+
+
+cold_start = ColdStart()
+
+
+def measure_imports(modules: List[str]) -> Dict[str, Optional[float]]:
+    """Wall time (ms) to import each module in a fresh interpreter."""
+    probe = 'import importlib, sys, time; t = time.perf_counter(); ' \
+            'importlib.import_module(sys.argv[1]); print((time.perf_counter() - t) * 1000)'
+    results = {}
+    for module in modules:
+        proc = subprocess.run([sys.executable, '-c', probe, module], capture_output=True, text=True)
+        results[module] = round(float(proc.stdout), 2) if proc.returncode == 0 else None
+    return results
+
+
+if __name__ == '__main__':
+    # python -m bot.utils.timing bot.services bot.models bot.handlers
+    for module, ms in measure_imports(sys.argv[1:] or ['bot.services', 'bot.models', 'bot.handlers']).items():
+        print(f'{module:30} {f"{ms} ms" if ms is not None else "failed":>12}')
@@ -0,0 +1,166 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Update fields whose ``chat`` (or, for queries, sender) orders the update
+_CHAT_FIELDS = (
+    'message', 'edited_message', 'channel_post', 'edited_channel_post',
+    'my_chat_member', 'chat_member', 'chat_join_request',
+)
+_SENDER_FIELDS = ('inline_query', 'chosen_inline_result', 'shipping_query', 'pre_checkout_query')
+
+
+def chat_key(update: Dict) -> Optional[int]:
+    """Chat id of a raw Telegram update, or None when it has no chat to order by."""
+    for field in _CHAT_FIELDS:
+        if field in update:
+            return (update[field].get('chat') or {}).get('id')
+    if 'callback_query' in update:
+        query = update['callback_query']
+        chat = (query.get('message') or {}).get('chat')
+        return chat['id'] if chat else (query.get('from') or {}).get('id')
+    for field in _SENDER_FIELDS:
+        if field in update:
+            return (update[field].get('from') or {}).get('id')
+    return None
+
+
+class UpdateQueue:
+    """Bounded in-process queue drained by a fixed pool of consumer tasks.
+
+    ``put()`` waits at most ``put_timeout`` for a free slot and returns False
+    when the queue is still full, so the caller can push back on the sender.
+
+    With a ``key`` (e.g. ``chat_key``) updates sharing a key never run
+    concurrently: the consumer that owns a key also runs the ones queued
+    behind it, lowest ``update_id`` first, while the other consumers keep
+    serving other chats. Ordering holds within one process only; updates of
+    a chat that reach another gunicorn worker run in that worker's queue.
+    """
+
+    def __init__(
+        self,
+        process: Callable[[Any], Awaitable[None]],
+        maxsize: int = 1000,
+        workers: int = 8,
+        put_timeout: float = 0.5,
+        key: Optional[Callable[[Any], Optional[Hashable]]] = None,
+    ):
+        self.process = process
+        self.maxsize = maxsize
+        self.workers = workers
+        self.put_timeout = put_timeout
+        self.key = key
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        # key -> heap of updates waiting for that key's running consumer
+        self._lanes: Dict[Hashable, list] = {}
+        self._order = itertools.count()
+        self.laned = 0
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.busy = 0
+        self.max_depth = 0
+        self.wait_seconds = 0.0
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks = [
+            asyncio.create_task(self._consume(), name=f'update-consumer-{i}')
+            for i in range(self.workers)
+        ]
+
+    async def stop(self, drain: bool = True):
+        if drain and self._queue is not None:
+            await self._queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def put(self, item: Any) -> bool:
+        if self._queue is None:
+            raise RuntimeError('UpdateQueue.put() called before start()')
+        if self._queue.qsize() + self.laned >= self.maxsize:
+            # Updates parked behind busy chats have left the queue but still count
+            self.rejected += 1
+            return False
+        try:
+            await asyncio.wait_for(
+                self._queue.put((time.monotonic(), item)), self.put_timeout
+            )
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return False
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+        return True
+
+    async def _consume(self):
+        while True:
+            queued_at, item = await self._queue.get()
+            key = self.key(item) if self.key is not None else None
+            if key is not None:
+                lane = self._lanes.get(key)
+                if lane is not None:
+                    # Another consumer is running this chat and will pick this up
+                    heapq.heappush(lane, (item.get('update_id', 0), next(self._order), queued_at, item))
+                    self.laned += 1
+                    continue
+                lane = self._lanes[key] = []
+            try:
+                await self._run(queued_at, item)
+                while key is not None and lane:
+                    _, _, queued_at, item = heapq.heappop(lane)
+                    self.laned -= 1
+                    await self._run(queued_at, item)
+            finally:
+                if key is not None:
+                    del self._lanes[key]
+
+    async def _run(self, queued_at: float, item: Any):
+        self.wait_seconds += time.monotonic() - queued_at
+        self.busy += 1
+        try:
+            await self.process(item)
+            self.processed += 1
+        except Exception:
+            self.failed += 1
+            logger.exception('Update processing failed')
+        finally:
+            self.busy -= 1
+            self._queue.task_done()
+
+    def stats(self) -> Dict:
+        done = self.processed + self.failed
+        return {
+            'depth': self._queue.qsize() if self._queue is not None else 0,
+            'maxsize': self.maxsize,
+            'max_depth': self.max_depth,
+            'workers': self.workers,
+            'busy': self.busy,
+            'enqueued': self.enqueued,
+            'processed': self.processed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'avg_wait_ms': round(self.wait_seconds / done * 1000, 3) if done else 0.0,
+            'chats': self.chat_depths(),
+        }
+
+    def chat_depths(self, top: int = 5) -> Dict:
+        """Chats with a running update and how many more wait behind it."""
+        deepest = heapq.nlargest(top, self._lanes.items(), key=lambda lane: len(lane[1]))
+        return {
+            'active': len(self._lanes),
+            'waiting': self.laned,
+            'deepest': {str(key): len(lane) for key, lane in deepest if lane},
+        }
@@ -0,0 +1,34 @@
+# Background worker - drains webhook_events, sends admin broadcasts and sweeps
+# expired subscriptions independently of the web dynos
+# Run with: python -m bot.worker [--workers N] [--batch-size N] [--no-broadcasts] [--no-expiry]
+import argparse
+import threading
+
+from bot.services import broadcast, expiry
+from bot.services.outbox import run_workers
+from bot.utils.config import config
+from bot.utils.log import setup_logging
+from bot.utils.redis_client import warn_without_shared_cache
+
+setup_logging()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Procesa los webhooks encolados de Stripe/MercadoPago, las difusiones de admin y los vencimientos')
+    parser.add_argument('--workers', type=int, default=config.OUTBOX_WORKERS)
+    parser.add_argument('--batch-size', type=int, default=config.OUTBOX_BATCH_SIZE)
+    parser.add_argument('--poll-interval', type=float, default=config.OUTBOX_POLL_INTERVAL)
+    parser.add_argument('--no-broadcasts', action='store_true', help='no enviar difusiones de admin')
+    parser.add_argument('--no-expiry', action='store_true', help='no barrer suscripciones vencidas')
+    args = parser.parse_args()
+    warn_without_shared_cache('bot.worker')
+    stop = threading.Event()
+    if not args.no_broadcasts:
+        threading.Thread(target=broadcast.run_forever, args=(stop,), name='broadcast-runner', daemon=True).start()
+    if not args.no_expiry:
+        threading.Thread(target=expiry.run_forever, args=(stop,), name='expiry-sweeper', daemon=True).start()
+    run_workers(args.workers, args.batch_size, args.poll_interval, stop=stop)
+
+
+if __name__ == '__main__':
+    main()
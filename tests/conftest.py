@@ -0,0 +1,63 @@
+import os
+import tempfile
+
+# Settings are read when bot.utils.config is first imported
+_tmp = tempfile.mkdtemp(prefix='barbosa-tests-')
+os.environ.update({
+    'DATABASE_URL': f'sqlite:///{os.path.join(_tmp, "test.db")}',
+    'METRICS_DIR': os.path.join(_tmp, 'metrics'),
+    'TELEGRAM_TOKEN': '123:abc',
+    'CACHE_BACKEND': 'memory',
+    'LOG_FORMAT': 'text',
+    'STRIPE_SECRET_KEY': 'sk_test',
+    'MP_ACCESS_TOKEN': 'TEST-token',
+})
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    """Fresh SQLite schema per test; yields the scoped session."""
+    from bot.models.base import Base, db_session, get_engine
+    from bot.models import (  # noqa
+        user, payment, subscription, processed_event, webhook_event, broadcast, rollup,
+        webhook_payload, gateway_customer, notification, reconcile_cursor
+    )
+    from bot.services.ledger import event_ledger
+    engine = get_engine()
+    Base.metadata.create_all(bind=engine)
+    # Module-level caches must not remember rows from a previous test's schema
+    event_ledger._recent.clear()
+    yield db_session
+    db_session.remove()
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture(scope='session')
+def bot_api():
+    """Fake Bot API for the whole run; the shared Application is built against it."""
+    from bench.fake_bot_api import FakeBotAPI
+    from bot.utils.config import config
+    api = FakeBotAPI().start()
+    config.TELEGRAM_API_BASE = api.base_url
+    yield api
+    api.stop()
+
+
+@pytest.fixture
+def gateway(monkeypatch):
+    """Fake Stripe/MercadoPago API with fresh HTTP clients pointed at it."""
+    from bench.fake_gateway_api import FakeGatewayAPI
+    from bot.services import gateway_client  # noqa: F401 (registers stripe_http/mp_http)
+    from bot.utils.config import config
+    from bot.utils.registry import registry
+    api = FakeGatewayAPI(count=20, users=2).start()
+    monkeypatch.setattr(config, 'STRIPE_API_BASE', api.base_url)
+    monkeypatch.setattr(config, 'MP_API_BASE', api.base_url)
+    registry.reset('stripe_http')
+    registry.reset('mp_http')
+    yield api
+    registry.reset('stripe_http')
+    registry.reset('mp_http')
+    api.stop()
@@ -0,0 +1,24 @@
+import asyncio
+
+from bench import updates
+from bot import application
+from bot.utils.loop import background_loop
+
+
+def test_entry_points_share_one_application(bot_api, monkeypatch):
+    from api import webhook as serverless
+    monkeypatch.setattr(application, 'ptb_app', None)
+    monkeypatch.setattr(application, '_ptb_lock', None)
+    initialized = bot_api.calls['getMe']
+
+    async def concurrent_first_updates():
+        return await asyncio.gather(*[application.get_ptb_app() for _ in range(10)])
+
+    apps = background_loop.run(concurrent_first_updates(), timeout=10)
+    assert len({id(app) for app in apps}) == 1
+    assert bot_api.calls['getMe'] == initialized + 1
+
+    sent = bot_api.calls['sendMessage']
+    background_loop.run(serverless.process(updates.command(7, '/start')), timeout=10)
+    assert application.ptb_app is apps[0]
+    assert bot_api.calls['sendMessage'] == sent + 1
@@ -0,0 +1,77 @@
+from decimal import Decimal
+
+from sqlalchemy import inspect, text
+
+from bot.models.base import get_engine, init_db
+from bot.models.payment import Payment
+from bot.models.user import User
+from bot.models.webhook_payload import WebhookPayload
+from bot.services.archive import archive_inline_payloads
+
+PAYLOAD = {'id': 'evt_1', 'data': {'object': {'amount': 2900, 'metadata': {'tier': 'pro'}}}}
+
+
+def _payment(gateway_payment_id, **values):
+    return Payment(user_id=1, gateway='stripe', gateway_payment_id=gateway_payment_id,
+                   amount=Decimal('29.00'), **values)
+
+
+def test_payload_round_trips_compressed():
+    payload = dict(PAYLOAD, padding='x' * 1000)
+    archived = WebhookPayload.pack('stripe', payload)
+    assert archived.unpack() == payload
+    assert len(archived.data) < archived.size
+
+
+def test_payments_read_through_the_archive(db):
+    db.add(User(id=1, telegram_id=10))
+    payment = _payment('pi_1')
+    payment.raw_webhook_data = PAYLOAD
+    db.add(payment)
+    db.commit()
+    db.expunge_all()
+    payment = db.query(Payment).one()
+    assert payment.raw_payload_id is not None
+    assert payment.raw_webhook_data == PAYLOAD
+
+
+def test_archive_moves_inline_payloads_once(db):
+    db.add(User(id=1, telegram_id=10))
+    db.add_all([
+        _payment('pi_1', legacy_raw_webhook_data=PAYLOAD),
+        _payment('pi_2', legacy_raw_webhook_data={'id': 'evt_2'}),
+        _payment('pi_3'),
+    ])
+    db.commit()
+    assert archive_inline_payloads(batch_size=2) == 2
+    assert archive_inline_payloads() == 0
+    payments = {payment.gateway_payment_id: payment for payment in db.query(Payment)}
+    assert payments['pi_1'].legacy_raw_webhook_data is None
+    assert payments['pi_1'].raw_webhook_data == PAYLOAD
+    assert payments['pi_2'].raw_webhook_data == {'id': 'evt_2'}
+    assert payments['pi_3'].raw_webhook_data is None
+    assert db.query(WebhookPayload).count() == 2
+
+
+def test_init_db_adds_raw_payload_id_to_existing_payments(db):
+    engine = get_engine()
+    columns = ', '.join(
+        column['name'] for column in inspect(engine).get_columns('payments') if column['name'] != 'raw_payload_id'
+    )
+    # A payments table from before the archive existed
+    with engine.begin() as conn:
+        conn.execute(text('ALTER TABLE payments RENAME TO payments_old'))
+        conn.execute(text(f'CREATE TABLE payments AS SELECT {columns} FROM payments_old'))
+        conn.execute(text('DROP TABLE payments_old'))
+    assert 'raw_payload_id' not in {column['name'] for column in inspect(engine).get_columns('payments')}
+
+    init_db()
+    init_db()
+    assert 'raw_payload_id' in {column['name'] for column in inspect(engine).get_columns('payments')}
+    db.add(User(id=1, telegram_id=10))
+    payment = Payment(id=1, user_id=1, gateway='stripe', amount=29)
+    payment.raw_webhook_data = {'id': 'evt_1'}
+    db.add(payment)
+    db.commit()
+    db.expunge_all()
+    assert db.get(Payment, 1).raw_webhook_data == {'id': 'evt_1'}
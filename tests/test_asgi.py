@@ -0,0 +1,46 @@
+import asyncio
+import json
+
+from bench import updates
+from bot import application
+
+
+async def _post(app, path: str, body: bytes):
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    await app({'type': 'http', 'path': path, 'method': 'POST'}, receive, send)
+    return sent[0]['status']
+
+
+def test_acks_then_processes_in_queue(bot_api, monkeypatch):
+    import asgi
+    # The Application binds to the loop that initializes it; build one for this loop
+    monkeypatch.setattr(application, 'ptb_app', None)
+    monkeypatch.setattr(application, '_ptb_lock', None)
+    lifespan = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+    events, statuses = [], []
+
+    async def receive():
+        return lifespan.pop(0)
+
+    async def send(message):
+        events.append(message['type'])
+        if message['type'] == 'lifespan.startup.complete':
+            # Requests served while the server is up
+            statuses.append(await _post(asgi.app, '/webhook', b'{not json'))
+            for chat_id in range(5):
+                body = json.dumps(updates.command(chat_id, '/start')).encode()
+                statuses.append(await _post(asgi.app, '/webhook', body))
+
+    sent = bot_api.calls['sendMessage']
+    asyncio.run(asgi.app({'type': 'lifespan'}, receive, send))
+    assert events == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+    assert statuses == [400] + [200] * 5
+    # Shutdown drains the queue before the loop goes away
+    assert bot_api.calls['sendMessage'] == sent + 5
@@ -0,0 +1,59 @@
+from bot.models.gateway_customer import GatewayCustomer
+from bot.models.payment import Payment
+from bot.models.rollup import DailyRevenue, DailySubscriptions
+from bot.models.subscription import Subscription
+from bot.models.user import User
+from bot.services.stripe_service import StripeService
+
+
+def _event(event_id, event_type, data):
+    return {'id': event_id, 'type': event_type, 'data': {'object': data}}
+
+
+CHECKOUT = _event('evt_1', 'checkout.session.completed', {
+    'id': 'cs_1', 'payment_intent': 'pi_1', 'customer': 'cus_1', 'subscription': 'sub_1',
+    'amount_total': 2900, 'currency': 'usd', 'metadata': {'user_id': '1', 'tier': 'pro'},
+})
+
+
+def test_failed_event_rolls_back_alone(db):
+    db.add(User(id=1, telegram_id=10))
+    db.commit()
+    events = [
+        CHECKOUT,
+        # Marks the subscription past_due, then fails on the period end
+        _event('evt_2', 'customer.subscription.updated',
+               {'id': 'sub_1', 'status': 'past_due', 'current_period_end': 'soon'}),
+        _event('evt_3', 'invoice.payment_failed', {'subscription': 'sub_missing'}),
+        CHECKOUT,
+    ]
+    results = [status for status, _ in StripeService.process_batch(events)]
+    assert results == ['success', 'error', 'success', 'duplicate']
+
+    subscription = db.query(Subscription).one()
+    assert subscription.status == 'active'
+    assert db.query(Payment).one().gateway_payment_id == 'pi_1'
+    assert db.query(GatewayCustomer).one().customer_id == 'cus_1'
+    rollup = db.query(DailySubscriptions).one()
+    # The rolled back past_due transition left no rollup delta behind
+    assert (rollup.new, rollup.past_due) == (1, 0)
+    assert db.query(DailyRevenue).one().payments == 1
+
+    # A later redelivery is answered from the ledger
+    assert StripeService.process_batch([CHECKOUT])[0][0] == 'duplicate'
+
+
+def test_first_invoice_is_not_counted_twice(db):
+    db.add(User(id=1, telegram_id=10))
+    db.commit()
+    first_invoice = _event('evt_2', 'invoice.payment_succeeded', {
+        'id': 'in_1', 'subscription': 'sub_1', 'payment_intent': 'pi_1', 'billing_reason': 'subscription_create',
+        'amount_paid': 2900, 'currency': 'usd', 'period_start': 1790000000, 'period_end': 1792600000,
+    })
+    results = [status for status, _ in StripeService.process_batch([CHECKOUT, first_invoice])]
+    assert results == ['success', 'success']
+
+    assert db.query(Payment).one().gateway_payment_id == 'pi_1'
+    revenue = db.query(DailyRevenue).one()
+    assert (revenue.payments, float(revenue.amount)) == (1, 29.0)
+    assert db.query(Subscription).one().current_period_end is not None
@@ -0,0 +1,23 @@
+from collections import Counter
+
+from bench import updates
+
+
+def test_mix_is_deterministic_and_weighted():
+    kinds = [kind for kind, _ in updates.mix(20, chats=3)]
+    assert Counter(kinds) == {kind: weight * 2 for kind, weight in updates.DEFAULT_MIX.items()}
+    chats = {update.get('message', update.get('callback_query', {}).get('message'))['chat']['id']
+             for _, update in updates.mix(20, chats=3)}
+    assert chats == {100000, 100001, 100002}
+
+
+def test_every_kind_in_the_mix_gets_a_reply(db, bot_api):
+    from bot.main import app
+    client = app.test_client()
+    before = Counter(bot_api.calls)
+    for kind in updates.DEFAULT_MIX:
+        assert client.post('/webhook', json=updates.build(kind, 7)).status_code == 200
+    calls = Counter(bot_api.calls) - before
+    replies = calls['sendMessage'] + calls['editMessageText']
+    assert replies == len(updates.DEFAULT_MIX)
+    assert calls['answerCallbackQuery'] == sum(kind not in ('start', 'dscr_calc') for kind in updates.DEFAULT_MIX)
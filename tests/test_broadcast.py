@@ -0,0 +1,85 @@
+import asyncio
+import logging
+
+import pytest
+from telegram.error import Forbidden
+
+from bot.models.broadcast import Broadcast
+from bot.models.user import User
+from bot.services import broadcast
+from bot.utils.config import config
+
+
+class FakeBot:
+    def __init__(self, blocked=()):
+        self.blocked = set(blocked)
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        if chat_id in self.blocked:
+            raise Forbidden('bot was blocked by the user')
+        self.sent.append(chat_id)
+
+
+def test_parse_command():
+    assert broadcast.parse_command('tier=pro,enterprise lang=es Hola a todos') == (
+        {'tier': ['pro', 'enterprise'], 'lang': ['es']}, 'Hola a todos'
+    )
+    assert broadcast.parse_command('Sin filtros') == ({}, 'Sin filtros')
+
+
+def test_segment_counts_default_columns(db):
+    db.add_all([
+        User(telegram_id=1, subscription_tier='pro'),
+        User(telegram_id=2, subscription_tier=None),
+        User(telegram_id=3, subscription_tier='basic'),
+    ])
+    db.commit()
+    assert broadcast.segment_query({'tier': ['free']}).count() == 1
+    assert broadcast.segment_query({'tier': ['pro', 'basic']}).count() == 2
+
+
+def test_run_resumes_from_the_checkpoint(db, monkeypatch):
+    monkeypatch.setattr(config, 'BROADCAST_CHUNK_SIZE', 2)
+    db.add_all([User(id=user_id, telegram_id=user_id * 10) for user_id in range(1, 6)])
+    db.commit()
+    created = broadcast.create('Hola', created_by=1, filters={})
+    assert created.total == 5
+
+    claimed = broadcast.claim()
+    # A previous runner got through user 2 before it died
+    broadcast.checkpoint(claimed.id, 2, sent=2, blocked=0, failed=0)
+    bot = FakeBot(blocked={40})
+    assert asyncio.run(broadcast.run(claimed, bot)) == 'done'
+    assert bot.sent == [30, 50]
+    assert broadcast.progress(broadcast.get()) == {
+        'id': claimed.id, 'status': 'done', 'total': 5, 'sent': 4, 'blocked': 1, 'failed': 0,
+    }
+    assert broadcast.claim() is None
+
+
+def test_cancelled_broadcast_is_not_claimed(db):
+    created = broadcast.create('Hola', created_by=1, filters={'tier': ['pro']})
+    assert broadcast.cancel(created.id).status == 'cancelled'
+    assert broadcast.claim() is None
+    assert db.query(Broadcast.finished_at).scalar() is not None
+
+
+def test_broadcast_rate_fits_telegram_limit(monkeypatch, caplog):
+    monkeypatch.setattr(config, 'OUTBOUND_GLOBAL_RATE', 20)
+    monkeypatch.setattr(config, 'BROADCAST_RATE', 10)
+    assert broadcast.broadcast_rate() == 10
+    monkeypatch.setattr(config, 'BROADCAST_RATE', 25)
+    with caplog.at_level(logging.WARNING):
+        assert broadcast.broadcast_rate() == 10
+    assert 'capped' in caplog.text
+    monkeypatch.setattr(config, 'OUTBOUND_GLOBAL_RATE', 30)
+    with pytest.raises(ValueError):
+        broadcast.broadcast_rate()
+
+
+def test_worker_bots_share_one_limiter(monkeypatch):
+    monkeypatch.setattr(broadcast, '_limiter', None)
+    first, second = broadcast.build_bot(), broadcast.build_bot()
+    assert first.rate_limiter is second.rate_limiter
+    assert first.rate_limiter.global_bucket.rate + config.OUTBOUND_GLOBAL_RATE <= 30
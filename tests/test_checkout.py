@@ -0,0 +1,53 @@
+import asyncio
+from types import SimpleNamespace
+
+from bot.services.checkout import CheckoutLinks
+
+
+def test_concurrent_taps_share_one_creation():
+    links = CheckoutLinks(ttl=60)
+    calls = []
+
+    async def create(tg_user, tier, gateway):
+        calls.append((tg_user.id, tier, gateway))
+        await asyncio.sleep(0.01)
+        return f'https://pay/{tg_user.id}/{tier}'
+
+    links._create = create
+    user = SimpleNamespace(id=5)
+
+    async def taps():
+        return await asyncio.gather(*[links.get(user, 'pro', 'stripe') for _ in range(10)])
+
+    assert set(asyncio.run(taps())) == {'https://pay/5/pro'}
+    assert len(calls) == 1
+    assert links.stats()['shared'] == 9
+
+    assert asyncio.run(links.get(user, 'pro', 'stripe')) == 'https://pay/5/pro'
+    assert links.reused == 1
+    links.invalidate_many([5])
+    assert links.cached(5, 'pro', 'stripe') is None
+
+
+
+def test_failed_creation_reaches_every_waiter_and_is_retried():
+    links = CheckoutLinks(ttl=60)
+    calls = []
+
+    async def create(tg_user, tier, gateway):
+        calls.append(tier)
+        await asyncio.sleep(0.01)
+        if len(calls) == 1:
+            raise RuntimeError('gateway down')
+        return 'https://pay/ok'
+
+    links._create = create
+    user = SimpleNamespace(id=5)
+
+    async def taps():
+        return await asyncio.gather(*[links.get(user, 'pro', 'stripe') for _ in range(3)], return_exceptions=True)
+
+    assert [type(result) for result in asyncio.run(taps())] == [RuntimeError] * 3
+    assert links.stats()['inflight'] == 0
+    assert asyncio.run(links.get(user, 'pro', 'stripe')) == 'https://pay/ok'
+    assert len(calls) == 2
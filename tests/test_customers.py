@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from bot.models.gateway_customer import GatewayCustomer
+from bot.models.payment import Payment
+from bot.models.user import User
+from bot.services.customers import CustomerDirectory
+
+
+def test_first_writer_wins_and_is_cached(db):
+    directory = CustomerDirectory()
+    assert directory.get(1, 'stripe') is None
+    assert directory.remember(1, 'stripe', 'cus_a') == 'cus_a'
+    # A concurrent checkout that created another customer gets the stored one
+    assert CustomerDirectory().remember(1, 'stripe', 'cus_b') == 'cus_a'
+    db.query(GatewayCustomer).delete()
+    db.commit()
+    assert directory.get(1, 'stripe') == 'cus_a'
+    assert directory.get(1, 'mercadopago') is None
+
+
+def test_falls_back_to_earliest_payment(db):
+    db.add(User(id=1, telegram_id=10))
+    db.add_all([
+        Payment(user_id=1, gateway='stripe', gateway_payment_id=f'pi_{n}', gateway_customer_id=customer,
+                amount=Decimal('29.00'), created_at=datetime(2026, 1, 1) + timedelta(days=n))
+        for n, customer in ((1, 'cus_new'), (0, 'cus_old'))
+    ])
+    db.commit()
+    assert CustomerDirectory().get(1, 'stripe') == 'cus_old'
+    # The fallback is saved so the next process skips the payments scan
+    assert db.query(GatewayCustomer.customer_id).scalar() == 'cus_old'
+
+
+def test_stage_joins_the_callers_transaction(db):
+    directory = CustomerDirectory()
+    directory.stage(1, 'stripe', 'cus_a')
+    db.rollback()
+    assert directory.get(1, 'stripe') is None
+    directory.stage(1, 'stripe', 'cus_a')
+    db.commit()
+    assert directory.get(1, 'stripe') == 'cus_a'
@@ -0,0 +1,90 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from bot.analytics import dscr  # noqa: E402
+from bot.utils.config import config  # noqa: E402
+
+CSV = 'nombre,valor,prestamo,tasa,plazo,renta\nA,300000,240000,7,30,2500\nB,200000,150000,7,30,900\n'
+
+
+@pytest.fixture
+def client(monkeypatch):
+    from bot.main import app
+    monkeypatch.setattr(config, 'DSCR_API_TOKEN', 'secret')
+    return app.test_client()
+
+
+def _post(client, token='secret', **kwargs):
+    return client.post('/api/dscr', headers={'Authorization': f'Bearer {token}'}, **kwargs)
+
+
+def test_monthly_payment_matches_amortization():
+    payments = dscr.monthly_payment([240000, 120000], [7, 0], [30, 10])
+    assert payments == pytest.approx([1596.73, 1000.0], abs=0.01)
+
+
+def test_row_limit_stops_parsing():
+    def rows():
+        for index in range(10):
+            yield {'name': str(index), 'rent': 1}
+        raise AssertionError('read past the limit')
+
+    with pytest.raises(dscr.TooManyRows):
+        dscr.from_records(rows(), max_rows=3)
+    assert len(dscr.from_records([{'rent': 1}] * 3, max_rows=3)['name']) == 3
+
+
+def test_analysis(client):
+    response = _post(client, data=CSV, content_type='text/csv')
+    assert response.status_code == 200
+    ranked = response.get_json()['ranked']
+    assert [row['name'] for row in ranked] == ['A', 'B']
+    assert [row['status'] for row in ranked] == ['EXCELENTE', 'NO CALIFICA']
+
+
+def test_json_records_and_aliases(client):
+    response = _post(client, query_string={'limit': 1}, json={'properties': [
+        {'address': 'x', 'price': '$100,000', 'payment': 1000, 'rent': 1100, 'gastos': 100},
+        {'name': 'y', 'payment': 1000, 'rent': 1500},
+    ]})
+    ranked = response.get_json()['ranked']
+    assert [(row['name'], row['dscr'], row['status']) for row in ranked] == [('y', 1.5, 'EXCELENTE')]
+    assert _post(client, json={'properties': []}).status_code == 400
+
+
+def test_requires_token(client, monkeypatch):
+    assert _post(client, token='wrong', data=CSV).status_code == 401
+    monkeypatch.setattr(config, 'DSCR_API_TOKEN', '')
+    assert _post(client, token='', data=CSV).status_code == 403
+
+
+@pytest.mark.parametrize('kwargs', [
+    {'data': 'nombre,renta\nx,abc', 'content_type': 'text/csv'},
+    {'json': {'properties': ['x']}},
+    {'json': ['x']},
+    {'data': '{not json', 'content_type': 'application/json'},
+    {'data': b'\xff\xfe\x00', 'content_type': 'text/csv'},
+])
+def test_bad_input_is_400(client, kwargs):
+    assert _post(client, **kwargs).status_code == 400
+
+
+def test_limits(client, monkeypatch):
+    monkeypatch.setattr(config, 'DSCR_MAX_UPLOAD_BYTES', 64)
+    assert _post(client, data=CSV * 3, content_type='text/csv').status_code == 413
+    monkeypatch.setattr(config, 'DSCR_MAX_UPLOAD_BYTES', 1024)
+    monkeypatch.setattr(config, 'DSCR_MAX_ROWS', 1)
+    assert _post(client, data=CSV, content_type='text/csv').status_code == 413
+
+
+def test_rows_without_debt_rank_last():
+    analysis = dscr.analyze(dscr.from_records([
+        {'name': 'cash', 'value': 100000, 'rent': 1000},
+        {'name': 'low', 'loan': 100000, 'rate': 7, 'rent': 500},
+        {'name': 'high', 'loan': 100000, 'rate': 7, 'rent': 1500},
+    ]))
+    ranked = analysis.ranked()
+    assert [row['name'] for row in ranked] == ['high', 'low', 'cash']
+    assert (ranked[-1]['status'], ranked[-1]['dscr']) == ('SIN DEUDA', None)
+    assert analysis.summary()['by_status'] == {'EXCELENTE': 1, 'NO CALIFICA': 1, 'SIN DEUDA': 1}
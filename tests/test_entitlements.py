@@ -0,0 +1,54 @@
+import logging
+import sys
+from datetime import datetime, timedelta
+
+from bot.models.user import User
+from bot.services.checkout import CheckoutLinks
+from bot.services.entitlements import EntitlementCache
+from bot.utils.config import config
+
+
+def test_cached_until_invalidated(db):
+    db.add(User(telegram_id=10, subscription_tier='pro', subscription_status='active'))
+    db.commit()
+    cache = EntitlementCache(maxsize=10, ttl=60)
+    assert cache.get(10).is_paid
+
+    db.query(User).filter_by(telegram_id=10).update({'subscription_tier': 'free'})
+    db.commit()
+    assert cache.get(10).tier == 'pro'
+    cache.invalidate_many([10, None])
+    assert cache.get(10).tier == 'free'
+
+
+def test_unknown_user_is_free(db):
+    assert not EntitlementCache().get(999).is_paid
+
+
+def test_lapsed_plan_is_not_paid(db):
+    db.add(User(telegram_id=10, subscription_tier='pro', subscription_status='active',
+                subscription_expires_at=datetime.utcnow() - timedelta(minutes=1)))
+    db.commit()
+    entitlement = EntitlementCache().get(10)
+    assert (entitlement.tier, entitlement.is_paid) == ('pro', False)
+
+
+def test_worker_runs_with_per_process_cache(monkeypatch, caplog):
+    from bot import worker
+    monkeypatch.setattr(config, 'CACHE_BACKEND', 'memory')
+    monkeypatch.setattr(sys, 'argv', ['bot.worker', '--no-broadcasts', '--no-expiry'])
+    started = []
+    monkeypatch.setattr(worker, 'run_workers', lambda *args, **kwargs: started.append(args))
+    with caplog.at_level(logging.WARNING):
+        worker.main()
+    assert started
+    assert 'LOCAL_CACHE_TTL' in caplog.text
+
+
+def test_local_entries_expire_fast_without_redis(monkeypatch):
+    monkeypatch.setattr(config, 'LOCAL_CACHE_TTL', 30)
+    monkeypatch.setattr(config, 'CACHE_BACKEND', 'memory')
+    assert EntitlementCache(ttl=300)._local.ttl == 30
+    assert CheckoutLinks(ttl=1200)._local.ttl == 30
+    monkeypatch.setattr(config, 'CACHE_BACKEND', 'redis')
+    assert EntitlementCache(ttl=300)._local.ttl == 300
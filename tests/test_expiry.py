@@ -0,0 +1,63 @@
+import asyncio
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from bot.models.notification import Notification
+from bot.models.rollup import DailySubscriptions
+from bot.models.subscription import Subscription
+from bot.models.user import User
+from bot.services import expiry
+from bot.utils.config import config
+
+NOW = datetime(2026, 10, 17, 12, 0)
+
+
+def _seed(db):
+    for user_id in (1, 2, 3, 4):
+        db.add(User(id=user_id, telegram_id=user_id * 10, subscription_tier='pro', subscription_status='active'))
+
+    def subscription(user_id, status, ends, **values):
+        db.add(Subscription(user_id=user_id, gateway='stripe',
+                            tier='pro', status=status, amount=Decimal('29.00'),
+                            current_period_end=NOW + ends, **values))
+
+    subscription(1, 'active', timedelta(days=-3))
+    subscription(2, 'past_due', timedelta(days=-5))
+    subscription(2, 'active', timedelta(days=2))
+    subscription(3, 'past_due', timedelta(days=-1))  # still inside the grace period
+    subscription(4, 'active', timedelta(days=1), cancel_at_period_end=True)
+    db.commit()
+
+
+def test_sweep_expires_lapsed_plans_and_queues_reminders(db, monkeypatch):
+    monkeypatch.setattr(config, 'EXPIRY_BATCH_SIZE', 1)
+    _seed(db)
+    assert asyncio.run(expiry.sweep(now=NOW)) == {'expired': 2, 'reminders': 2, 'delivered': 0}
+
+    statuses = {(row.user_id, row.status) for row in db.query(Subscription)}
+    assert statuses == {(1, 'expired'), (2, 'expired'), (2, 'active'), (3, 'past_due'), (4, 'active')}
+    tiers = dict(db.query(User.id, User.subscription_tier))
+    # User 2 keeps the plan through their other live subscription
+    assert tiers == {1: 'free', 2: 'pro', 3: 'pro', 4: 'pro'}
+    assert db.query(DailySubscriptions.cancelled).scalar() == 2
+
+    reminders = {row.telegram_id: row.text for row in db.query(Notification)}
+    assert reminders[20].startswith('🔄') and '19/10/2026' in reminders[20]
+    assert reminders[40].startswith('⏳')
+
+    # A second pass finds nothing new
+    assert asyncio.run(expiry.sweep(now=NOW)) == {'expired': 0, 'reminders': 0, 'delivered': 0}
+
+
+def test_sweep_delivers_queued_reminders(db, bot_api):
+    from bot.services.broadcast import build_bot
+    _seed(db)
+    sent = bot_api.calls['sendMessage']
+
+    async def run():
+        async with build_bot() as bot:
+            return await expiry.sweep(bot, now=NOW)
+
+    assert asyncio.run(run())['delivered'] == 2
+    assert bot_api.calls['sendMessage'] == sent + 2
+    assert {status for status, in db.query(Notification.status)} == {'sent'}
@@ -0,0 +1,56 @@
+import asyncio
+
+from bot.models.payment import Payment
+from bot.models.user import User
+from bot.services.gateway_client import encode_form, operation_label
+from bot.services.mp_service import MercadoPagoService
+from bot.services.stripe_service import StripeService
+from bot.utils.registry import registry
+
+
+def test_operation_label_and_form_encoding():
+    assert operation_label('GET', '/v1/customers/cus_123?expand=x') == 'GET /v1/customers/:id'
+    assert operation_label('GET', '/v1/payments/555') == 'GET /v1/payments/:id'
+    assert encode_form({'a': {'b': [{'c': 1}]}, 'd': True, 'e': None}) == {'a[b][0][c]': '1', 'd': 'true'}
+
+
+def test_checkout_calls_share_one_pool(db, gateway, monkeypatch):
+    monkeypatch.setitem(StripeService.TIER_PRICES, 'pro', 'price_pro')
+    user = User(telegram_id=1)
+    db.add(user)
+    db.commit()
+
+    async def checkout():
+        try:
+            session = await StripeService.create_checkout_session_async(user, 'pro')
+            again = await StripeService.create_checkout_session_async(user, 'pro')
+            preference = await MercadoPagoService.create_preference_async(user, 'pro')
+            return session, again, preference
+        finally:
+            await registry.get('stripe_http').aclose()
+            await registry.get('mp_http').aclose()
+
+    session, again, preference = asyncio.run(checkout())
+    assert session['url'].endswith('/pay/cs_fake1')
+    # The customer is created once and then read from gateway_customers
+    assert session['customer_id'] == again['customer_id'] == 'cus_fake1'
+    assert gateway.calls['/v1/customers'] == 1
+    assert preference['external_reference'] == f'{user.id}|pro'
+
+
+def test_mp_webhook_async(db, gateway):
+    db.add(User(id=2, telegram_id=2))
+    db.commit()
+
+    async def notify():
+        try:
+            return await MercadoPagoService.process_webhook_async(
+                {'id': 'n1', 'action': 'payment.created', 'data': {'id': 10_000_001}}
+            )
+        finally:
+            await registry.get('mp_http').aclose()
+
+    assert asyncio.run(notify()) is not None
+    payment = db.query(Payment).filter_by(gateway_payment_id='10000001').one()
+    assert (payment.status, payment.user_id) == ('completed', 2)
+    assert db.get(User, 2).subscription_tier == 'pro'
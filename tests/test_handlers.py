@@ -0,0 +1,29 @@
+import asyncio
+from types import SimpleNamespace
+
+from bot.handlers import show_account
+from bot.models.user import User
+
+
+def _callback(telegram_id):
+    sent = {}
+
+    async def edit_message_text(**kwargs):
+        sent.update(kwargs)
+
+    query = SimpleNamespace(
+        from_user=SimpleNamespace(id=telegram_id, language_code='es'),
+        edit_message_text=edit_message_text,
+    )
+    return SimpleNamespace(callback_query=query), sent
+
+
+def test_account_escapes_status(db):
+    from bot.services.entitlements import entitlements
+    db.add(User(telegram_id=77, subscription_tier='pro', subscription_status='past_due'))
+    db.commit()
+    entitlements.invalidate(77)
+    update, sent = _callback(77)
+    asyncio.run(show_account(update, None))
+    assert '*Estado:* past\\_due' in sent['text']
+    assert sent['parse_mode'] == 'Markdown'
@@ -0,0 +1,34 @@
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from bot.models.processed_event import ProcessedEvent
+from bot.models.user import User
+from bot.services.ledger import EventLedger
+
+
+def test_seen_many_reads_through_and_caches(db):
+    ledger = EventLedger(maxsize=2)
+    ledger.record('stripe', 'evt_1', 'invoice.paid')
+    db.commit()
+    assert ledger.seen_many('stripe', ['evt_1', 'evt_2']) == {'evt_1'}
+    assert ('stripe', 'evt_1') in ledger._recent
+    assert not ledger.seen('mercadopago', 'evt_1')
+
+
+def test_is_duplicate_distinguishes_constraints(db):
+    ledger = EventLedger()
+    db.add(ProcessedEvent(gateway='stripe', event_id='evt_1'))
+    db.add(User(telegram_id=1))
+    db.commit()
+
+    ledger.record('stripe', 'evt_1')
+    with pytest.raises(IntegrityError) as duplicate:
+        db.flush()
+    db.rollback()
+    assert ledger.is_duplicate(duplicate.value)
+
+    db.add(User(telegram_id=1))
+    with pytest.raises(IntegrityError) as other:
+        db.flush()
+    db.rollback()
+    assert not ledger.is_duplicate(other.value)
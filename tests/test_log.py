@@ -0,0 +1,41 @@
+import json
+import logging
+
+from bot.utils import log
+from bot.utils.log import JsonFormatter, SamplingFilter
+
+
+def _record(level=logging.INFO, **extra):
+    record = logging.LogRecord('bot.test', level, __file__, 1, 'handled %s', ('start',), None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_lines_carry_extra_fields():
+    line = JsonFormatter().format(_record(update_id=5, chat_id=42, sample=True))
+    payload = json.loads(line)
+    assert payload['msg'] == 'handled start'
+    assert payload['level'] == 'INFO'
+    assert (payload['update_id'], payload['chat_id']) == (5, 42)
+    # Standard LogRecord attributes and the sampling flag stay out
+    assert not {'args', 'lineno', 'sample'} & set(payload)
+
+
+def test_sampling_only_drops_marked_info_records():
+    drop_all = SamplingFilter(0.0)
+    assert not drop_all.filter(_record(sample=True))
+    assert drop_all.filter(_record())
+    assert drop_all.filter(_record(logging.WARNING, sample=True))
+    assert SamplingFilter(1.0).filter(_record(sample=True))
+    half = SamplingFilter(0.5)
+    kept = sum(half.filter(_record(sample=True)) for _ in range(2000))
+    assert 800 < kept < 1200
+
+
+def test_log_update_records_handler_and_chat(caplog):
+    update = type('Update', (), {'update_id': 9, 'effective_chat': type('Chat', (), {'id': 42})()})()
+    with caplog.at_level(logging.INFO, logger='bot.updates'):
+        log.log_update(update, 'start', 0.0125)
+    record = caplog.records[-1]
+    assert (record.update_id, record.chat_id, record.handler) == (9, 42, 'start')
+    assert record.duration_ms == 12.5
@@ -0,0 +1,29 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from bench import updates
+from bot.utils.loop import BackgroundLoop
+
+
+def test_request_threads_share_one_loop():
+    background = BackgroundLoop('test-loop')
+
+    async def where():
+        await asyncio.sleep(0)
+        return id(asyncio.get_running_loop()), threading.current_thread().name
+
+    with ThreadPoolExecutor(8) as pool:
+        seen = set(pool.map(lambda _: background.run(where(), timeout=5), range(32)))
+    assert seen == {(id(background.loop), 'test-loop')}
+    assert background.submit(where()).result(5) in seen
+
+
+def test_flask_webhook_processes_before_answering(db, bot_api):
+    from bot.main import app
+    client = app.test_client()
+    sent = bot_api.calls['sendMessage']
+    response = client.post('/webhook', json=updates.command(42, '/start'))
+    assert response.status_code == 200
+    # WEBHOOK_EARLY_ACK is off: the reply went out before Telegram got its 200
+    assert bot_api.calls['sendMessage'] == sent + 1
@@ -0,0 +1,29 @@
+from bot.menus import TIERS, MenuRegistry, TEXTS, menus
+
+
+def test_screens_are_built_once_and_shared():
+    assert menus.get('view_plans') is menus.get('view_plans', 'es')
+    assert menus.get('start', admin=True) is not menus.get('start')
+    assert '[ADMIN]' in menus.get('start', admin=True).text
+    assert all(menus.get(f'buy_{tier}').reply_markup is not None for tier in TIERS)
+
+
+def test_locale_and_admin_variants_fall_back():
+    # Unknown locale -> 'es'; screens without an admin variant -> the regular one
+    assert menus.get('financing_menu', 'fr-FR') is menus.get('financing_menu')
+    assert menus.get('financing_menu', admin=True) is menus.get('financing_menu')
+    assert menus.text('btn_back', 'pt') == TEXTS['es']['btn_back']
+
+
+def test_format_only_fills_the_text():
+    screen = menus.get('start')
+    kwargs = screen.format(name='Ana')
+    assert kwargs['text'].startswith('Hola Ana')
+    assert kwargs['reply_markup'] is screen.reply_markup
+    assert screen.kwargs['text'] == screen.text
+
+
+def test_registry_builds_every_locale():
+    registry = MenuRegistry({'es': TEXTS['es'], 'en': dict(TEXTS['es'], view_plans='*Plans*')})
+    assert registry.get('view_plans', 'en').text == '*Plans*'
+    assert registry.get('view_plans', 'en_US').text == '*Plans*'
@@ -0,0 +1,81 @@
+import json
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from bot.models.user import User
+from bot.utils.metrics import Metrics, metrics
+
+
+def test_render_merges_process_files(tmp_path):
+    registry = Metrics(str(tmp_path), flush_interval=60, buckets=(0.1, 1.0))
+    registry.inc('updates_total', handler='start')
+    registry.observe('handler_seconds', 0.05, handler='start')
+    registry.observe('handler_seconds', 5.0, handler='start')
+    # Another worker of the same dyno
+    (tmp_path / '1.json').write_text(json.dumps({
+        'counters': [['updates_total', [['handler', 'start']], 2]], 'histograms': [],
+    }))
+
+    text = registry.render()
+    assert 'updates_total{handler="start"} 3' in text
+    assert 'handler_seconds_bucket{handler="start",le="0.1"} 1' in text
+    assert 'handler_seconds_bucket{handler="start",le="+Inf"} 2' in text
+    assert 'handler_seconds_count{handler="start"} 2' in text
+
+
+def test_timer_counts_errors(tmp_path):
+    registry = Metrics(str(tmp_path), flush_interval=60)
+
+    @registry.timed('gateway_request_seconds', gateway='stripe')
+    def fail():
+        raise RuntimeError
+
+    with pytest.raises(RuntimeError):
+        fail()
+    counters, histograms = registry.collect()
+    key = ('gateway_request_seconds', (('gateway', 'stripe'),))
+    assert counters[('gateway_request_errors_total', key[1])] == 1
+    assert sum(histograms[key][0]) == 1
+
+
+def test_db_queries_are_timed(db):
+    db.query(User).count()
+    db.commit()
+    counters, histograms = metrics.collect()
+    assert ('db_query_seconds', (('statement', 'SELECT'),)) in histograms
+    assert ('db_commit_seconds', ()) in histograms
+
+
+def test_failed_query_leaves_no_timing_behind(db):
+    key = ('db_query_seconds', (('statement', 'SELECT'),))
+    with pytest.raises(OperationalError):
+        db.execute(text('SELECT * FROM missing_table'))
+    db.rollback()
+    before = sum(metrics.collect()[1].get(key, [[0]])[0])
+    db.execute(text('SELECT 1'))
+    assert sum(metrics.collect()[1][key][0]) == before + 1
+    # Start times used to pile up on the pooled connection
+    assert 'query_started' not in db.connection().info
+
+
+def test_files_of_exited_processes_are_pruned(tmp_path):
+    registry = Metrics(str(tmp_path), flush_interval=60)
+    registry.inc('updates_total', handler='start')
+    # Beyond the kernel's largest pid, so never a live process
+    dead = tmp_path / f'{2 ** 22 + 1}.json'
+    dead.write_text(json.dumps({'counters': [['updates_total', [['handler', 'start']], 5]], 'histograms': []}))
+
+    counters, _ = registry.collect()
+    assert counters[('updates_total', (('handler', 'start'),))] == 1
+    assert not dead.exists()
+
+
+def test_metrics_endpoint_serves_prometheus_text():
+    from bot.main import app
+    metrics.inc('updates_total', handler='start')
+    response = app.test_client().get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    assert 'updates_total{handler="start"}' in response.get_data(as_text=True)
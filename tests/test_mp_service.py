@@ -0,0 +1,79 @@
+from bot.models.payment import Payment
+from bot.models.rollup import DailyRevenue
+from bot.models.user import User
+from bot.services.mp_service import MercadoPagoService
+
+
+def _payment(status, payment_id=501, user_id=1):
+    return {
+        'id': payment_id,
+        'status': status,
+        'external_reference': f'{user_id}|pro',
+        'transaction_details': {'total_paid_amount': 29.0},
+    }
+
+
+def _notification(notification_id, payment_id=501):
+    return {'id': notification_id, 'action': 'payment.updated', 'data': {'id': payment_id}}
+
+
+def _user(db):
+    user = User(id=1, telegram_id=100)
+    db.add(user)
+    db.commit()
+    return user
+
+
+def test_refund_after_approval_revokes_access(db):
+    _user(db)
+    assert MercadoPagoService.apply_payments([_payment('approved')])[0][0] == 'success'
+    user = db.get(User, 1)
+    assert (user.subscription_tier, user.subscription_status) == ('pro', 'active')
+
+    # Approved used to be final, so the refund was never fetched
+    assert MercadoPagoService._pending_notifications([_notification('n2')]) == {0: '501'}
+    assert MercadoPagoService._record_batch(
+        [_notification('n2')], {0: '501'}, {0: _payment('refunded')}
+    )[0][0] == 'success'
+
+    db.expire_all()
+    user = db.get(User, 1)
+    assert (user.subscription_tier, user.subscription_status) == ('free', 'inactive')
+    assert db.query(Payment).filter_by(gateway_payment_id='501').one().status == 'refunded'
+    revenue = db.query(DailyRevenue).one()
+    assert (revenue.payments, revenue.amount) == (0, 0)
+    # Nothing can follow a refund; later notifications are not fetched
+    assert MercadoPagoService._pending_notifications([_notification('n3')]) == {}
+
+
+def test_same_status_applied_once(db):
+    _user(db)
+    notifications = [_notification('n1'), _notification('n2')]
+    results = MercadoPagoService._record_batch(
+        notifications, {0: '501', 1: '501'}, {0: _payment('approved'), 1: _payment('approved')}
+    )
+    assert [status for status, _ in results] == ['success', 'duplicate']
+    assert db.query(DailyRevenue).one().payments == 1
+
+
+def test_status_mapping():
+    assert MercadoPagoService.payment_status('approved') == 'completed'
+    assert MercadoPagoService.payment_status('charged_back') == 'refunded'
+    assert MercadoPagoService.payment_status('rejected') == 'failed'
+    assert MercadoPagoService.payment_status('in_process') == 'pending'
+
+
+def test_only_ledger_conflicts_count_as_duplicates(db):
+    from bot.models.processed_event import ProcessedEvent
+    _user(db)
+    # A concurrent worker recorded this notification after our pre-check
+    db.add(ProcessedEvent(gateway='mercadopago', event_id='n1'))
+    # Payment ids are unique across gateways
+    db.add(Payment(user_id=1, gateway='stripe', gateway_payment_id='502', amount=1))
+    db.commit()
+    results = MercadoPagoService._record_batch(
+        [_notification('n1', 501), _notification('n2', 502)],
+        {0: '501', 1: '502'},
+        {0: _payment('approved', 501), 1: _payment('approved', 502)},
+    )
+    assert [status for status, _ in results] == ['duplicate', 'error']
@@ -0,0 +1,43 @@
+from datetime import datetime
+
+from bot.models.subscription import Subscription
+from bot.models.user import User
+from bot.models.webhook_event import WebhookEvent
+from bot.services import outbox
+
+
+def _subscription(db):
+    db.add(User(id=1, telegram_id=1, subscription_tier='pro', subscription_status='active'))
+    db.add(Subscription(user_id=1, gateway='stripe', gateway_subscription_id='sub_1', tier='pro', amount=29))
+    db.commit()
+
+
+def _stripe(event_id, event_type, data):
+    return {'id': event_id, 'type': event_type, 'data': {'object': data}}
+
+
+def test_failed_events_are_retried_with_backoff(db):
+    _subscription(db)
+    outbox.enqueue('stripe', _stripe('evt_ok', 'customer.subscription.deleted', {'id': 'sub_1'}), 'evt_ok')
+    # Missing amount_paid: the handler raises and only this event rolls back
+    outbox.enqueue('stripe', _stripe('evt_bad', 'invoice.payment_succeeded', {'subscription': 'sub_1'}), 'evt_bad')
+    outbox.enqueue('paypal', {'id': 'x'}, 'x')
+
+    assert outbox.process_batch(10) == 3
+    events = {event.event_id: event for event in db.query(WebhookEvent)}
+    assert events['evt_ok'].status == 'done'
+    assert (events['evt_bad'].status, events['evt_bad'].attempts) == ('pending', 1)
+    assert events['evt_bad'].available_at > datetime.utcnow()
+    assert events['x'].status == 'pending'
+    assert db.get(User, 1).subscription_tier == 'free'
+
+    # Backed-off events are not claimed again until they are due
+    assert outbox.process_batch(10) == 0
+
+
+def test_gives_up_after_max_attempts(db, monkeypatch):
+    from bot.utils.config import config
+    monkeypatch.setattr(config, 'OUTBOX_MAX_ATTEMPTS', 1)
+    outbox.enqueue('paypal', {'id': 'x'}, 'x')
+    outbox.process_batch(10)
+    assert db.query(WebhookEvent).one().status == 'failed'
@@ -0,0 +1,85 @@
+import asyncio
+import time
+
+import pytest
+from telegram.error import RetryAfter
+
+from bot.rate_limiter import OutboundRateLimiter, TokenBucket
+
+
+def _limiter(**kwargs):
+    kwargs = dict(dict(global_rate=1000, chat_rate=10, chat_burst=1), **kwargs)
+    return OutboundRateLimiter(**kwargs)
+
+
+def _send(limiter, endpoint, data, callback, *args, rate_limit_args=None):
+    return limiter.process_request(callback, args, {}, endpoint, data, rate_limit_args)
+
+
+async def _echo(*args):
+    return args
+
+
+def test_bucket_reports_the_deficit_as_wait():
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert [bucket.reserve() > 0 for _ in range(3)] == [False, False, True]
+    assert bucket.reserve() == pytest.approx(0.2, abs=0.01)
+
+
+def test_calls_are_paced_per_chat():
+    limiter = _limiter()
+
+    async def run():
+        started = time.monotonic()
+        await asyncio.gather(*[_send(limiter, 'sendMessage', {'chat_id': 1}, _echo) for _ in range(3)])
+        same_chat = time.monotonic() - started
+        started = time.monotonic()
+        await asyncio.gather(*[_send(limiter, 'sendMessage', {'chat_id': chat}, _echo) for chat in (2, 3, 4)])
+        return same_chat, time.monotonic() - started
+
+    same_chat, other_chats = asyncio.run(run())
+    assert same_chat >= 0.18
+    assert other_chats < 0.05
+    assert limiter.sent == 6
+
+
+def test_queued_edits_collapse_into_the_newest():
+    limiter = _limiter()
+    data = {'chat_id': 1, 'message_id': 7}
+    sent = []
+
+    async def edit(text):
+        sent.append(text)
+        return text
+
+    async def run():
+        # The first message uses the chat's only token, so the edits wait
+        await _send(limiter, 'sendMessage', {'chat_id': 1}, _echo)
+        return await asyncio.gather(*[
+            _send(limiter, 'editMessageText', data, edit, text) for text in ('1/3', '2/3', '3/3')
+        ])
+
+    assert asyncio.run(run()) == ['3/3', '3/3', '3/3']
+    assert sent == ['3/3']
+    assert limiter.coalesced == 2
+
+
+def test_retry_after_pauses_and_retries():
+    limiter = _limiter()
+    attempts = []
+
+    async def flaky():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise RetryAfter(0)
+        return True
+
+    assert asyncio.run(_send(limiter, 'sendMessage', {'chat_id': 1}, flaky))
+    assert limiter.retries == 1
+    assert attempts[1] - attempts[0] >= 0.1
+
+    async def always():
+        raise RetryAfter(0)
+
+    with pytest.raises(RetryAfter):
+        asyncio.run(_send(limiter, 'sendMessage', {'chat_id': 2}, always, rate_limit_args=0))
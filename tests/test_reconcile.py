@@ -0,0 +1,102 @@
+import asyncio
+from datetime import datetime
+
+from bot.models.gateway_customer import GatewayCustomer
+from bot.models.payment import Payment
+from bot.models.reconcile_cursor import ReconcileCursor
+from bot.models.rollup import DailyRevenue
+from bot.models.subscription import Subscription
+from bot.models.user import User
+from bot.services.reconcile import load_position, reconcile
+
+
+def _users(db):
+    for user_id in (1, 2):
+        db.add(User(id=user_id, telegram_id=user_id * 10))
+        db.add(GatewayCustomer(user_id=user_id, gateway='stripe', customer_id=f'cus_{user_id}'))
+    db.commit()
+
+
+def _run(stream, **kwargs):
+    return asyncio.run(reconcile(stream, batch_size=7, **kwargs))
+
+
+def test_missing_charges_are_created_once(db, gateway):
+    _users(db)
+    # Charge 2 reached a webhook as pending; 20 failed and 1 was refunded
+    db.add(Payment(user_id=1, gateway='stripe', gateway_payment_id='pi_00000002', amount=29, status='pending'))
+    db.commit()
+
+    assert _run('stripe_charges', dry_run=True)['created'] == 17
+    assert db.query(Payment).count() == 1
+
+    totals = _run('stripe_charges')
+    assert (totals['seen'], totals['created'], totals['fixed']) == (20, 17, 1)
+    assert db.query(Payment).filter_by(status='completed').count() == 18
+    assert db.query(Payment.status).filter_by(gateway_payment_id='pi_00000001').scalar() is None
+    assert db.query(DailyRevenue.payments).scalar() == 18
+    assert load_position('stripe_charges') is None
+
+    again = _run('stripe_charges')
+    assert (again['created'], again['fixed']) == (0, 0)
+    assert db.query(DailyRevenue.payments).scalar() == 18
+
+
+def test_mp_payments_resume_from_the_cursor(db, gateway):
+    _users(db)
+    db.add(ReconcileCursor(stream='mp_payments', position=f'{gateway.epoch:%Y-%m-%dT%H:%M:%S}.000-00:00|10'))
+    db.commit()
+
+    totals = _run('mp_payments')
+    # Indexes 11..20; 20 is still pending at MercadoPago
+    assert (totals['seen'], totals['created']) == (10, 9)
+    assert db.query(Payment).filter_by(gateway='mercadopago', status='completed').count() == 9
+    assert load_position('mp_payments') is None
+    assert _run('mp_payments', restart=True)['created'] == 9
+    assert _run('mp_payments')['created'] == 0
+
+
+def test_drifted_subscriptions_replay_as_events(db, gateway):
+    _users(db)
+    remote = gateway.subscription(3)
+    db.add(Subscription(user_id=remote['metadata']['user_id'], gateway='stripe',
+                        gateway_subscription_id=remote['id'], tier='pro', status='active',
+                        current_period_end=datetime.fromtimestamp(remote['current_period_end'])))
+    db.commit()
+
+    totals = _run('stripe_subscriptions')
+    assert (totals['missing'], totals['fixed'], totals['errors']) == (19, 1, 0)
+    assert db.query(Subscription.status).scalar() == 'past_due'
+    assert _run('stripe_subscriptions')['fixed'] == 0
+
+
+def test_refunded_charge_leaves_revenue(db, gateway):
+    _users(db)
+    # Charge 1 was refunded after its payment webhook counted it
+    payment = Payment(user_id=1, gateway='stripe', gateway_payment_id='pi_00000001', amount=29,
+                      currency='USD', product_tier='pro', status='completed')
+    db.add(payment)
+    db.add(DailyRevenue(day=datetime.utcnow().date(), gateway='stripe', tier='pro', currency='USD',
+                        payments=1, amount=29))
+    db.commit()
+
+    totals = _run('stripe_charges')
+    assert totals['fixed'] == 1
+    assert db.query(Payment.status).filter_by(gateway_payment_id='pi_00000001').scalar() == 'refunded'
+    revenue = db.query(DailyRevenue).filter_by(tier='pro').one()
+    assert (revenue.payments, float(revenue.amount)) == (0, 0.0)
+
+
+def test_cancel_at_period_end_follows_the_gateway(db, gateway):
+    _users(db)
+    # Cancelled from the customer portal: still active until its period ends
+    remote = gateway.subscription(6)
+    assert remote['status'] == 'active' and remote['cancel_at_period_end']
+    db.add(Subscription(user_id=remote['metadata']['user_id'], gateway='stripe',
+                        gateway_subscription_id=remote['id'], tier='pro', status='active',
+                        current_period_end=datetime.fromtimestamp(remote['current_period_end'])))
+    db.commit()
+
+    assert _run('stripe_subscriptions')['fixed'] == 1
+    assert db.query(Subscription.cancel_at_period_end).scalar() is True
+    assert _run('stripe_subscriptions')['fixed'] == 0
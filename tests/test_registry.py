@@ -0,0 +1,33 @@
+import os
+import subprocess
+import sys
+
+from bot.utils.registry import ServiceRegistry
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_factories_run_once_on_first_use():
+    registry = ServiceRegistry()
+    built = []
+    registry.register('sdk', lambda: built.append(1) or object())
+    assert not registry.is_ready('sdk') and not built
+    assert registry.get('sdk') is registry.get('sdk')
+    assert built == [1] and 'sdk' in registry.init_ms
+    registry.reset('sdk')
+    registry.get('sdk')
+    assert built == [1, 1]
+
+
+def test_importing_services_loads_no_sdk_or_driver():
+    code = (
+        'import sys\n'
+        'import bot.main, bot.services.stripe_service, bot.services.mp_service, bot.models.base\n'
+        'from bot.utils.registry import registry\n'
+        "print(sorted(m for m in ('stripe', 'mercadopago', 'psycopg2', 'numpy') if m in sys.modules))\n"
+        "print(registry.is_ready('db_engine'))\n"
+    )
+    env = dict(os.environ, PYTHONPATH=ROOT, DATABASE_URL='postgresql://nowhere/db')
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout.split('\n')
+    assert output[:2] == ['[]', 'False']
@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from bot.analytics import revenue
+from bot.analytics.revenue import RollupDeltas
+from bot.models.payment import Payment
+from bot.models.rollup import DailyRevenue, DailySubscriptions
+from bot.models.subscription import Subscription
+from bot.models.user import User
+
+
+def _payment(amount, status='completed', tier='pro'):
+    return Payment(user_id=1, gateway='stripe', amount=Decimal(amount), currency='usd',
+                   product_tier=tier, status=status)
+
+
+def _subscription(status='active', amount='29.00', **values):
+    return Subscription(user_id=1, gateway='stripe', tier='pro', status=status,
+                        amount=Decimal(amount), currency='USD', **values)
+
+
+def test_flushes_accumulate_into_one_row(db):
+    for _ in range(2):
+        deltas = RollupDeltas()
+        deltas.payment(_payment('29.00'))
+        deltas.payment(_payment('29.00'))
+        deltas.subscription(_subscription(), 'new')
+        deltas.flush()
+        db.commit()
+    deltas = RollupDeltas()
+    deltas.payment(_payment('29.00'), refunded=True)
+    deltas.subscription(_subscription(), 'cancelled')
+    deltas.subscription(_subscription(), 'past_due')
+    deltas.flush()
+    db.commit()
+
+    row = db.query(DailyRevenue).one()
+    assert (row.currency, row.payments, row.amount) == ('USD', 3, Decimal('87.00'))
+    row = db.query(DailySubscriptions).one()
+    assert (row.new, row.cancelled, row.past_due) == (2, 1, 1)
+    assert row.mrr_added - row.mrr_lost == Decimal('29.00')
+
+    report = revenue.summary()
+    assert report['active'] == 1
+    assert report['mrr'] == {'USD': {'pro': Decimal('29.00')}}
+    assert (report['new'], report['cancelled'], report['past_due']) == (2, 1, 1)
+
+
+def test_snapshot_restore_drops_later_deltas():
+    deltas = RollupDeltas()
+    deltas.payment(_payment('9.00', tier='basic'))
+    saved = deltas.snapshot()
+    deltas.payment(_payment('9.00', tier='basic'))
+    deltas.subscription(_subscription(), 'new')
+    deltas.restore(saved)
+    assert list(deltas.revenue.values()) == [(1, Decimal('9.00'))]
+    assert deltas.subscriptions == {}
+
+
+def test_rebuild_recomputes_from_source_tables(db):
+    db.add(User(id=1, telegram_id=10))
+    db.add_all([_payment('29.00'), _payment('29.00'), _payment('29.00', status='failed')])
+    yesterday = datetime.utcnow() - timedelta(days=1)
+    db.add_all([
+        _subscription(created_at=yesterday),
+        _subscription(status='canceled', created_at=yesterday),
+        _subscription(status='past_due', amount='99.00'),
+    ])
+    db.add(DailyRevenue(day=yesterday.date(), gateway='stripe', tier='pro', currency='USD',
+                        payments=50, amount=Decimal('1450.00')))
+    db.commit()
+
+    assert revenue.rebuild() == (1, 2)
+    row = db.query(DailyRevenue).one()
+    assert (row.payments, row.amount) == (2, Decimal('58.00'))
+    report = revenue.summary()
+    assert (report['new'], report['cancelled'], report['past_due']) == (3, 1, 1)
+    assert report['mrr'] == {'USD': {'pro': Decimal('128.00')}}
@@ -0,0 +1,63 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from bot.router import CallbackRouter
+
+
+def _update(data):
+    return SimpleNamespace(callback_query=SimpleNamespace(data=data))
+
+
+@pytest.fixture
+def router():
+    router = CallbackRouter()
+    calls = []
+
+    @router.route('view_plans', 'back_main')
+    async def menu(update, context):
+        calls.append(('menu', update.callback_query.data))
+
+    @router.prefix('buy_')
+    async def buy(update, context, tier):
+        calls.append(('buy', tier))
+
+    @router.prefix('buy_pro_')
+    async def buy_pro(update, context, rest):
+        calls.append(('buy_pro', rest))
+
+    @router.route('boom')
+    async def boom(update, context):
+        raise RuntimeError('boom')
+
+    router.calls = calls
+    return router
+
+
+def test_exact_then_longest_prefix(router):
+    for data in ('view_plans', 'back_main', 'buy_basic', 'buy_pro_annual', 'buy_'):
+        assert asyncio.run(router.dispatch(_update(data), None))
+    assert router.calls == [
+        ('menu', 'view_plans'), ('menu', 'back_main'), ('buy', 'basic'),
+        ('buy_pro', 'annual'), ('buy', ''),
+    ]
+    assert router.resolve('nope') == (None, None, ())
+    assert not asyncio.run(router.dispatch(_update('nope'), None))
+
+
+def test_fallback_and_stats(router):
+    seen = []
+
+    @router.fallback
+    async def unknown(update, context):
+        seen.append(update.callback_query.data)
+
+    assert asyncio.run(router.dispatch(_update('nope'), None))
+    with pytest.raises(RuntimeError):
+        asyncio.run(router.dispatch(_update('boom'), None))
+    assert seen == ['nope']
+    snapshot = router.snapshot()
+    assert snapshot['<fallback>']['count'] == 1
+    assert snapshot['boom']['errors'] == 1
+    assert 'view_plans' not in snapshot
@@ -0,0 +1,40 @@
+import time
+
+from bench import updates
+from bot.handlers import DSCRSession, dscr_sessions
+from bot.utils.sessions import SessionStore
+
+
+def test_encoding_round_trips_the_record():
+    store = SessionStore('test', DSCRSession)
+    record = DSCRSession(3, 300000.0, 1800.5)
+    raw = store._encode(record)
+    assert raw == '3|300000.0|1800.5'
+    assert store._decode(raw) == record
+    assert store._decode(store._encode(DSCRSession(1))) == DSCRSession(1)
+
+
+def test_memory_sessions_expire_and_delete():
+    store = SessionStore('test', DSCRSession, ttl=0.05)
+    store.set(1, DSCRSession(1))
+    store.set(2, DSCRSession(2, 10.0))
+    assert store.get(1) == DSCRSession(1)
+    store.delete(1)
+    assert store.get(1) is None
+    time.sleep(0.06)
+    assert store.get(2) is None
+
+
+def test_dscr_conversation_walks_three_steps(db, bot_api):
+    from bot.main import app
+    client = app.test_client()
+    chat = 4242
+    client.post('/webhook', json=updates.command(chat, '/dscr'))
+    assert dscr_sessions.get(chat) == DSCRSession(1)
+    client.post('/webhook', json=updates.command(chat, '$300,000'))
+    client.post('/webhook', json=updates.command(chat, 'no es un numero'))
+    assert dscr_sessions.get(chat) == DSCRSession(2, 300000.0)
+    client.post('/webhook', json=updates.command(chat, '1800'))
+    assert dscr_sessions.get(chat) == DSCRSession(3, 300000.0, 1800.0)
+    client.post('/webhook', json=updates.command(chat, '2200'))
+    assert dscr_sessions.get(chat) is None
@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+
+from bot.models.subscription import Subscription
+from bot.models.user import User
+from bot.services import expiry
+from bot.services.stripe_service import StripeService
+
+
+def _invoice(event_id, period_start, period_end, line_end):
+    return {
+        'id': event_id,
+        'type': 'invoice.payment_succeeded',
+        'data': {'object': {
+            'id': f'in_{event_id}',
+            'subscription': 'sub_1',
+            'payment_intent': f'pi_{event_id}',
+            'amount_paid': 2900,
+            'currency': 'usd',
+            # Renewal invoices bill the period that just ended...
+            'period_start': int(period_start.timestamp()),
+            'period_end': int(period_end.timestamp()),
+            # ...and their subscription line pays for the next one
+            'lines': {'data': [{'type': 'subscription', 'period': {
+                'start': int(period_end.timestamp()), 'end': int(line_end.timestamp()),
+            }}]},
+        }},
+    }
+
+
+def test_renewal_extends_to_the_paid_period(db):
+    now = datetime.now().replace(microsecond=0)
+    user = User(id=1, telegram_id=1, subscription_tier='pro', subscription_status='active')
+    db.add(user)
+    db.add(Subscription(
+        user_id=1, gateway='stripe', gateway_subscription_id='sub_1', tier='pro', status='active',
+        current_period_end=now - timedelta(days=3), amount=29,
+    ))
+    db.commit()
+
+    renewal = _invoice('evt_2', now - timedelta(days=33), now - timedelta(days=3), now + timedelta(days=27))
+    older = _invoice('evt_1', now - timedelta(days=63), now - timedelta(days=33), now - timedelta(days=3))
+    assert [status for status, _ in StripeService.process_batch([renewal, older])] == ['success', 'success']
+
+    subscription = db.query(Subscription).one()
+    assert subscription.current_period_end == now + timedelta(days=27)
+    assert subscription.current_period_start == now - timedelta(days=3)
+    # The sweeper leaves the renewed subscription alone
+    assert expiry.expire_batch(now, 10) == 0
+
+
+def test_invoice_period_falls_back_to_top_level():
+    assert StripeService._invoice_period({'period_start': 1, 'period_end': 2}) == (1, 2)
+
+
+def test_subscription_updated_tracks_cancel_at_period_end(db):
+    db.add(User(id=1, telegram_id=1, subscription_tier='pro', subscription_status='active'))
+    db.add(Subscription(user_id=1, gateway='stripe', gateway_subscription_id='sub_1', tier='pro', status='active'))
+    db.commit()
+
+    def updated(event_id, **data):
+        return {'id': event_id, 'type': 'customer.subscription.updated',
+                'data': {'object': {'id': 'sub_1', 'status': 'active', **data}}}
+
+    StripeService.process_batch([updated('evt_1', cancel_at_period_end=True)])
+    assert db.query(Subscription.cancel_at_period_end).scalar() is True
+    # Events without the field leave it alone
+    StripeService.process_batch([updated('evt_2')])
+    assert db.query(Subscription.cancel_at_period_end).scalar() is True
+    # Resumed before the period ended
+    StripeService.process_batch([updated('evt_3', cancel_at_period_end=False)])
+    assert db.query(Subscription.cancel_at_period_end).scalar() is False
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from bot.utils.update_queue import UpdateQueue, chat_key
+
+
+def _update(update_id, chat_id):
+    return {'update_id': update_id, 'message': {'chat': {'id': chat_id}, 'text': 'x'}}
+
+
+def test_chat_key():
+    assert chat_key(_update(1, 42)) == 42
+    assert chat_key({'update_id': 1, 'callback_query': {'from': {'id': 7}, 'message': {'chat': {'id': 9}}}}) == 9
+    assert chat_key({'update_id': 1, 'inline_query': {'from': {'id': 7}}}) == 7
+    assert chat_key({'update_id': 1, 'poll': {}}) is None
+
+
+def test_updates_of_one_chat_run_in_order_and_never_overlap():
+    seen, running = {}, set()
+
+    async def process(item):
+        chat = chat_key(item)
+        assert chat not in running
+        running.add(chat)
+        await asyncio.sleep(0)
+        seen.setdefault(chat, []).append(item['update_id'])
+        running.discard(chat)
+
+    async def scenario():
+        queue = UpdateQueue(process, maxsize=500, workers=8, key=chat_key)
+        await queue.start()
+        for update_id in range(300):
+            assert await queue.put(_update(update_id, update_id % 5))
+        await queue.stop()
+        return queue
+
+    queue = asyncio.run(scenario())
+    assert queue.processed == 300
+    for chat, ids in seen.items():
+        assert ids == sorted(ids)
+
+
+def test_laned_updates_count_against_maxsize():
+    release = None
+
+    async def process(item):
+        await release.wait()
+
+    async def scenario():
+        nonlocal release
+        release = asyncio.Event()
+        queue = UpdateQueue(process, maxsize=4, workers=2, put_timeout=0.01, key=chat_key)
+        await queue.start()
+        # Chat 1 blocks one consumer and parks three updates in its lane,
+        # chat 2 blocks the other, leaving the rest in the queue itself
+        updates = [_update(i, 1) for i in range(4)] + [_update(i, 2) for i in range(4, 12)]
+        accepted = 0
+        for update in updates:
+            accepted += await queue.put(update)
+        buffered = queue._queue.qsize() + queue.laned
+        release.set()
+        await queue.stop()
+        return queue, accepted, buffered, updates
+
+    queue, accepted, buffered, updates = asyncio.run(scenario())
+    assert buffered <= queue.maxsize
+    assert accepted <= queue.maxsize + 2  # plus one running per consumer
+    assert queue.rejected == len(updates) - accepted
+    assert queue.processed == accepted
+
+
+def test_put_before_start_is_an_error():
+    async def process(update):
+        pass
+
+    with pytest.raises(RuntimeError, match='before start'):
+        asyncio.run(UpdateQueue(process).put({'update_id': 1}))